@@ -19,7 +19,7 @@ from django.utils.html import mark_safe
 from django.utils.text import capfirst
 from django.utils.translation import gettext as _
 
-from .manager import HistoricalQuerySet, HistoryManager
+from .manager import HistoricalQuerySet, HistoryManager, filter_latest_records
 from .models import HistoricalChanges
 from .template_utils import HistoricalRecordContextHelper
 from .utils import get_history_manager_for_model, get_history_model_for_model
@@ -67,8 +67,11 @@ class SimpleHistoryAdmin(admin.ModelAdmin):
         try:
             obj = self.get_queryset(request).get(**{pk_name: object_id})
         except model.DoesNotExist:
+            latest_records = historical_records
+            if getattr(history.model, "_history_latest_model", None) is not None:
+                latest_records = filter_latest_records(historical_records, pk=object_id)
             try:
-                obj = historical_records.latest("history_date").instance
+                obj = latest_records.latest("history_date").instance
             except historical_records.model.DoesNotExist:
                 raise http.Http404
 
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import lzma
+import zlib
+
+from django.db import connections, models, router
+
+# Compressed values start with a null byte - which text and JSON can't start with -
+# followed by the byte identifying the algorithm
+COMPRESSED_VALUE_MARKER = b"\x00"
+COMPRESSION_ALGORITHMS = {
+    "zlib": (b"z", zlib.compress, zlib.decompress),
+    "lzma": (b"x", lzma.compress, lzma.decompress),
+}
+
+
+def encode_value(value, value_type, encoder=None):
+    """Return the text representation of the text or JSON ``value``."""
+    if value_type == "json":
+        return json.dumps(value, cls=encoder)
+    return str(value)
+
+
+def decode_value(text, value_type, decoder=None):
+    """Return the value represented by ``text`` - see ``encode_value()``."""
+    if value_type == "json":
+        return json.loads(text, cls=decoder)
+    return text
+
+
+def get_value_type(field):
+    """
+    Return the type of the values of the (historical) ``field``, for
+    ``encode_value()``: either ``"text"`` or ``"json"``.
+    """
+    if isinstance(field, models.JSONField):
+        return "json"
+    if isinstance(field, (models.CharField, models.TextField)):
+        return "text"
+    raise TypeError(
+        f"Only text, JSON and file fields are supported, not {field.name!r}."
+    )
+
+
+class CompressedField(models.BinaryField):
+    """
+    Stores a text or JSON value compressed, in a binary column. Used for the
+    ``compressed_fields`` of historical models.
+
+    Values that were stored uncompressed (e.g. before the column was converted
+    from a text column) are read as-is, and values that are already ``bytes`` are
+    stored as-is.
+    """
+
+    def __init__(
+        self,
+        *args,
+        algorithm="zlib",
+        value_type="text",
+        encoder=None,
+        decoder=None,
+        **kwargs,
+    ):
+        if algorithm not in COMPRESSION_ALGORITHMS:
+            raise ValueError(
+                "The compression algorithm must be one of: "
+                + ", ".join(COMPRESSION_ALGORITHMS)
+            )
+        if value_type not in ("text", "json"):
+            raise ValueError("The value type must be 'text' or 'json'.")
+        self.algorithm = algorithm
+        self.value_type = value_type
+        self.encoder = encoder
+        self.decoder = decoder
+        kwargs.setdefault("editable", True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs["algorithm"] = self.algorithm
+        kwargs["value_type"] = self.value_type
+        if self.encoder is not None:
+            kwargs["encoder"] = self.encoder
+        if self.decoder is not None:
+            kwargs["decoder"] = self.decoder
+        return name, path, args, kwargs
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, memoryview)):
+            # Already encoded
+            return value
+        value = encode_value(value, self.value_type, self.encoder)
+        marker, compress, _decompress = COMPRESSION_ALGORITHMS[self.algorithm]
+        return COMPRESSED_VALUE_MARKER + marker + compress(value.encode())
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            # An uncompressed value, stored in a text column
+            return decode_value(value, self.value_type, self.decoder)
+        value = bytes(value)
+        if value[:1] == COMPRESSED_VALUE_MARKER:
+            for marker, _compress, decompress in COMPRESSION_ALGORITHMS.values():
+                if value[1:2] == marker:
+                    value = decompress(value[2:])
+                    break
+        return decode_value(value.decode(), self.value_type, self.decoder)
+
+    def to_python(self, value):
+        return value
+
+    def value_to_string(self, obj):
+        return encode_value(self.value_from_object(obj), self.value_type, self.encoder)
+
+
+def compress_field(field, algorithm):
+    """
+    Return a ``CompressedField`` storing the values of the (historical) ``field``.
+    """
+    compressed_field = CompressedField(
+        algorithm=algorithm,
+        value_type=get_value_type(field),
+        encoder=getattr(field, "encoder", None),
+        decoder=getattr(field, "decoder", None),
+        null=field.null,
+        blank=field.blank,
+        verbose_name=field.verbose_name,
+        db_column=field.db_column,
+    )
+    compressed_field.name = field.name
+    return compressed_field
+
+
+class DeduplicatedValue(property):
+    """
+    The value of one of the ``deduplicated_fields`` of a historical model.
+
+    The value is stored once per distinct value in the blob table of the historical
+    model, and the historical record only stores its SHA-256 digest, in the
+    ``<name>_digest`` field. The value is loaded from the blob table when it's
+    first accessed.
+    """
+
+    def __init__(self, name, value_type="text", encoder=None, decoder=None):
+        self.name = name
+        self.digest_attname = f"{name}_digest"
+        self.value_type = value_type
+        self.encoder = encoder
+        self.decoder = decoder
+        super().__init__(self.get_value, self.set_value)
+
+    def get_value(self, instance):
+        if self.name not in instance.__dict__:
+            # Records fetched by a queryset are loaded by load_deduplicated_values()
+            digest = getattr(instance, self.digest_attname)
+            value = None
+            if digest is not None:
+                blob_model = type(instance)._history_blob_model
+                text = (
+                    blob_model._default_manager.using(instance._state.db)
+                    .values_list("value", flat=True)
+                    .get(digest=digest)
+                )
+                value = decode_value(text, self.value_type, self.decoder)
+            instance.__dict__[self.name] = value
+        return instance.__dict__[self.name]
+
+    def set_value(self, instance, value):
+        instance.__dict__[self.name] = value
+        digest = None
+        if value is not None:
+            digest = hashlib.sha256(self.encode(value).encode()).hexdigest()
+        setattr(instance, self.digest_attname, digest)
+
+    def encode(self, value):
+        return encode_value(value, self.value_type, self.encoder)
+
+
+def deduplicate_field(field):
+    """
+    Return a ``DeduplicatedValue`` for the (historical) ``field``, and the field
+    storing the digests of its values.
+    """
+    digest_field = models.CharField(
+        max_length=64,
+        null=field.null,
+        blank=True,
+        editable=False,
+        db_index=False,
+    )
+    descriptor = DeduplicatedValue(
+        field.name,
+        value_type=get_value_type(field),
+        encoder=getattr(field, "encoder", None),
+        decoder=getattr(field, "decoder", None),
+    )
+    return descriptor, digest_field
+
+
+def load_deduplicated_values(history_instances, using=None):
+    """
+    Load the values of the ``deduplicated_fields`` of ``history_instances`` - which
+    must all be records of the same historical model - that weren't loaded yet,
+    with one query per batch of distinct values.
+    """
+    if not history_instances:
+        return
+    history_model = type(history_instances[0])
+    names = getattr(history_model, "_history_deduplicated_fields", ())
+    if not names:
+        return
+    using = using or router.db_for_read(history_model)
+    descriptors = [getattr(history_model, name) for name in names]
+    digests = list(
+        {
+            getattr(history_instance, descriptor.digest_attname)
+            for history_instance in history_instances
+            for descriptor in descriptors
+            if descriptor.name not in history_instance.__dict__
+        }
+        - {None}
+    )
+    blob_model = history_model._history_blob_model
+    batch_size = connections[using].ops.bulk_batch_size(["digest"], digests) or 1
+    texts = {}
+    for start in range(0, len(digests), batch_size):
+        end = start + batch_size
+        texts.update(
+            blob_model._default_manager.using(using)
+            .filter(digest__in=digests[start:end])
+            .values_list("digest", "value")
+        )
+    for history_instance in history_instances:
+        for descriptor in descriptors:
+            if descriptor.name in history_instance.__dict__:
+                continue
+            digest = getattr(history_instance, descriptor.digest_attname)
+            if digest is not None and digest not in texts:
+                # Leave it to be fetched - and to fail - when it's accessed
+                continue
+            value = None
+            if digest is not None:
+                value = decode_value(
+                    texts[digest], descriptor.value_type, descriptor.decoder
+                )
+            history_instance.__dict__[descriptor.name] = value
+
+
+def save_deduplicated_values(history_instances, using=None):
+    """
+    Save the values of the ``deduplicated_fields`` of ``history_instances`` - which
+    must all be records of the same historical model - to its blob table, skipping
+    the values that are already stored.
+    """
+    if not history_instances:
+        return
+    history_model = type(history_instances[0])
+    names = getattr(history_model, "_history_deduplicated_fields", ())
+    if not names:
+        return
+    blob_model = history_model._history_blob_model
+    blobs = {}
+    for history_instance in history_instances:
+        for name in names:
+            descriptor = getattr(history_model, name)
+            digest = getattr(history_instance, descriptor.digest_attname)
+            if digest is None or digest in blobs:
+                continue
+            # Values of records loaded from the database are already stored
+            if name in history_instance.__dict__:
+                value = descriptor.encode(history_instance.__dict__[name])
+                blobs[digest] = blob_model(digest=digest, value=value)
+    blob_model._default_manager.using(using).bulk_create(
+        blobs.values(), ignore_conflicts=True
+    )
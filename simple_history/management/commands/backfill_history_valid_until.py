@@ -0,0 +1,88 @@
+from django.db import router, transaction
+
+from . import populate_history
+
+
+class Command(populate_history.Command):
+    args = "<app.model app.model ...>"
+    help = (
+        "Sets the valid until date of the historical records of models using the "
+        "valid_until option of HistoricalRecords, from the date of the next record "
+        "of the same object."
+    )
+
+    NOT_VALID_UNTIL_MODEL = "{model} doesn't use the valid_until option, skipping\n"
+    DONE_BACKFILLING_FOR_MODEL = "Updated {count} historical records for {model}\n"
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="*", type=str)
+        parser.add_argument(
+            "--auto",
+            action="store_true",
+            dest="auto",
+            default=False,
+            help="Automatically search for models with the HistoricalRecords field "
+            "type",
+        )
+        parser.add_argument(
+            "--batchsize",
+            action="store",
+            dest="batchsize",
+            default=200,
+            type=int,
+            help="Set a custom batch size when updating historical records.",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+
+        to_process = set()
+        model_strings = options.get("models", []) or args
+
+        if model_strings:
+            for model_pair in self._handle_model_list(*model_strings):
+                to_process.add(model_pair)
+
+        elif options["auto"]:
+            to_process = self._auto_models()
+
+        else:
+            self.log(self.COMMAND_HINT)
+
+        self._process(to_process, batch_size=options["batchsize"])
+
+    def _process(self, to_process, batch_size):
+        for model, history_model in to_process:
+            write_plan = history_model._history_write_plan
+            if not write_plan.has_valid_until:
+                self.log(self.NOT_VALID_UNTIL_MODEL.format(model=model), 2)
+                continue
+            using = router.db_for_write(history_model)
+            count = 0
+            # Each batch of objects is updated in its own transaction, so the
+            # table isn't locked for the whole run
+            for pks in self._get_pk_batches(history_model, using, batch_size):
+                with transaction.atomic(using=using):
+                    count += write_plan.rebuild_valid_until(
+                        using, pks=pks, batch_size=batch_size
+                    )
+            self.log(self.DONE_BACKFILLING_FOR_MODEL.format(model=model, count=count))
+
+    def _get_pk_batches(self, history_model, using, batch_size):
+        """Yield the primary keys of the objects with historical records in
+        batches of ``batch_size``, in order."""
+        pk_attname = history_model.instance_type._meta.pk.attname
+        pks = (
+            history_model._default_manager.using(using)
+            .order_by(pk_attname)
+            .values_list(pk_attname, flat=True)
+            .distinct()
+        )
+        batch = list(pks[:batch_size])
+        while batch:
+            yield batch
+            batch = list(pks.filter(**{f"{pk_attname}__gt": batch[-1]})[:batch_size])
+
+    def log(self, message, verbosity_level=1):
+        if self.verbosity >= verbosity_level:
+            self.stdout.write(message)
@@ -1,7 +1,7 @@
-from django.db import transaction
+from django.db import router, transaction
 from django.utils import timezone
 
-from ... import utils
+from ... import models, utils
 from . import populate_history
 
 
@@ -95,6 +95,11 @@ class Command(populate_history.Command):
 
             for o in model_query.iterator():
                 self._process_instance(o, model, stop_date=stop_date, dry_run=dry_run)
+            if not dry_run:
+                # The values of the deduplicated fields of the deleted records
+                models.delete_orphaned_blobs(
+                    history_model, router.db_for_write(history_model)
+                )
 
     def _process_instance(self, instance, model, stop_date=None, dry_run=True):
         entries_deleted = 0
@@ -117,6 +122,17 @@ class Command(populate_history.Command):
                 f1 = f2
             if extra_one:
                 entries_deleted += self._check_and_delete(f1, extra_one, dry_run)
+            if entries_deleted and not dry_run:
+                # The records before the deleted ones are now valid until the
+                # records after them, the objects have fewer records, and the
+                # checkpoints may point to the deleted records
+                write_plan = history.model._history_write_plan
+                using = router.db_for_write(history.model)
+                write_plan.rebuild_valid_until(using, pks=[instance.pk])
+                write_plan.refresh_latest_records(using, pks=[instance.pk])
+                models.refresh_history_checkpoints(
+                    history.model, using, pks=[instance.pk]
+                )
 
         self.log(
             self.DONE_CLEANING_FOR_MODEL.format(model=model, count=entries_deleted)
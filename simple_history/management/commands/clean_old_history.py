@@ -1,4 +1,4 @@
-from django.db import transaction
+from django.db import router, transaction
 from django.utils import timezone
 
 from ... import models, utils
@@ -64,7 +64,19 @@ class Command(populate_history.Command):
             if not found:
                 continue
             if not dry_run:
-                history_model_manager.delete()
+                using = router.db_for_write(history_model)
+                with transaction.atomic(using=using):
+                    # The remaining records can't be based on the deleted ones
+                    models.make_history_keyframes(
+                        history_model, history_model_manager, using
+                    )
+                    history_model_manager.delete()
+                    models.delete_orphaned_blobs(history_model, using)
+                    history_model._history_write_plan.refresh_latest_records(using)
+                    # The checkpoints before the remaining history can't be used
+                    models.delete_history_checkpoints(
+                        history_model, using, before=start_date
+                    )
 
             self.log(self.DONE_CLEANING_FOR_MODEL.format(model=model, count=found))
 
@@ -0,0 +1,120 @@
+from django.db import router, transaction
+from django.db.models import BinaryField, Q
+from django.db.models.functions import Substr
+
+from ...fields import COMPRESSED_VALUE_MARKER, COMPRESSION_ALGORITHMS, CompressedField
+from . import populate_history
+
+
+class Command(populate_history.Command):
+    args = "<app.model app.model ...>"
+    help = (
+        "Rewrites the compressed fields of HistoricalRecords, compressing the values "
+        "that were stored uncompressed or with another compression algorithm."
+    )
+
+    NO_COMPRESSED_FIELDS = "{model} has no compressed historical fields"
+    DONE_COMPRESSING_FOR_MODEL = "Compressed {count} historical records for {model}\n"
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="*", type=str)
+        parser.add_argument(
+            "--auto",
+            action="store_true",
+            dest="auto",
+            default=False,
+            help="Automatically search for models with the HistoricalRecords field "
+            "type",
+        )
+        parser.add_argument(
+            "--batchsize",
+            action="store",
+            dest="batchsize",
+            default=500,
+            type=int,
+            help="Set the number of historical records rewritten per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+
+        to_process = set()
+        model_strings = options.get("models", []) or args
+
+        if model_strings:
+            for model_pair in self._handle_model_list(*model_strings):
+                to_process.add(model_pair)
+
+        elif options["auto"]:
+            to_process = self._auto_models()
+
+        else:
+            self.log(self.COMMAND_HINT)
+
+        self._process(to_process, batch_size=options["batchsize"])
+
+    def _process(self, to_process, batch_size):
+        for model, history_model in to_process:
+            fields = [
+                field
+                for field in history_model._meta.concrete_fields
+                if isinstance(field, CompressedField)
+            ]
+            if not fields:
+                self.log(self.NO_COMPRESSED_FIELDS.format(model=model), 2)
+                continue
+
+            field_names = [field.name for field in fields]
+            manager = history_model._default_manager
+            queryset = (
+                manager.alias(
+                    **{
+                        self._get_header_alias(field): Substr(
+                            field.name, 1, 2, output_field=BinaryField()
+                        )
+                        for field in fields
+                    }
+                )
+                .filter(self._get_outdated_values_filter(fields))
+                .only(*field_names)
+                .order_by("pk")
+            )
+            count = 0
+            last_pk = None
+            while True:
+                if last_pk is not None:
+                    batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+                else:
+                    batch = list(queryset[:batch_size])
+                if not batch:
+                    break
+                # The values are decompressed when loaded, so saving them again
+                # compresses them with the field's current algorithm
+                with transaction.atomic(using=router.db_for_write(history_model)):
+                    manager.bulk_update(batch, field_names)
+                count += len(batch)
+                last_pk = batch[-1].pk
+
+            self.log(self.DONE_COMPRESSING_FOR_MODEL.format(model=model, count=count))
+
+    @staticmethod
+    def _get_header_alias(field):
+        return f"_{field.name}_header"
+
+    def _get_outdated_values_filter(self, fields):
+        """
+        Match the records with a value that isn't stored with the algorithm of its
+        field, going by the marker and algorithm byte the value starts with.
+        """
+        outdated = Q()
+        for field in fields:
+            alias = self._get_header_alias(field)
+            marker, _compress, _decompress = COMPRESSION_ALGORITHMS[field.algorithm]
+            outdated |= Q(**{f"{field.name}__isnull": False}) & ~Q(
+                **{alias: COMPRESSED_VALUE_MARKER + marker}
+            )
+        return outdated
+
+    def log(self, message, verbosity_level=1):
+        if self.verbosity >= verbosity_level:
+            self.stdout.write(message)
@@ -0,0 +1,101 @@
+from django.conf import settings
+from django.core.management import CommandError
+from django.db import router
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ... import models
+from . import populate_history
+
+
+class Command(populate_history.Command):
+    args = "<app.model app.model ...>"
+    help = (
+        "Stores which historical record of each object was valid at the given dates, "
+        "for models using the checkpoints option of HistoricalRecords, so that "
+        "as_of() only has to search the historical records after them."
+    )
+
+    INVALID_DATE = "Invalid date, expected an ISO 8601 date and time"
+    NO_CHECKPOINTS = "{model} doesn't use the checkpoints option, skipping\n"
+    DONE_CREATING_FOR_MODEL = (
+        "Stored the checkpoint of {count} objects as of {date} for {model}\n"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("models", nargs="*", type=str)
+        parser.add_argument(
+            "--auto",
+            action="store_true",
+            dest="auto",
+            default=False,
+            help="Automatically search for models with the HistoricalRecords field "
+            "type",
+        )
+        parser.add_argument(
+            "--date",
+            action="append",
+            dest="dates",
+            help="The date and time of a checkpoint, in ISO 8601 format (can be "
+            "repeated). Defaults to now.",
+        )
+        parser.add_argument(
+            "--batchsize",
+            action="store",
+            dest="batchsize",
+            default=200,
+            type=int,
+            help="Set a custom batch size when storing checkpoints.",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+
+        dates = [self._parse_date(date) for date in options["dates"] or []]
+        to_process = set()
+        model_strings = options.get("models", []) or args
+
+        if model_strings:
+            for model_pair in self._handle_model_list(*model_strings):
+                to_process.add(model_pair)
+
+        elif options["auto"]:
+            to_process = self._auto_models()
+
+        else:
+            self.log(self.COMMAND_HINT)
+
+        self._process(
+            to_process, dates=dates or [timezone.now()], batch_size=options["batchsize"]
+        )
+
+    def _parse_date(self, value):
+        try:
+            date = parse_datetime(value)
+        except ValueError:
+            date = None
+        if date is None:
+            raise CommandError(f"{self.INVALID_DATE} < {value} >")
+        if settings.USE_TZ and timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        return date
+
+    def _process(self, to_process, dates, batch_size):
+        for model, history_model in to_process:
+            if getattr(history_model, "_history_checkpoint_model", None) is None:
+                self.log(self.NO_CHECKPOINTS.format(model=model), 2)
+                continue
+            using = router.db_for_write(history_model)
+            for date in dates:
+                count = models.create_history_checkpoint(
+                    history_model, date, using, batch_size=batch_size
+                )
+                self.log(
+                    self.DONE_CREATING_FOR_MODEL.format(
+                        count=count, date=date.isoformat(), model=model
+                    )
+                )
+
+    def log(self, message, verbosity_level=1):
+        if self.verbosity >= verbosity_level:
+            self.stdout.write(message)
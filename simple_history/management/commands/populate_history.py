@@ -1,5 +1,15 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+
 from django.apps import apps
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 
 from ... import models, utils
 from ...exceptions import NotHistoricalModelError
@@ -22,6 +32,15 @@ class Command(BaseCommand):
     DONE_SAVING_FOR_MODEL = "Finished saving historical records for {model}\n"
     EXISTING_HISTORY_FOUND = "Existing history found, skipping model"
     INVALID_MODEL_ARG = "An invalid model was specified"
+    START_PK_WITH_SEVERAL_MODELS = "--start-pk can only be used with a single model"
+    DONE_SAVING_RANGE_FOR_MODEL = (
+        "Saved {count} historical records for {model} up to primary key {pk}\n"
+    )
+    SERVER_SIDE_NOT_SUPPORTED = (
+        "Historical records of {model} can't be copied by the database, saving them "
+        "instead\n"
+    )
+    DEFAULT_RANGE_SIZE = 10000
 
     def add_arguments(self, parser):
         super().add_arguments(parser)
@@ -42,6 +61,52 @@ class Command(BaseCommand):
             type=int,
             help="Set a custom batch size when bulk inserting historical records.",
         )
+        parser.add_argument(
+            "--server-side",
+            action="store_true",
+            default=False,
+            help="Copy the instances to the historical model in the database, with "
+            "an INSERT ... SELECT query per primary key range, instead of loading "
+            "them.",
+        )
+        parser.add_argument(
+            "--range-size",
+            type=int,
+            help="Process the instances in ranges of this many primary keys, each in "
+            f"its own transaction (default: {self.DEFAULT_RANGE_SIZE} with the other "
+            "range options).",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Sleep this many seconds between primary key ranges.",
+        )
+        parser.add_argument(
+            "--start-pk",
+            help="Only process the instances with a primary key greater than this one "
+            "- e.g. to resume an interrupted run. Existing history is not skipped.",
+        )
+        parser.add_argument(
+            "--missing-only",
+            action="store_true",
+            default=False,
+            help="Only save historical records of the instances that have none, "
+            "instead of skipping the models that have history.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Process the primary key ranges of the models in this many threads, "
+            "each with its own database connections.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            help="Keep track of the processed primary key ranges in this JSON file, "
+            "and skip the ranges it lists as processed - e.g. to resume an "
+            "interrupted run.",
+        )
 
     def handle(self, *args, **options):
         self.verbosity = options["verbosity"]
@@ -60,6 +125,28 @@ class Command(BaseCommand):
             if self.verbosity >= 1:
                 self.stdout.write(self.COMMAND_HINT)
 
+        self.server_side = options.get("server_side", False)
+        self.sleep = options.get("sleep") or 0
+        self.start_pk = options.get("start_pk")
+        self.range_size = options.get("range_size")
+        self.missing_only = options.get("missing_only", False)
+        self.workers = options.get("workers") or 1
+        self.checkpoint_path = options.get("checkpoint")
+        self.checkpoint = self._read_checkpoint()
+        self.lock = threading.Lock()
+        self.sqlite_write_lock = threading.Lock()
+        if self.range_size is None and (
+            self.server_side
+            or self.sleep
+            or self.start_pk is not None
+            or self.missing_only
+            or self.workers > 1
+            or self.checkpoint_path
+        ):
+            self.range_size = self.DEFAULT_RANGE_SIZE
+        if self.start_pk is not None and len(to_process) > 1:
+            raise CommandError(self.START_PK_WITH_SEVERAL_MODELS)
+
         self._process(to_process, batch_size=options["batchsize"])
 
     def _auto_models(self):
@@ -153,17 +240,235 @@ class Command(BaseCommand):
         if instances:
             history.bulk_history_create(instances, batch_size=batch_size)
 
-    def _process(self, to_process, batch_size):
-        for model, history_model in to_process:
-            if history_model.objects.exists():
-                self.stderr.write(
-                    "{msg} {model}\n".format(
-                        msg=self.EXISTING_HISTORY_FOUND, model=model
+    def _bulk_history_create_in_ranges(self, model, batch_size):
+        """Save a copy of all instances to the historical model, in primary key
+        ranges of ``self.range_size`` instances, each in its own transaction.
+
+        With ``self.server_side``, the instances are copied by the database with
+        an ``INSERT ... SELECT`` query per range instead of being loaded. With
+        ``self.missing_only``, only the instances without historical records are
+        saved.
+
+        :param model: Model you want to bulk create
+        :param batch_size: number of models to create at once.
+        :return:
+        """
+        server_side = self._can_use_server_side(model)
+        for index, start_pk, end_pk in self._get_pending_pk_ranges(model):
+            self._populate_pk_range(
+                model, index, start_pk, end_pk, server_side, batch_size
+            )
+
+    def _get_queryset(self, model):
+        """Return a queryset of the instances of ``model`` to populate."""
+        queryset = model._default_manager.all()
+        if self.missing_only:
+            history_model = utils.get_history_model_for_model(model)
+            queryset = queryset.filter(
+                ~Exists(
+                    history_model._default_manager.filter(
+                        **{model._meta.pk.attname: OuterRef("pk")}
+                    )
+                )
+            )
+        return queryset.order_by("pk")
+
+    def _can_use_server_side(self, model):
+        """Return whether the instances of ``model`` can be copied by the database
+        - writing a message if ``self.server_side`` is set and they can't.
+        """
+        if not self.server_side:
+            return False
+        history_model = utils.get_history_model_for_model(model)
+        if (
+            history_model._history_write_plan.can_insert_from_select
+            and not history_model._history_user_depends_on_instance
+            and model._default_manager.db == router.db_for_write(history_model)
+        ):
+            return True
+        self.stderr.write(self.SERVER_SIDE_NOT_SUPPORTED.format(model=model))
+        return False
+
+    def _get_pending_pk_ranges(self, model):
+        """Return the ``(index, start_pk, end_pk)`` primary key ranges of ``model``
+        that are still to be populated, where ``start_pk`` is exclusive (or ``None``)
+        and ``end_pk`` is inclusive.
+
+        The ranges are read from the checkpoint file, if it has the model's.
+        Otherwise, they're found with keyset pagination - so each range only
+        requires an index scan to find where it ends - and saved to it.
+        """
+        label = model._meta.label
+        pk = model._meta.pk
+        if label in self.checkpoint:
+            model_checkpoint = self.checkpoint[label]
+            done = set(model_checkpoint["done"])
+            return [
+                (
+                    index,
+                    None if start_pk is None else pk.to_python(start_pk),
+                    pk.to_python(end_pk),
+                )
+                for index, (start_pk, end_pk) in enumerate(model_checkpoint["ranges"])
+                if index not in done
+            ]
+
+        start_pk = self.start_pk
+        if start_pk is not None:
+            start_pk = pk.to_python(start_pk)
+        pk_values = self._get_queryset(model).values_list("pk", flat=True)
+        pk_ranges = []
+        while True:
+            if start_pk is not None:
+                range_pk_values = pk_values.filter(pk__gt=start_pk)
+            else:
+                range_pk_values = pk_values
+            try:
+                end_pk = range_pk_values[self.range_size - 1]
+            except IndexError:
+                end_pk = range_pk_values.last()
+                if end_pk is not None:
+                    pk_ranges.append((start_pk, end_pk))
+                break
+            pk_ranges.append((start_pk, end_pk))
+            start_pk = end_pk
+
+        if self.checkpoint_path:
+            self.checkpoint[label] = {"ranges": pk_ranges, "done": []}
+            self._write_checkpoint()
+        return [(index, *pk_range) for index, pk_range in enumerate(pk_ranges)]
+
+    def _populate_pk_range(
+        self, model, index, start_pk, end_pk, server_side, batch_size
+    ):
+        """Save a copy of the instances of ``model`` in the primary key range
+        ``index``, in one transaction, and mark the range as processed.
+        """
+        history = utils.get_history_manager_for_model(model)
+        history_model = history.model
+        queryset = self._get_queryset(model).filter(pk__lte=end_pk)
+        if start_pk is not None:
+            queryset = queryset.filter(pk__gt=start_pk)
+        using = router.db_for_write(history_model)
+        with self._get_write_lock(using), transaction.atomic(using=using):
+            if server_side:
+                template = history_model(
+                    history_date=timezone.now(),
+                    history_type="+",
+                    history_user=history_model.get_default_history_user(None),
+                    history_change_reason="",
+                )
+                count = history_model._history_write_plan.insert_from_select(
+                    queryset, template, using
+                )
+            else:
+                instances = list(queryset)
+                history.bulk_history_create(instances, batch_size=batch_size)
+                count = len(instances)
+
+        with self.lock:
+            if self.checkpoint_path:
+                self.checkpoint[model._meta.label]["done"].append(index)
+                self._write_checkpoint()
+            if self.verbosity >= 1:
+                self.stdout.write(
+                    self.DONE_SAVING_RANGE_FOR_MODEL.format(
+                        count=count, model=model, pk=end_pk
                     )
                 )
+        if self.sleep:
+            time.sleep(self.sleep)
+
+    def _get_write_lock(self, using):
+        if connections[using].vendor == "sqlite":
+            # SQLite doesn't support concurrent writes
+            return self.sqlite_write_lock
+        return nullcontext()
+
+    def _populate_pk_range_in_thread(self, *args):
+        try:
+            self._populate_pk_range(*args)
+        finally:
+            # Each thread has its own database connections
+            connections.close_all()
+
+    def _read_checkpoint(self):
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return {}
+        with open(self.checkpoint_path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    def _write_checkpoint(self):
+        # Replace the file, so that it's never left partially written
+        temporary_path = f"{self.checkpoint_path}.tmp"
+        with open(temporary_path, "w") as checkpoint_file:
+            json.dump(self.checkpoint, checkpoint_file, default=str)
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def _skip_model(self, model, history_model):
+        """Return whether to skip ``model``, because it already has history - unless
+        only its missing history is populated, or its population is resumed.
+        """
+        if (
+            self.start_pk is not None
+            or self.missing_only
+            or model._meta.label in self.checkpoint
+            or not history_model.objects.exists()
+        ):
+            return False
+        self.stderr.write(
+            "{msg} {model}\n".format(msg=self.EXISTING_HISTORY_FOUND, model=model)
+        )
+        return True
+
+    def _process(self, to_process, batch_size):
+        if self.workers > 1:
+            self._process_in_parallel(to_process, batch_size)
+            return
+        for model, history_model in to_process:
+            if self._skip_model(model, history_model):
                 continue
             if self.verbosity >= 1:
                 self.stdout.write(self.START_SAVING_FOR_MODEL.format(model=model))
-            self._bulk_history_create(model, batch_size)
+            if self.range_size:
+                self._bulk_history_create_in_ranges(model, batch_size)
+            else:
+                self._bulk_history_create(model, batch_size)
             if self.verbosity >= 1:
                 self.stdout.write(self.DONE_SAVING_FOR_MODEL.format(model=model))
+
+    def _process_in_parallel(self, to_process, batch_size):
+        """Save a copy of all instances of the models to their historical models,
+        processing the primary key ranges of all the models in ``self.workers``
+        threads.
+        """
+        models_to_populate = []
+        futures = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for model, history_model in to_process:
+                if self._skip_model(model, history_model):
+                    continue
+                if self.verbosity >= 1:
+                    self.stdout.write(self.START_SAVING_FOR_MODEL.format(model=model))
+                models_to_populate.append(model)
+                server_side = self._can_use_server_side(model)
+                futures.extend(
+                    executor.submit(
+                        self._populate_pk_range_in_thread,
+                        model,
+                        *pk_range,
+                        server_side,
+                        batch_size,
+                    )
+                    for pk_range in self._get_pending_pk_ranges(model)
+                )
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        if self.verbosity >= 1:
+            for model in models_to_populate:
+                self.stdout.write(self.DONE_SAVING_FOR_MODEL.format(model=model))
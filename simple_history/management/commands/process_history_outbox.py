@@ -0,0 +1,91 @@
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from ...writers import get_outbox_models, process_outbox
+
+
+class Command(BaseCommand):
+    args = "<app.model app.model ...>"
+    help = (
+        "Moves the historical records written by OutboxHistoryWriter from the outbox "
+        "tables to the historical tables"
+    )
+
+    NO_OUTBOX_FOUND = "No history outbox found for {model}"
+    DONE_PROCESSING_FOR_MODEL = "Moved {count} historical records for {model}\n"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "models",
+            nargs="*",
+            type=str,
+            help="Only process the outboxes of these models; defaults to all",
+        )
+        parser.add_argument(
+            "--batchsize",
+            action="store",
+            dest="batchsize",
+            default=100,
+            type=int,
+            help="Set the number of records moved per transaction.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            default=False,
+            help="Keep processing the outboxes until interrupted",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=1.0,
+            help="With --loop, seconds to wait after finding the outboxes empty",
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options["verbosity"]
+        outbox_models = get_outbox_models()
+        if options["models"]:
+            outbox_models = self._filter_outbox_models(outbox_models, options["models"])
+
+        while True:
+            count = 0
+            for outbox_model in outbox_models:
+                model_count = process_outbox(
+                    outbox_model, batch_size=options["batchsize"]
+                )
+                count += model_count
+                self.log(
+                    self.DONE_PROCESSING_FOR_MODEL.format(
+                        model=outbox_model.history_model.instance_type.__name__,
+                        count=model_count,
+                    ),
+                    1 if model_count else 2,
+                )
+            if not options["loop"]:
+                return
+            if not count:
+                time.sleep(options["sleep"])
+
+    def _filter_outbox_models(self, outbox_models, model_strings):
+        filtered = []
+        for model_string in model_strings:
+            try:
+                model = apps.get_model(model_string)
+            except (LookupError, ValueError):
+                raise CommandError(f"Unable to find model {model_string}")
+            matches = [
+                outbox_model
+                for outbox_model in outbox_models
+                if outbox_model.history_model.instance_type is model
+            ]
+            if not matches:
+                raise CommandError(self.NO_OUTBOX_FOUND.format(model=model_string))
+            filtered.extend(matches)
+        return filtered
+
+    def log(self, message, verbosity_level=1):
+        if self.verbosity >= verbosity_level:
+            self.stdout.write(message)
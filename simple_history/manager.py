@@ -1,17 +1,58 @@
+from collections import defaultdict
+from collections.abc import Iterator, Sequence
+from itertools import islice
+from typing import TYPE_CHECKING
+
 from django.conf import settings
-from django.db import models
-from django.db.models import Exists, OuterRef, Q, QuerySet
+from django.core.exceptions import ImproperlyConfigured
+from django.db import NotSupportedError, connections, models, router
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    Max,
+    OuterRef,
+    Q,
+    QuerySet,
+    RowRange,
+    Subquery,
+    When,
+    Window,
+)
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Coalesce, FirstValue, Lag, Lead, RowNumber
+from django.db.models.query import ModelIterable
+from django.db.models.sql.where import WhereNode
 from django.utils import timezone
 
+from simple_history.fields import (
+    decode_value,
+    load_deduplicated_values,
+    save_deduplicated_values,
+)
 from simple_history.utils import (
     get_app_model_primary_key_name,
     get_change_reason_from_object,
+    get_m2m_reverse_field_name,
 )
 
+if TYPE_CHECKING:
+    from simple_history.models import ModelDelta
+
 # when converting a historical record to an instance, this attribute is added
 # to the instance so that code can reverse the instance to its historical record
 SIMPLE_HISTORY_REVERSE_ATTR_NAME = "_history"
 
+# The number of objects bulk_history_create() creates historical records of at once,
+# when given an iterable that's not a sequence and no batch size
+BULK_HISTORY_CREATE_CHUNK_SIZE = 1000
+
+# The ways latest_of_each() can find the latest historical record of each object
+LATEST_OF_EACH_STRATEGIES = ("exists", "distinct_on", "window", "max")
+
+# The number of historical records iter_deltas() fetches and diffs at once
+ITER_DELTAS_CHUNK_SIZE = 2000
+
 
 class HistoricalQuerySet(QuerySet):
     """
@@ -28,6 +69,7 @@ class HistoricalQuerySet(QuerySet):
         self._as_instances = False
         self._as_of = None
         self._pk_attr = self.model.instance_type._meta.pk.attname
+        self._with_neighbors = False
 
     def as_instances(self) -> "HistoricalQuerySet":
         """
@@ -51,13 +93,89 @@ class HistoricalQuerySet(QuerySet):
         """
         if self._as_instances and "pk" in kwargs:
             kwargs[self._pk_attr] = kwargs.pop("pk")
-        return super().filter(*args, **kwargs)
+        self._check_delta_lookups(args, kwargs)
+        return self._filter_after_neighbors(super().filter(*args, **kwargs))
+
+    def exclude(self, *args, **kwargs) -> "HistoricalQuerySet":
+        self._check_delta_lookups(args, kwargs)
+        return self._filter_after_neighbors(super().exclude(*args, **kwargs))
+
+    def values(self, *fields, **expressions) -> "HistoricalQuerySet":
+        self._check_delta_fields(fields)
+        return super().values(*fields, **expressions)
+
+    def values_list(self, *fields, **kwargs) -> "HistoricalQuerySet":
+        self._check_delta_fields(fields)
+        return super().values_list(*fields, **kwargs)
+
+    def _check_delta_lookups(self, args, kwargs) -> None:
+        """
+        Raise ``NotSupportedError`` if the ``filter()`` or ``exclude()`` arguments
+        ``args`` and ``kwargs`` look up a history-tracked field that delta records
+        don't store, if the model uses ``storage="delta"``.
+        """
+        if getattr(self.model, "_history_storage", None) != "delta":
+            return
+        lookups = list(kwargs)
+        q_objects = [arg for arg in args if isinstance(arg, Q)]
+        while q_objects:
+            for child in q_objects.pop().children:
+                if isinstance(child, Q):
+                    q_objects.append(child)
+                elif isinstance(child, tuple):
+                    lookups.append(child[0])
+        self._check_delta_fields(lookups, "Filtering on")
 
-    def latest_of_each(self) -> "HistoricalQuerySet":
+    def _check_delta_fields(self, fields, action="Fetching the values of") -> None:
+        """
+        Raise ``NotSupportedError`` if any of the field names or lookups ``fields``
+        refers to a history-tracked field that delta records don't store, if the
+        model uses ``storage="delta"``.
+        """
+        if getattr(self.model, "_history_storage", None) != "delta":
+            return
+        delta_names = get_delta_field_names(self.model)
+        for field in fields:
+            if isinstance(field, str) and field.split(LOOKUP_SEP)[0] in delta_names:
+                raise NotSupportedError(
+                    f"{action} the history-tracked field {field!r} is not supported "
+                    f"with storage='delta', as delta records only store the fields "
+                    f"that changed."
+                )
+
+    def latest_of_each(self, strategy=None) -> "HistoricalQuerySet":
         """
         Ensures results in the queryset are the latest historical record for each
         primary key. This includes deletion records.
+
+        ``strategy`` chooses how the latest records are found - see
+        ``LATEST_OF_EACH_STRATEGIES``. It defaults to the
+        ``SIMPLE_HISTORY_LATEST_OF_EACH_STRATEGY`` setting, or ``"exists"``.
+
+        ``strategy="latest_table"`` instead looks up the latest record of each object
+        in the table of the ``latest_table`` option; the queryset's filters are then
+        applied to these records, instead of finding the latest of the filtered
+        records.
         """
+        if strategy == "latest_table":
+            if getattr(self.model, "_history_latest_model", None) is None:
+                raise ImproperlyConfigured(
+                    "latest_of_each(strategy='latest_table') requires the "
+                    "`latest_table` option of HistoricalRecords."
+                )
+            return filter_latest_records(self)
+        if strategy is None:
+            strategy = getattr(
+                settings, "SIMPLE_HISTORY_LATEST_OF_EACH_STRATEGY", "exists"
+            )
+        if strategy not in LATEST_OF_EACH_STRATEGIES:
+            raise ValueError(
+                f"Unknown latest_of_each() strategy {strategy!r}; expected one of"
+                f" {', '.join(LATEST_OF_EACH_STRATEGIES)}, or 'latest_table'."
+            )
+        if strategy != "exists":
+            return getattr(self, f"_latest_of_each_by_{strategy}")()
+
         # Subquery for finding the records that belong to the same history-tracked
         # object as the record from the outer query (identified by `_pk_attr`),
         # and that have a later `history_date` than the outer record.
@@ -72,29 +190,269 @@ class HistoricalQuerySet(QuerySet):
         # subquery does not return any results.
         return self.filter(~Exists(later_records))
 
+    def alive_during(self, start, end) -> "HistoricalQuerySet":
+        """
+        Return the records of the objects that existed at some point between
+        ``start`` (inclusive) and ``end`` (exclusive) - i.e. the created and changed
+        records that were valid during that interval. Requires the ``valid_until``
+        option of ``HistoricalRecords``.
+        """
+        if not getattr(self.model, "_history_valid_until", False):
+            raise ImproperlyConfigured(
+                "alive_during() requires the `valid_until` option of "
+                "HistoricalRecords."
+            )
+        return self.filter(
+            Q(history_valid_until__gt=start) | Q(history_valid_until__isnull=True),
+            history_date__lt=end,
+        ).exclude(history_type="-")
+
+    def _latest_of_each_by_distinct_on(self) -> "HistoricalQuerySet":
+        """
+        Find the latest records with ``DISTINCT ON``, which is only supported by
+        PostgreSQL. Ties on ``history_date`` are broken by the records' primary keys.
+        """
+        pk_name = self.model._meta.pk.attname
+        latest_records = (
+            self.order_by(self._pk_attr, "-history_date", f"-{pk_name}")
+            .distinct(self._pk_attr)
+            .values(pk_name)
+        )
+        return self.filter(**{f"{pk_name}__in": latest_records})
+
+    def _latest_of_each_by_window(self) -> "HistoricalQuerySet":
+        """
+        Find the latest records by numbering the records of each object with the
+        ``ROW_NUMBER()`` window function. Ties on ``history_date`` are broken by the
+        records' primary keys.
+        """
+        pk_name = self.model._meta.pk.attname
+        latest_records = (
+            self.order_by()
+            .annotate(
+                _history_row_number=Window(
+                    RowNumber(),
+                    partition_by=F(self._pk_attr),
+                    order_by=[F("history_date").desc(), F(pk_name).desc()],
+                )
+            )
+            .filter(_history_row_number=1)
+            .values(pk_name)
+        )
+        return self.filter(**{f"{pk_name}__in": latest_records})
+
+    def _latest_of_each_by_max(self) -> "HistoricalQuerySet":
+        """
+        Find the latest records by comparing their ``history_date`` with the greatest
+        one of their object. Like the ``"exists"`` strategy, records with the same
+        ``history_date`` are all included.
+        """
+        latest_date = (
+            self.filter(**{self._pk_attr: OuterRef(self._pk_attr)})
+            .order_by()
+            .values(self._pk_attr)
+            .annotate(latest_date=Max("history_date"))
+            .values("latest_date")
+        )
+        return self.filter(history_date=Subquery(latest_date))
+
+    def with_neighbors(self) -> "HistoricalQuerySet":
+        """
+        Annotate each record with the primary key and ``history_date`` of the
+        previous and next record of the same object (``prev_history_id``,
+        ``prev_history_date``, ``next_history_id`` and ``next_history_date``), using
+        ``LAG()`` and ``LEAD()`` window functions. The neighbors are looked up among
+        all the records of the object - regardless of the queryset's filters, which
+        are applied after the window functions - ordered by ``history_date`` and
+        then by primary key.
+
+        The ``prev_record`` and ``next_record`` of the fetched records are then
+        taken from the queryset's results; the neighbors that aren't part of the
+        results - e.g. because the queryset is filtered or sliced - are fetched
+        together in one query the first time one of them is needed.
+        """
+        pk_name = self.model._meta.pk.attname
+        queryset = self._chain()
+        filters = queryset._pop_filters(0)
+        if filters is not None:
+            # The window functions are computed over all the records of the
+            # filtered records' objects
+            queryset.query.add_q(
+                Q(**{f"{self._pk_attr}__in": self.values(self._pk_attr)})
+            )
+        annotations = {}
+        for prefix, function in (("prev", Lag), ("next", Lead)):
+            for field_name in (pk_name, "history_date"):
+                annotations[f"{prefix}_{field_name}"] = queryset._neighbors_window(
+                    function(field_name)
+                )
+        queryset = queryset.annotate(**annotations)
+        queryset._with_neighbors = True
+        if filters is not None:
+            queryset._add_filters_after_neighbors(filters)
+        return queryset
+
+    def _neighbors_window(self, expression, **kwargs) -> Window:
+        """
+        Return a window of ``expression`` over the records of each object, ordered
+        like their neighbors.
+        """
+        return Window(
+            expression,
+            partition_by=[F(self._pk_attr)],
+            order_by=[F("history_date").asc(), F(self.model._meta.pk.attname).asc()],
+            **kwargs,
+        )
+
+    def _pop_filters(self, start) -> "WhereNode | None":
+        """
+        Remove the filters of the query from the ``start``-th onwards that don't
+        refer to window functions, and return them - or ``None`` if there are none.
+        """
+        where = self.query.where
+        kept, filters = where.children[:start], []
+        for child in where.children[start:]:
+            over_clause = getattr(child, "contains_over_clause", False)
+            (kept if over_clause else filters).append(child)
+        if not filters:
+            return None
+        where.children = kept
+        return WhereNode(filters)
+
+    def _add_filters_after_neighbors(self, filters) -> None:
+        """
+        Filter the records on ``filters`` after computing their neighbors, by
+        filtering on a window function over each record alone (which the database
+        does after computing the other window functions) returning whether the
+        record matches them.
+        """
+        alias = f"_history_selected_{len(self.query.annotations)}"
+        self.query.add_annotation(
+            self._neighbors_window(
+                FirstValue(Case(When(filters, then=True), default=False)),
+                frame=RowRange(0, 0),
+            ),
+            alias,
+            select=False,
+        )
+        self.query.add_q(Q(**{alias: True}))
+
+    def _filter_after_neighbors(self, queryset) -> "HistoricalQuerySet":
+        """
+        Move the filters added to the query of ``queryset`` - a filtered clone of
+        this queryset - after its neighbors are computed, if it's annotated by
+        ``with_neighbors()``, so that they're the same as without the filters.
+        """
+        if self._with_neighbors:
+            filters = queryset._pop_filters(len(self.query.where.children))
+            if filters is not None:
+                queryset._add_filters_after_neighbors(filters)
+        return queryset
+
+    def iter_deltas(
+        self, fields=None, m2m=None, chunk_size=ITER_DELTAS_CHUNK_SIZE
+    ) -> Iterator["ModelDelta"]:
+        """
+        Yield the ``ModelDelta`` of each pair of consecutive records of the same
+        object in the queryset - like ``new_record.diff_against(old_record)`` - ordered
+        by the objects' primary keys and then by ``history_date``.
+
+        ``fields`` are the names of the fields to compare, defaulting to all the
+        history-tracked fields like ``diff_against()``; ``m2m`` are the names of the
+        m2m fields to compare, defaulting to all the m2m fields tracked by the
+        model. Foreign keys are compared and reported as the raw PKs, and the rows
+        of m2m fields are ordered by the PKs of the related objects.
+
+        The records are fetched once, ``chunk_size`` at a time, with a server-side
+        cursor where supported, and the m2m rows of each chunk are fetched with one
+        query per m2m field.
+        """
+        return iter(HistoricalDeltaIterator(self, fields, m2m, chunk_size))
+
     def _select_related_history_tracked_objs(self) -> "HistoricalQuerySet":
         """
         A convenience method that calls ``select_related()`` with all the names of
         the model's history-tracked ``ForeignKey`` fields.
         """
-        field_names = [
-            field.name
-            for field in self.model.tracked_fields
-            if isinstance(field, models.ForeignKey)
-        ]
-        return self.select_related(*field_names)
+        return self.select_related(*self.model._history_write_plan.foreign_key_names)
 
     def _clone(self) -> "HistoricalQuerySet":
         c = super()._clone()
         c._as_instances = self._as_instances
         c._as_of = self._as_of
         c._pk_attr = self._pk_attr
+        c._with_neighbors = self._with_neighbors
         return c
 
     def _fetch_all(self) -> None:
+        if self._result_cache is not None:
+            super()._fetch_all()
+            return
         super()._fetch_all()
+        self._fill_delta_records()
+        self._load_deduplicated_values()
+        self._cache_neighbor_records()
         self._instanceize()
 
+    def _fill_delta_records(self) -> None:
+        """
+        Fill in the fields of the delta records in the result cache, that were left
+        empty because they didn't change, if the model uses ``storage="delta"``.
+        The records of all the objects are rebuilt from one query per batch of
+        objects.
+        """
+        if not (
+            self._result_cache
+            and getattr(self.model, "_history_storage", None) == "delta"
+            and isinstance(self._result_cache[0], self.model)
+        ):
+            return
+        fill_delta_records(self.model, self._result_cache, self.db)
+
+    def _load_deduplicated_values(self) -> None:
+        """
+        Load the values of the ``deduplicated_fields`` of the records in the result
+        cache, with one query per batch of distinct values.
+        """
+        if self._result_cache and isinstance(self._result_cache[0], self.model):
+            load_deduplicated_values(self._result_cache, self.db)
+
+    def iterator(self, chunk_size=None) -> Iterator:
+        """
+        Like ``QuerySet.iterator()``, but with the delta records of each chunk of
+        records filled in, if the model uses ``storage="delta"``, and the values of
+        its ``deduplicated_fields`` loaded.
+        """
+        rows = super().iterator(chunk_size)
+        if self._iterable_class is not ModelIterable or not (
+            getattr(self.model, "_history_storage", None) == "delta"
+            or getattr(self.model, "_history_deduplicated_fields", ())
+        ):
+            return rows
+        return self._iter_filled_records(rows, chunk_size or 2000)
+
+    def _iter_filled_records(self, records, chunk_size) -> Iterator:
+        for chunk in get_chunks(records, chunk_size):
+            if getattr(self.model, "_history_storage", None) == "delta":
+                fill_delta_records(self.model, chunk, self.db)
+            load_deduplicated_values(chunk, self.db)
+            yield from chunk
+
+    def _cache_neighbor_records(self) -> None:
+        """
+        Share a ``HistoricalNeighborCache`` of the result cache between its records,
+        if the queryset was annotated by ``with_neighbors()``.
+        """
+        if not (
+            self._result_cache
+            and "next_history_date" in self.query.annotations
+            and isinstance(self._result_cache[0], self.model)
+        ):
+            return
+        neighbors = HistoricalNeighborCache(self.model, self.db, self._result_cache)
+        for record in self._result_cache:
+            record._history_neighbors = neighbors
+
     def _instanceize(self) -> None:
         """
         Convert the result cache to instances if possible and it has not already been
@@ -112,6 +470,314 @@ class HistoricalQuerySet(QuerySet):
                 setattr(historic, "_as_of", self._as_of)
 
 
+class HistoricalNeighborCache:
+    """
+    The records fetched by a queryset annotated by ``with_neighbors()``, by primary
+    key, used by their ``prev_record`` and ``next_record``.
+    """
+
+    def __init__(self, model, using, records):
+        self.model = model
+        self.using = using
+        self.records = {record.pk: record for record in records}
+        self.missing_pks = (
+            {
+                getattr(record, f"{prefix}_{model._meta.pk.attname}")
+                for record in records
+                for prefix in ("prev", "next")
+            }
+            - set(self.records)
+            - {None}
+        )
+
+    def get(self, pk):
+        """
+        Return the record with the primary key ``pk``, or ``None`` if ``pk`` is
+        ``None``. The first time a record that wasn't fetched is requested, all the
+        neighbors that weren't fetched are fetched.
+        """
+        if pk is None:
+            return None
+        if self.missing_pks and pk not in self.records:
+            missing_records = HistoricalQuerySet(self.model, using=self.using).filter(
+                pk__in=self.missing_pks
+            )
+            self.records.update((record.pk, record) for record in missing_records)
+            self.missing_pks = set()
+        return self.records.get(pk)
+
+
+class HistoricalDeltaIterator:
+    """
+    Computes the ``ModelDelta`` of consecutive historical records for
+    ``HistoricalQuerySet.iter_deltas()``, keeping the previous record - and its m2m
+    rows - of the object being diffed between chunks.
+    """
+
+    def __init__(self, queryset, fields, m2m, chunk_size):
+        history_model = queryset.model
+        m2m_fields = {field.name: field for field in history_model._history_m2m_fields}
+        if fields is None:
+            fields = [
+                field.name
+                for field in history_model.tracked_fields
+                if field.editable and field.name not in m2m_fields
+            ]
+        if m2m is None:
+            m2m = list(m2m_fields)
+        unknown_m2m = set(m2m).difference(m2m_fields)
+        if unknown_m2m:
+            raise ValueError(
+                f"{', '.join(sorted(unknown_m2m))} are not m2m fields tracked by"
+                f" {history_model.instance_type._meta.label}."
+            )
+
+        self.history_model = history_model
+        self.using = queryset.db
+        self.pk_attname = queryset._pk_attr
+        self.chunk_size = chunk_size
+        self.deduplicated_fields = set(fields).intersection(
+            getattr(history_model, "_history_deduplicated_fields", ())
+        )
+        # The attribute each field is compared by, and the one it's reported from
+        self.fields = {
+            name: (
+                (f"{name}_digest", name)
+                if name in self.deduplicated_fields
+                else (history_model._meta.get_field(name).attname,) * 2
+            )
+            for name in fields
+        }
+        self.m2m_fields = [m2m_fields[name] for name in m2m]
+        # The through rows of the last record diffed, by the name of the field, with
+        # ``m2m_storage="delta"``
+        self.m2m_states = {}
+        self.attnames = [field.attname for field in history_model._meta.concrete_fields]
+        self.queryset = queryset.order_by(
+            self.pk_attname, "history_date", history_model._meta.pk.attname
+        )
+
+    def __iter__(self):
+        from simple_history.models import ModelDelta
+
+        # The delta records are filled in below, so bypass the check against
+        # fetching their values
+        rows = QuerySet.values_list(self.queryset, *self.attnames).iterator(
+            chunk_size=self.chunk_size
+        )
+        previous_record = None
+        previous_m2m_rows = {}
+        for chunk in get_chunks(rows, self.chunk_size):
+            records = []
+            for row in chunk:
+                record = self.history_model.from_db(self.using, self.attnames, row)
+                if not self.is_same_object(previous_record, record):
+                    previous_record = None
+                records.append((previous_record, record))
+                previous_record = record
+            self.fill_delta_records(records)
+            self.load_deduplicated_values(records)
+            m2m_rows = self.get_m2m_rows(records, previous_m2m_rows)
+            for old_record, new_record in records:
+                if old_record is not None:
+                    changes = self.get_changes(old_record, new_record, m2m_rows)
+                    changed_fields = [change.field for change in changes]
+                    yield ModelDelta(changes, changed_fields, old_record, new_record)
+            previous_m2m_rows = m2m_rows.get(previous_record.pk, {})
+
+    def is_same_object(self, previous_record, record):
+        return previous_record is not None and getattr(
+            previous_record, self.pk_attname
+        ) == getattr(record, self.pk_attname)
+
+    def fill_delta_records(self, records):
+        """
+        Fill in the fields of the consecutive ``records`` left empty because they
+        didn't change, if the model uses ``storage="delta"``, from the previous
+        record of the same object - or from the database, with one query per batch
+        of objects, for the first record of each object.
+        """
+        if getattr(self.history_model, "_history_storage", None) != "delta":
+            return
+        values_by_pk = get_delta_record_values(
+            self.history_model,
+            [
+                record
+                for previous_record, record in records
+                if previous_record is None and record.history_changed_fields is not None
+            ],
+            self.using,
+        )
+        for previous_record, record in records:
+            changed_fields = record.history_changed_fields
+            if changed_fields is None:
+                continue
+            if previous_record is None:
+                values = values_by_pk[record.pk]
+            else:
+                values = {
+                    attname: getattr(previous_record, attname)
+                    for attname in get_delta_attnames(self.history_model)
+                    if attname not in changed_fields
+                }
+            for attname, value in values.items():
+                setattr(record, attname, value)
+
+    def load_deduplicated_values(self, records):
+        """
+        Load the values of the compared ``deduplicated_fields`` that changed between
+        the consecutive ``records``, with one query.
+        """
+        changed = [
+            (record, name)
+            for old_record, new_record in records
+            if old_record is not None
+            for name in self.deduplicated_fields
+            if getattr(old_record, f"{name}_digest")
+            != getattr(new_record, f"{name}_digest")
+            for record in (old_record, new_record)
+        ]
+        if not changed:
+            return
+        blob_model = self.history_model._history_blob_model
+        texts = dict(
+            blob_model._default_manager.using(self.using)
+            .filter(
+                digest__in={
+                    getattr(record, f"{name}_digest") for record, name in changed
+                }
+            )
+            .values_list("digest", "value")
+        )
+        for record, name in changed:
+            descriptor = getattr(self.history_model, name)
+            text = texts.get(getattr(record, f"{name}_digest"))
+            value = None
+            if text is not None:
+                value = decode_value(text, descriptor.value_type, descriptor.decoder)
+            record.__dict__[name] = value
+
+    def get_m2m_rows(self, records, previous_m2m_rows):
+        """
+        Return the rows of the compared m2m fields of ``records``, by the primary
+        key of the record and then by the name of the field. ``previous_m2m_rows``
+        are the rows of the record before the first one, by the name of the field.
+        """
+        m2m_rows = defaultdict(dict)
+        if records and records[0][0] is not None:
+            m2m_rows[records[0][0].pk] = previous_m2m_rows
+        for field in self.m2m_fields:
+            m2m_history_model = getattr(self.history_model, field.name).model
+            if hasattr(m2m_history_model, "m2m_history_op"):
+                rows_by_pk = self.get_delta_m2m_rows(m2m_history_model, records, field)
+            else:
+                rows_by_pk = self.get_snapshot_m2m_rows(m2m_history_model, records)
+            reverse_name = get_m2m_reverse_field_name(field)
+            names = [
+                (f.name, f.attname)
+                for f in m2m_history_model._meta.fields
+                if f.editable and f.name not in ["id", "m2m_history_id", "history"]
+            ]
+            for pk, rows in rows_by_pk.items():
+                rows = [{name: row[attname] for name, attname in names} for row in rows]
+                rows.sort(key=lambda row: row[reverse_name])
+                m2m_rows[pk][field.name] = rows
+        return m2m_rows
+
+    def get_snapshot_m2m_rows(self, m2m_history_model, records):
+        """
+        Return the through rows recorded by the m2m rows of ``records`` - with
+        ``m2m_storage="snapshot"`` - by the primary key of the record.
+        """
+        rows_by_pk = {record.pk: [] for _, record in records}
+        for row in (
+            m2m_history_model._default_manager.using(self.using)
+            .filter(history__in=rows_by_pk)
+            .values(*get_m2m_row_attnames(m2m_history_model))
+        ):
+            rows_by_pk[row["history_id"]].append(row)
+        return rows_by_pk
+
+    def get_delta_m2m_rows(self, m2m_history_model, records, field):
+        """
+        Return the through rows present at the time of each of ``records`` - with
+        ``m2m_storage="delta"`` - by the primary key of the record, by applying the
+        m2m rows of each record to the state of the previous one.
+        """
+        from simple_history.models import (
+            get_m2m_chains,
+            get_m2m_key_attnames,
+            get_m2m_states,
+        )
+
+        ops_by_pk = defaultdict(list)
+        for row in (
+            m2m_history_model._default_manager.using(self.using)
+            .filter(history__in=[record.pk for _, record in records])
+            .values("m2m_history_op", *get_m2m_row_attnames(m2m_history_model))
+        ):
+            ops_by_pk[row["history_id"]].append(row)
+
+        # The states before the first record of each object that isn't a keyframe
+        chains = get_m2m_chains(
+            [
+                record
+                for old_record, record in records
+                if old_record is None and not record.history_m2m_keyframe
+            ],
+            inclusive=False,
+            using=self.using,
+        )
+        first_states = get_m2m_states(
+            m2m_history_model,
+            {pk: chain or [] for pk, chain in chains.items()},
+            self.using,
+        )
+        key_attnames = get_m2m_key_attnames(m2m_history_model)
+        states = dict([self.m2m_states.get(field.name, (None, {}))])
+        rows_by_pk = {}
+        for old_record, record in records:
+            if record.history_m2m_keyframe:
+                state = {}
+            elif old_record is None:
+                state = first_states[record.pk]
+            else:
+                state = states[old_record.pk].copy()
+            for row in ops_by_pk[record.pk]:
+                key = tuple(row[attname] for attname in key_attnames)
+                if row["m2m_history_op"] == "-":
+                    state.pop(key, None)
+                else:
+                    state[key] = row
+            states[record.pk] = state
+            rows_by_pk[record.pk] = list(state.values())
+        self.m2m_states[field.name] = (record.pk, state)
+        return rows_by_pk
+
+    def get_changes(self, old_record, new_record, m2m_rows):
+        """Return the ``ModelChange`` objects of the compared fields."""
+        from simple_history.models import ModelChange
+
+        changes = []
+        for name, (compared_attname, attname) in self.fields.items():
+            if getattr(old_record, compared_attname) != getattr(
+                new_record, compared_attname
+            ):
+                changes.append(
+                    ModelChange(
+                        name, getattr(old_record, attname), getattr(new_record, attname)
+                    )
+                )
+        for field in self.m2m_fields:
+            old_rows = m2m_rows[old_record.pk][field.name]
+            new_rows = m2m_rows[new_record.pk][field.name]
+            if old_rows != new_rows:
+                changes.append(ModelChange(field.name, old_rows, new_rows))
+        # Sort by field (attribute) name, to ensure a consistent order
+        changes.sort(key=lambda change: change.field)
+        return changes
+
+
 class HistoryManager(models.Manager):
     def __init__(self, model, instance=None):
         super().__init__()
@@ -139,16 +805,18 @@ class HistoryManager(models.Manager):
                     self.model._meta.object_name
                 )
             )
-        tmp = []
-
-        for field in self.model.tracked_fields:
-            if isinstance(field, models.ForeignKey):
-                tmp.append(field.name + "_id")
-            else:
-                tmp.append(field.name)
-        fields = tuple(tmp)
+        fields = self.model._history_write_plan.attnames
+        queryset = self.get_queryset()
+        if getattr(self.model, "_history_latest_model", None) is not None:
+            queryset = filter_latest_records(queryset, pk=self.instance.pk)
         try:
-            values = self.get_queryset().values(*fields)[0]
+            if getattr(self.model, "_history_storage", None) == "delta" or getattr(
+                self.model, "_history_deduplicated_fields", ()
+            ):
+                record = queryset[0]
+                values = {field: getattr(record, field) for field in fields}
+            else:
+                values = queryset.values(*fields)[0]
         except IndexError:
             raise self.instance.DoesNotExist(
                 "%s has no historical record." % self.instance._meta.object_name
@@ -188,12 +856,25 @@ class HistoryManager(models.Manager):
         if not self.instance:
             if isinstance(queryset, HistoricalQuerySet):
                 queryset._as_of = date
-            queryset = queryset.latest_of_each().as_instances()
-            return queryset
+            if getattr(self.model, "_history_valid_until", False):
+                # The records valid at `date` are the latest ones before it
+                queryset = queryset.filter(
+                    Q(history_valid_until__gt=date)
+                    | Q(history_valid_until__isnull=True)
+                )
+            else:
+                queryset = filter_since_checkpoint(queryset, date).latest_of_each()
+            return queryset.as_instances()
 
+        history_obj = None
+        if getattr(self.model, "_history_latest_model", None) is not None:
+            # Usually the latest record is the one valid at `date`
+            history_obj = filter_latest_records(
+                queryset, pk=self.instance.pk, history_date__lte=date
+            ).first()
         try:
             # historical records are sorted in reverse chronological order
-            history_obj = queryset[0]
+            history_obj = history_obj or queryset[0]
         except IndexError:
             raise self.instance.DoesNotExist(
                 "%s had not yet been created." % self.instance._meta.object_name
@@ -216,11 +897,17 @@ class HistoryManager(models.Manager):
         default_change_reason="",
         default_date=None,
         custom_historical_attrs=None,
+        return_count=False,
     ):
         """
         Bulk create the history for the objects specified by objs.
         If called by bulk_update_with_history, use the update boolean and
         save the history_type accordingly.
+
+        objs can be any iterable, e.g. a generator; the historical records are
+        created in chunks of batch_size objects. Returns the created historical
+        records, or - if return_count is true - only the number of created
+        historical records, so that only one chunk is kept in memory.
         """
         if not getattr(settings, "SIMPLE_HISTORY_ENABLED", True):
             return
@@ -229,34 +916,242 @@ class HistoryManager(models.Manager):
         if update:
             history_type = "~"
 
-        historical_instances = []
-        for instance in objs:
-            history_user = getattr(
-                instance,
-                "_history_user",
-                default_user or self.model.get_default_history_user(instance),
-            )
+        # Resolve the defaults once, instead of for each object
+        history_date = default_date or timezone.now()
+        get_history_user = self._get_history_user_getter(default_user)
+        write_plan = self.model._history_write_plan
+        custom_historical_attrs = custom_historical_attrs or {}
+
+        def get_historical_instance(instance):
             row = self.model(
-                history_date=getattr(
-                    instance, "_history_date", default_date or timezone.now()
-                ),
-                history_user=history_user,
+                history_date=getattr(instance, "_history_date", history_date),
+                history_user=get_history_user(instance),
                 history_change_reason=get_change_reason_from_object(instance)
                 or default_change_reason,
                 history_type=history_type,
-                **{
-                    field.attname: getattr(instance, field.attname)
-                    for field in self.model.tracked_fields
-                },
-                **(custom_historical_attrs or {}),
+                **write_plan.get_attrs(instance),
+                **custom_historical_attrs,
             )
-            if hasattr(self.model, "history_relation"):
+            if write_plan.has_history_relation:
                 row.history_relation_id = instance.pk
-            historical_instances.append(row)
+            return row
 
-        return self.model.objects.bulk_create(
-            historical_instances, batch_size=batch_size
+        is_sequence = isinstance(objs, Sequence)
+        created = []
+        created_count = 0
+        chunk_size = batch_size or (
+            len(objs) if is_sequence else BULK_HISTORY_CREATE_CHUNK_SIZE
         )
+        for chunk in get_chunks(objs, chunk_size):
+            historical_instances = [
+                get_historical_instance(instance) for instance in chunk
+            ]
+            save_deduplicated_values(historical_instances)
+            write_plan.close_previous_records(
+                historical_instances, using=router.db_for_write(self.model)
+            )
+            historical_instances = self.model.objects.bulk_create(
+                historical_instances, batch_size=batch_size
+            )
+            write_plan.update_latest_records(
+                historical_instances, using=router.db_for_write(self.model)
+            )
+            write_plan.refresh_checkpoints(
+                historical_instances, using=router.db_for_write(self.model)
+            )
+            created_count += len(historical_instances)
+            if not return_count:
+                created.extend(historical_instances)
+        return created_count if return_count else created
+
+    def _get_history_user_getter(self, default_user):
+        """
+        Return a function returning the history user of an object, for
+        ``bulk_history_create()``. The default user is only resolved once, unless
+        it depends on the object.
+        """
+        get_default_user = self.model.get_default_history_user
+        resolve_per_instance = default_user is None and getattr(
+            self.model, "_history_user_depends_on_instance", True
+        )
+        if default_user is None and not resolve_per_instance:
+            default_user = get_default_user(None)
+
+        def get_history_user(instance):
+            try:
+                return instance._history_user
+            except AttributeError:
+                if resolve_per_instance:
+                    return get_default_user(instance)
+                return default_user
+
+        return get_history_user
+
+
+def filter_latest_records(queryset, **filters):
+    """
+    Return ``queryset`` filtered to the latest historical record of each object,
+    looked up in the table of the ``latest_table`` option - of the objects whose
+    rows in that table match ``filters``.
+    """
+    history_model = queryset.model
+    latest_records = history_model._history_latest_model._default_manager.filter(
+        **filters
+    )
+    return queryset.filter(
+        **{f"{history_model._meta.pk.attname}__in": latest_records.values("history")}
+    )
+
+
+def filter_since_checkpoint(queryset, date):
+    """
+    Return ``queryset`` filtered to the historical records that were valid at the
+    date of the latest checkpoint before ``date``, and the records after it - if the
+    model uses the ``checkpoints`` option and there is such a checkpoint.
+    """
+    history_model = queryset.model
+    checkpoint_model = getattr(history_model, "_history_checkpoint_model", None)
+    if checkpoint_model is None:
+        return queryset
+    checkpoint_rows = checkpoint_model._default_manager.using(queryset.db)
+    checkpoint_date = checkpoint_rows.filter(checkpoint_date__lte=date).aggregate(
+        checkpoint_date=Max("checkpoint_date")
+    )["checkpoint_date"]
+    if checkpoint_date is None:
+        return queryset
+    checkpoint_records = checkpoint_rows.filter(checkpoint_date=checkpoint_date).values(
+        "history"
+    )
+    return queryset.filter(
+        Q(history_date__gt=checkpoint_date)
+        | Q(**{f"{history_model._meta.pk.attname}__in": checkpoint_records})
+    )
+
+
+def get_chunks(objs, chunk_size):
+    """Yield lists of up to ``chunk_size`` items of the iterable ``objs``."""
+    objs = iter(objs)
+    while chunk := list(islice(objs, chunk_size)):
+        yield chunk
+
+
+def get_m2m_row_attnames(m2m_history_model):
+    """
+    Return the attnames of the historical record and of the through model fields in
+    ``m2m_history_model``.
+    """
+    return [
+        "history_id",
+        *(
+            field.attname
+            for field in m2m_history_model.instance_type._meta.concrete_fields
+        ),
+    ]
+
+
+def get_delta_attnames(history_model):
+    """
+    Return the attnames of the tracked fields that ``history_model`` stores as
+    deltas, with ``storage="delta"`` - i.e. all except the primary key.
+    """
+    pk_attname = history_model.instance_type._meta.pk.attname
+    return [
+        attname
+        for attname in history_model._history_write_plan.attnames
+        if attname != pk_attname
+    ]
+
+
+def get_delta_field_names(history_model):
+    """
+    Return the names and attnames of the tracked fields that ``history_model``
+    stores as deltas, with ``storage="delta"``.
+    """
+    attnames = set(get_delta_attnames(history_model))
+    return {
+        name
+        for field in history_model._history_write_plan.fields
+        if field.attname in attnames
+        for name in (field.name, field.attname)
+    }
+
+
+def fill_delta_records(history_model, records, using=None):
+    """
+    Fill in the fields of the delta records among ``records`` - historical records
+    stored with ``storage="delta"`` - that were left empty because they didn't
+    change, with one query per batch of objects.
+    """
+    records = [
+        record for record in records if record.history_changed_fields is not None
+    ]
+    if not records:
+        return
+    values_by_history_id = get_delta_record_values(history_model, records, using)
+    for record in records:
+        for attname, value in values_by_history_id[record.pk].items():
+            setattr(record, attname, value)
+
+
+def get_delta_record_values(history_model, records, using=None):
+    """
+    Return the values of all the tracked fields of ``records`` - historical records
+    stored with ``storage="delta"`` - by their ``history_id``. The values are taken
+    from the latest keyframe before each record, and the delta records after it,
+    which are fetched with one query per batch of objects.
+    """
+    pk_attname = history_model.instance_type._meta.pk.attname
+    attnames = get_delta_attnames(history_model)
+    using = using or router.db_for_read(history_model)
+    records_by_pk = defaultdict(list)
+    for record in records:
+        records_by_pk[getattr(record, pk_attname)].append(record)
+    pks = list(records_by_pk)
+    batch_size = connections[using].ops.bulk_batch_size([pk_attname], pks) or 1
+
+    values_by_history_id = {}
+    for batch in get_chunks(pks, batch_size):
+        batch_records = [record for pk in batch for record in records_by_pk[pk]]
+        min_date = min(record.history_date for record in batch_records)
+        # The chain of each object starts at its latest keyframe strictly before the
+        # earliest of the records, or at its first record if there's none
+        keyframe_dates = (
+            history_model._default_manager.filter(
+                **{pk_attname: OuterRef(pk_attname)},
+                history_changed_fields__isnull=True,
+                history_date__lt=min_date,
+            )
+            .order_by("-history_date")
+            .values("history_date")[:1]
+        )
+        rows = (
+            history_model._default_manager.using(using)
+            .filter(
+                **{f"{pk_attname}__in": batch},
+                history_date__lte=max(record.history_date for record in batch_records),
+            )
+            .alias(
+                _history_keyframe_date=Coalesce(
+                    Subquery(keyframe_dates), F("history_date")
+                )
+            )
+            .filter(history_date__gte=F("_history_keyframe_date"))
+            .order_by(pk_attname, "history_date", "history_id")
+            .values(pk_attname, "history_id", "history_changed_fields", *attnames)
+        )
+        values = {}
+        previous_pk = None
+        for row in rows:
+            if row[pk_attname] != previous_pk:
+                values = {}
+                previous_pk = row[pk_attname]
+            changed_fields = row["history_changed_fields"]
+            if changed_fields is None:
+                changed_fields = attnames
+            for attname in changed_fields:
+                values[attname] = row[attname]
+            values_by_history_id[row["history_id"]] = values.copy()
+    return values_by_history_id
 
 
 class HistoryDescriptor:
@@ -264,8 +1159,8 @@ class HistoryDescriptor:
         self.model = model
         self.queryset_class = queryset
         self.manager_class = manager
+        # Creating this class is relatively expensive, so don't do it on every access
+        self._manager_with_queryset_class = manager.from_queryset(queryset)
 
     def __get__(self, instance, owner):
-        return self.manager_class.from_queryset(self.queryset_class)(
-            self.model, instance
-        )
+        return self._manager_with_queryset_class(self.model, instance)
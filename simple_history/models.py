@@ -1,11 +1,15 @@
 import copy
+import dataclasses
 import importlib
 import uuid
 import warnings
+from collections import Counter, defaultdict
 from collections.abc import Iterable, Sequence
 from dataclasses import dataclass
 from functools import partial
-from typing import TYPE_CHECKING, Any, Union
+from itertools import chain, islice
+from operator import attrgetter
+from typing import TYPE_CHECKING, Any, Callable, Union
 
 import django
 from django.apps import apps
@@ -13,7 +17,7 @@ from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
-from django.db import models
+from django.db import connections, models, router, transaction
 from django.db.models import ManyToManyField
 from django.db.models.fields.proxy import OrderWrt
 from django.db.models.fields.related import ForeignKey
@@ -24,6 +28,7 @@ from django.db.models.fields.related_descriptors import (
     ReverseOneToOneDescriptor,
     create_reverse_many_to_one_manager,
 )
+from django.db.models.functions import Coalesce
 from django.db.models.query import QuerySet
 from django.db.models.signals import m2m_changed
 from django.forms.models import model_to_dict
@@ -35,11 +40,18 @@ from django.utils.text import format_lazy
 from django.utils.translation import gettext_lazy as _
 
 from . import exceptions, utils
+from .fields import (
+    CompressedField,
+    compress_field,
+    deduplicate_field,
+    save_deduplicated_values,
+)
 from .manager import (
     SIMPLE_HISTORY_REVERSE_ATTR_NAME,
     HistoricalQuerySet,
     HistoryDescriptor,
     HistoryManager,
+    get_delta_attnames,
 )
 from .signals import (
     post_create_historical_m2m_records,
@@ -83,6 +95,483 @@ def _history_user_setter(historical_instance, user):
         historical_instance.history_user_id = user.pk
 
 
+@dataclass(frozen=True)
+class HistoryWritePlan:
+    """
+    The parts of creating historical records for a model that are the same for
+    every record, computed once when the historical model is created.
+    """
+
+    history_model: type[models.Model]
+    fields: tuple[models.Field, ...]
+    attnames: tuple[str, ...]
+    foreign_key_names: tuple[str, ...]
+    m2m_fields: tuple[ManyToManyField, ...]
+    has_history_relation: bool
+    has_valid_until: bool
+    latest_model: Union[type[models.Model], None]
+    checkpoint_model: Union[type[models.Model], None]
+    get_values: Callable[[models.Model], tuple] = dataclasses.field(
+        init=False, repr=False, compare=False
+    )
+    insert_statements: dict = dataclasses.field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
+        if len(self.attnames) == 1:
+            get_value = attrgetter(*self.attnames)
+
+            def get_values(obj):
+                return (get_value(obj),)
+
+        else:
+            get_values = attrgetter(*self.attnames)
+        object.__setattr__(self, "get_values", get_values)
+
+    @classmethod
+    def for_history_model(cls, history_model):
+        fields = tuple(history_model.tracked_fields)
+        return cls(
+            history_model=history_model,
+            fields=fields,
+            attnames=tuple(field.attname for field in fields),
+            foreign_key_names=tuple(
+                field.name for field in fields if isinstance(field, ForeignKey)
+            ),
+            m2m_fields=tuple(history_model._history_m2m_fields),
+            has_history_relation=hasattr(history_model, "history_relation"),
+            has_valid_until=getattr(history_model, "_history_valid_until", False),
+            latest_model=getattr(history_model, "_history_latest_model", None),
+            checkpoint_model=getattr(history_model, "_history_checkpoint_model", None),
+        )
+
+    def get_attrs(self, obj):
+        """
+        Return a dict of the attnames of the history-tracked fields to their values
+        on ``obj`` - which can be either a model instance or a historical record.
+        """
+        return dict(zip(self.attnames, self.get_values(obj)))
+
+    def close_previous_records(self, history_instances, using):
+        """
+        Set the ``history_valid_until`` of the unsaved ``history_instances`` to the
+        ``history_date`` of the next one of the same object - or of the next record
+        in the database, if they're backdated - and of the records of their
+        objects that are still valid in the database to the date of the first one
+        - which must be done before inserting them. Does nothing if the model
+        doesn't use the ``valid_until`` option.
+        """
+        if not self.has_valid_until:
+            return
+        pk_attname = self.history_model.instance_type._meta.pk.attname
+        instances_by_pk = defaultdict(list)
+        for history_instance in history_instances:
+            instances_by_pk[getattr(history_instance, pk_attname)].append(
+                history_instance
+            )
+        pks_by_date = defaultdict(list)
+        for pk, instances in instances_by_pk.items():
+            instances.sort(key=attrgetter("history_date"))
+            for history_instance, next_instance in zip(instances, instances[1:]):
+                history_instance.history_valid_until = next_instance.history_date
+            pks_by_date[instances[0].history_date].append(pk)
+        for date, pks in pks_by_date.items():
+            batch_size = connections[using].ops.bulk_batch_size([pk_attname], pks)
+            batch_size = batch_size or 1
+            for start in range(0, len(pks), batch_size):
+                end = start + batch_size
+                filters = {f"{pk_attname}__in": pks[start:end]}
+                next_dates = self.get_next_record_dates(date, using, **filters)
+                for pk, next_date in next_dates.items():
+                    # The last of the instances before the next record is valid
+                    # until that record
+                    previous = [
+                        history_instance
+                        for history_instance in instances_by_pk[pk]
+                        if history_instance.history_date < next_date
+                    ][-1]
+                    if (
+                        previous.history_valid_until is None
+                        or previous.history_valid_until > next_date
+                    ):
+                        previous.history_valid_until = next_date
+                self.close_records(date, using, **filters)
+
+    def get_next_record_dates(self, date, using, **filters):
+        """
+        Return the ``history_date`` of the first record after ``date`` of each
+        object whose records match ``filters``, by primary key of the object.
+        """
+        pk_attname = self.history_model.instance_type._meta.pk.attname
+        return dict(
+            self.history_model._default_manager.using(using)
+            .filter(history_date__gt=date, **filters)
+            .order_by()
+            .values(pk_attname)
+            .annotate(next_date=models.Min("history_date"))
+            .values_list(pk_attname, "next_date")
+        )
+
+    def close_records(self, date, using, **filters):
+        """
+        Set the ``history_valid_until`` of the records matching ``filters`` that are
+        still valid at ``date`` to ``date``.
+        """
+        self.history_model._default_manager.using(using).filter(
+            models.Q(history_valid_until__isnull=True)
+            | models.Q(history_valid_until__gt=date),
+            history_date__lte=date,
+            **filters,
+        ).update(history_valid_until=date)
+
+    def update_latest_records(self, history_instances, using):
+        """
+        Point the rows of the ``latest_table`` option's model at the newest of the
+        just inserted ``history_instances`` of each object, and add them to the
+        numbers of records of their objects. Does nothing if the model doesn't use
+        the ``latest_table`` option.
+        """
+        if self.latest_model is None or not history_instances:
+            return
+        pk_attname = self.history_model.instance_type._meta.pk.attname
+        if any(history_instance.pk is None for history_instance in history_instances):
+            # E.g. bulk inserts on databases that don't return the primary keys
+            pks = {getattr(instance, pk_attname) for instance in history_instances}
+            self.refresh_latest_records(using, pks=list(pks))
+            return
+        added = {}
+        for history_instance in history_instances:
+            pk = getattr(history_instance, pk_attname)
+            newest, count = added.get(pk, (history_instance, 0))
+            if history_instance.history_date >= newest.history_date:
+                newest = history_instance
+            added[pk] = (newest, count + 1)
+
+        manager = self.latest_model._default_manager.using(using)
+        pks = list(added)
+        batch_size = connections[using].ops.bulk_batch_size(["pk"], pks) or 1
+        with transaction.atomic(using=using, savepoint=False):
+            existing = {}
+            for start in range(0, len(pks), batch_size):
+                end = start + batch_size
+                for latest in manager.select_for_update().filter(pk__in=pks[start:end]):
+                    existing[latest.pk] = latest
+            latest_records = []
+            for pk, (history_instance, count) in added.items():
+                latest = existing.get(pk)
+                if latest is not None:
+                    count += latest.history_count
+                    if latest.history_date > history_instance.history_date:
+                        # The inserted records are older than the latest one
+                        latest.history_count = count
+                        latest_records.append(latest)
+                        continue
+                latest_records.append(
+                    self.latest_model(
+                        pk=pk,
+                        history=history_instance,
+                        history_type=history_instance.history_type,
+                        history_date=history_instance.history_date,
+                        history_count=count,
+                    )
+                )
+            self._save_latest_records(latest_records, using)
+
+    def refresh_checkpoints(self, history_instances, using):
+        """
+        Recreate the rows of the checkpoints dated at or after the ``history_date``
+        of the just inserted ``history_instances``, for their objects - which only
+        happens if they were created with a date in the past. Does nothing if the
+        model doesn't use the ``checkpoints`` option.
+        """
+        if self.checkpoint_model is None or not history_instances:
+            return
+        pk_attname = self.history_model.instance_type._meta.pk.attname
+        earliest_dates = {}
+        for history_instance in history_instances:
+            pk = getattr(history_instance, pk_attname)
+            date = history_instance.history_date
+            if pk not in earliest_dates or date < earliest_dates[pk]:
+                earliest_dates[pk] = date
+        for date in self._get_checkpoint_dates(min(earliest_dates.values()), using):
+            pks = [pk for pk, earliest in earliest_dates.items() if earliest <= date]
+            create_history_checkpoint(self.history_model, date, using, pks=pks)
+
+    def _get_checkpoint_dates(self, since, using):
+        return list(
+            self.checkpoint_model._default_manager.using(using)
+            .filter(checkpoint_date__gte=since)
+            .values_list("checkpoint_date", flat=True)
+            .distinct()
+        )
+
+    def refresh_latest_records(self, using, pks=None, batch_size=1000):
+        """
+        Recompute the rows of the ``latest_table`` option's model - of all objects,
+        or of the objects with the primary keys ``pks`` - from their historical
+        records, iterating over them in order, and delete the rows of the objects
+        without historical records. Does nothing if the model doesn't use the
+        ``latest_table`` option.
+        """
+        if self.latest_model is None:
+            return
+        pk_attname = self.history_model.instance_type._meta.pk.attname
+        history_pk_attname = self.history_model._meta.pk.attname
+        records = self.history_model._default_manager.using(using)
+        latest_records = self.latest_model._default_manager.using(using)
+        if pks is not None:
+            records = records.filter(**{f"{pk_attname}__in": pks})
+            latest_records = latest_records.filter(pk__in=pks)
+        rows = records.order_by(
+            pk_attname, "history_date", history_pk_attname
+        ).values_list(pk_attname, history_pk_attname, "history_type", "history_date")
+        with transaction.atomic(using=using, savepoint=False):
+            latest_records.exclude(
+                models.Exists(
+                    self.history_model._default_manager.filter(
+                        **{pk_attname: models.OuterRef("pk")}
+                    )
+                )
+            ).delete()
+            batch = []
+            latest = None
+            for row in chain(rows.iterator(chunk_size=batch_size), [None]):
+                if latest is not None and (row is None or row[0] != latest.pk):
+                    batch.append(latest)
+                    latest = None
+                if len(batch) >= batch_size or (row is None and batch):
+                    self._save_latest_records(batch, using)
+                    batch = []
+                if row is None:
+                    break
+                count = latest.history_count if latest is not None else 0
+                latest = self.latest_model(
+                    pk=row[0],
+                    history_id=row[1],
+                    history_type=row[2],
+                    history_date=row[3],
+                    history_count=count + 1,
+                )
+
+    def _save_latest_records(self, latest_records, using):
+        connection = connections[using]
+        self.latest_model._default_manager.using(using).bulk_create(
+            latest_records,
+            update_conflicts=True,
+            update_fields=["history", "history_type", "history_date", "history_count"],
+            unique_fields=(
+                [self.latest_model._meta.pk.name]
+                if connection.features.supports_update_conflicts_with_target
+                else None
+            ),
+        )
+
+    def rebuild_valid_until(self, using, pks=None, batch_size=1000):
+        """
+        Recompute the ``history_valid_until`` of all the historical records - or of
+        the records of the objects with the primary keys ``pks`` - from the
+        ``history_date`` of the next record of the same object, iterating over them
+        in order. Returns the number of records whose value changed. Does nothing if
+        the model doesn't use the ``valid_until`` option.
+        """
+        if not self.has_valid_until:
+            return 0
+        pk_attname = self.history_model.instance_type._meta.pk.attname
+        history_pk_attname = self.history_model._meta.pk.attname
+        records = self.history_model._default_manager.using(using)
+        if pks is not None:
+            records = records.filter(**{f"{pk_attname}__in": pks})
+        rows = records.order_by(
+            pk_attname, "history_date", history_pk_attname
+        ).values_list(
+            pk_attname, history_pk_attname, "history_date", "history_valid_until"
+        )
+        changed = []
+        count = 0
+        previous = None
+        for row in chain(rows.iterator(chunk_size=batch_size), [None]):
+            if previous is not None:
+                valid_until = (
+                    row[2] if row is not None and row[0] == previous[0] else None
+                )
+                if valid_until != previous[3]:
+                    changed.append(
+                        self.history_model(
+                            **{history_pk_attname: previous[1]},
+                            history_valid_until=valid_until,
+                        )
+                    )
+            previous = row
+            if len(changed) >= batch_size or row is None:
+                count += len(changed)
+                records.bulk_update(changed, ["history_valid_until"])
+                changed = []
+        return count
+
+    @cached_property
+    def insert_fields(self):
+        """
+        The fields of the historical model that ``insert()`` sets the values of,
+        or ``None`` if its records can't be inserted that way.
+        """
+        meta = self.history_model._meta
+        if meta.parents:
+            return None
+        fields = []
+        for field in meta.local_concrete_fields:
+            if hasattr(field, "get_placeholder"):
+                # E.g. geometry fields, whose values need to be wrapped in SQL
+                return None
+            if getattr(field, "generated", False):
+                continue
+            if field.primary_key and field.db_returning:
+                continue
+            fields.append(field)
+        return tuple(fields)
+
+    def can_insert_directly(self):
+        """
+        Return whether ``insert()`` can be used instead of saving the historical
+        records - which is not the case if any receivers are connected to the save
+        signals of the historical model.
+        """
+        return self.insert_fields is not None and not (
+            models.signals.pre_save.has_listeners(self.history_model)
+            or models.signals.post_save.has_listeners(self.history_model)
+        )
+
+    def insert(self, history_instance, using):
+        """
+        Insert ``history_instance`` with a single precompiled ``INSERT`` query,
+        bypassing ``Model.save()``. The primary key is set on ``history_instance``
+        if the database generated it.
+        """
+        connection = connections[using]
+        try:
+            sql, pk_source = self.insert_statements[using]
+        except KeyError:
+            sql, pk_source = self.insert_statements[using] = self._compile_insert(
+                connection
+            )
+        # As in `Model.save()`, e.g. for `auto_now` fields inherited through `bases`
+        params = [
+            field.get_db_prep_save(
+                field.pre_save(history_instance, add=True), connection=connection
+            )
+            for field in self.insert_fields
+        ]
+        pk = self.history_model._meta.pk
+        with (
+            transaction.mark_for_rollback_on_error(using),
+            connection.cursor() as cursor,
+        ):
+            cursor.execute(sql, params)
+            if pk_source == "returning":
+                setattr(history_instance, pk.attname, cursor.fetchone()[0])
+            elif pk_source == "last_insert_id":
+                pk_value = connection.ops.last_insert_id(
+                    cursor, self.history_model._meta.db_table, pk.column
+                )
+                setattr(history_instance, pk.attname, pk_value)
+        history_instance._state.adding = False
+        history_instance._state.db = using
+
+    @cached_property
+    def can_insert_from_select(self):
+        """
+        Whether ``insert_from_select()`` can be used - i.e. the database generates
+        the primary keys of the historical records, and the history-tracked fields
+        are stored the same way as in the tracked model.
+        """
+        if self.insert_fields is None:
+            return False
+        return not (
+            self.history_model._meta.pk in self.insert_fields
+            or getattr(self.history_model, "_history_deduplicated_fields", ())
+            or any(isinstance(field, CompressedField) for field in self.insert_fields)
+        )
+
+    def insert_from_select(self, queryset, template, using):
+        """
+        Insert a historical record of each object in ``queryset`` with a single
+        ``INSERT ... SELECT`` query, which copies the history-tracked fields in the
+        database. The other fields are set to their values on the unsaved historical
+        record ``template``. Returns the number of inserted records.
+        """
+        tracked_attnames = set(self.attnames)
+        tracked_fields, other_fields, annotations = [], [], {}
+        for field in self.insert_fields:
+            if field.attname in tracked_attnames:
+                tracked_fields.append(field)
+                continue
+            if field.name == "history_relation":
+                value = models.F("pk")
+            else:
+                value = models.Value(
+                    field.pre_save(template, add=True), output_field=field
+                )
+            other_fields.append(field)
+            annotations[f"_history_value_{len(annotations)}"] = value
+        pks = queryset.using(using).values("pk")
+        if self.has_valid_until:
+            pk_attname = self.history_model.instance_type._meta.pk.attname
+            self.close_records(
+                template.history_date, using, **{f"{pk_attname}__in": pks}
+            )
+        # Annotations are selected after the fields, in the order they're added
+        queryset = (
+            queryset.using(using)
+            .order_by()
+            .annotate(**annotations)
+            .values_list(*(field.attname for field in tracked_fields), *annotations)
+        )
+        connection = connections[using]
+        select_sql, params = queryset.query.get_compiler(using).as_sql()
+        quote_name = connection.ops.quote_name
+        sql = "INSERT INTO {} ({}) {}".format(
+            quote_name(self.history_model._meta.db_table),
+            ", ".join(
+                quote_name(field.column) for field in tracked_fields + other_fields
+            ),
+            select_sql,
+        )
+        with (
+            transaction.mark_for_rollback_on_error(using),
+            connection.cursor() as cursor,
+        ):
+            cursor.execute(sql, params)
+            count = cursor.rowcount
+        if self.latest_model is not None:
+            self.refresh_latest_records(using, pks=pks)
+        if self.checkpoint_model is not None:
+            for date in self._get_checkpoint_dates(template.history_date, using):
+                create_history_checkpoint(self.history_model, date, using, pks=pks)
+        return count
+
+    def _compile_insert(self, connection):
+        meta = self.history_model._meta
+        quote_name = connection.ops.quote_name
+        sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            quote_name(meta.db_table),
+            ", ".join(quote_name(field.column) for field in self.insert_fields),
+            ", ".join(["%s"] * len(self.insert_fields)),
+        )
+        pk_source = None
+        if meta.pk.db_returning:
+            returning_sql, returning_params = None, None
+            if connection.features.can_return_columns_from_insert:
+                returning_sql, returning_params = connection.ops.return_insert_columns(
+                    [meta.pk]
+                )
+            if returning_sql and not returning_params:
+                sql = f"{sql} {returning_sql}"
+                pk_source = "returning"
+            else:
+                pk_source = "last_insert_id"
+        return sql, pk_source
+
+
 class HistoricalRecords:
     DEFAULT_MODEL_NAME_PREFIX = "Historical"
 
@@ -118,6 +607,21 @@ class HistoricalRecords:
         m2m_fields=(),
         m2m_fields_model_field_name="_history_m2m_fields",
         m2m_bases=(models.Model,),
+        buffered_writes=None,
+        skip_unchanged_saves=False,
+        direct_insert=False,
+        history_writer=None,
+        coalesce_writes=False,
+        m2m_storage="snapshot",
+        m2m_keyframe_interval=50,
+        storage="full",
+        keyframe_interval=50,
+        compressed_fields=None,
+        compression="zlib",
+        deduplicated_fields=None,
+        valid_until=False,
+        latest_table=False,
+        checkpoints=False,
     ):
         self.user_set_verbose_name = verbose_name
         self.user_set_verbose_name_plural = verbose_name_plural
@@ -141,6 +645,22 @@ class HistoricalRecords:
         self.historical_queryset = historical_queryset
         self.m2m_fields = m2m_fields
         self.m2m_fields_model_field_name = m2m_fields_model_field_name
+        self.buffered_writes = buffered_writes
+        self.skip_unchanged_saves = skip_unchanged_saves
+        self.direct_insert = direct_insert
+        self.history_writer = history_writer
+        self.coalesce_writes = coalesce_writes
+        self.m2m_storage = m2m_storage
+        self.m2m_keyframe_interval = m2m_keyframe_interval
+        self.storage = storage
+        self.keyframe_interval = keyframe_interval
+        self.compressed_fields = compressed_fields or []
+        self.compression = compression
+        self.deduplicated_fields = deduplicated_fields or []
+        self.valid_until = valid_until
+        self.latest_table = latest_table
+        self.checkpoints = checkpoints
+        self._write_plans = {}
 
         if isinstance(no_db_index, str):
             no_db_index = [no_db_index]
@@ -167,6 +687,22 @@ class HistoricalRecords:
             raise TypeError("The `m2m_bases` option must be a list or a tuple.")
 
     def contribute_to_class(self, cls, name):
+        if self.m2m_storage not in ("snapshot", "delta"):
+            raise ValueError("The `m2m_storage` option must be 'snapshot' or 'delta'.")
+        if self.storage not in ("full", "delta"):
+            raise ValueError("The `storage` option must be 'full' or 'delta'.")
+        if self.storage == "delta" and (
+            self.buffered_writes or self.coalesce_writes or self.history_writer
+        ):
+            raise ImproperlyConfigured(
+                "The `storage` option can't be 'delta' together with the "
+                "`buffered_writes`, `coalesce_writes` or `history_writer` options."
+            )
+        if self.storage == "delta" and self.deduplicated_fields:
+            raise ImproperlyConfigured(
+                "The `storage` option can't be 'delta' together with the "
+                "`deduplicated_fields` option."
+            )
         self.manager_name = name
         self.module = cls.__module__
         self.cls = cls
@@ -217,14 +753,33 @@ class HistoricalRecords:
         else:
             module = importlib.import_module(self.module)
         setattr(module, history_model.__name__, history_model)
+        self.create_history_blob_model(history_model, module)
+        self.create_history_latest_model(history_model, module)
+        self.create_history_checkpoint_model(history_model, module)
+        write_plan = HistoryWritePlan.for_history_model(history_model)
+        history_model._history_write_plan = write_plan
+        self._write_plans[sender] = write_plan
+        if self.history_writer is not None:
+            if write_plan.m2m_fields:
+                raise ImproperlyConfigured(
+                    "The `history_writer` option can't be used together with the "
+                    "`m2m_fields` option."
+                )
+            self.history_writer.contribute_to_history_model(history_model)
 
         # The HistoricalRecords object will be discarded,
         # so the signal handlers can't use weak references.
         models.signals.post_save.connect(self.post_save, sender=sender, weak=False)
         models.signals.post_delete.connect(self.post_delete, sender=sender, weak=False)
         models.signals.pre_delete.connect(self.pre_delete, sender=sender, weak=False)
+        if self.skip_unchanged_saves:
+            history_model.history_save_counts = Counter(written=0, skipped=0)
+            models.signals.post_init.connect(
+                self.take_snapshot, sender=sender, weak=False
+            )
+            models.signals.pre_save.connect(self.pre_save, sender=sender, weak=False)
 
-        m2m_fields = self.get_m2m_fields_from_model(sender)
+        m2m_fields = write_plan.m2m_fields
 
         for field in m2m_fields:
             m2m_changed.connect(
@@ -249,7 +804,9 @@ class HistoricalRecords:
 
             setattr(module, m2m_model.__name__, m2m_model)
 
-            m2m_descriptor = HistoryDescriptor(m2m_model)
+            m2m_descriptor = HistoryDescriptor(
+                m2m_model, manager=self._m2m_history_manager
+            )
             setattr(history_model, field.name, m2m_descriptor)
 
     def get_history_model_name(self, model):
@@ -299,6 +856,10 @@ class HistoricalRecords:
             "_history_excluded_fields": self.excluded_fields,
             "_history_m2m_fields": self.get_m2m_fields_from_model(model),
             "tracked_fields": self.fields_included(model),
+            "_history_storage": self.storage,
+            "_history_deduplicated_fields": list(self.deduplicated_fields),
+            "_history_cascade_delete": self.cascade_delete_history,
+            "_history_valid_until": self.valid_until,
         }
 
         app_module = "%s.models" % model._meta.app_label
@@ -316,7 +877,16 @@ class HistoricalRecords:
             attrs["__module__"] = models_module
 
         fields = self.copy_fields(model)
+        if self.storage == "delta":
+            # Delta records leave the fields that didn't change empty
+            for field in fields.values():
+                if field.name != model._meta.pk.name:
+                    field.null = True
         attrs.update(fields)
+        for name in self.deduplicated_fields:
+            descriptor, digest_field = deduplicate_field(attrs.pop(name))
+            attrs[name] = descriptor
+            attrs[descriptor.digest_attname] = digest_field
         attrs.update(self.get_extra_fields(model, fields))
         # type in python2 wants str as a first argument
         attrs.update(Meta=type("Meta", (), self.get_meta_options(model)))
@@ -330,6 +900,113 @@ class HistoricalRecords:
         history_model = type(str(name), self.bases, attrs)
         return history_model
 
+    def create_history_blob_model(self, history_model, module):
+        """
+        Creates the model storing the values of the ``deduplicated_fields`` of
+        ``history_model``, once per distinct value, keyed by their SHA-256 digest.
+        Returns ``None`` if there are no ``deduplicated_fields``.
+        """
+        if not self.deduplicated_fields:
+            return None
+        meta_options = {
+            "app_label": history_model._meta.app_label,
+            "verbose_name": format_lazy("{} blob", history_model._meta.verbose_name),
+        }
+        if self.table_name is not None:
+            meta_options["db_table"] = f"{self.table_name}_blob"
+        attrs = {
+            "__module__": history_model.__module__,
+            "digest": models.CharField(max_length=64, primary_key=True),
+            "value": models.TextField(),
+            "Meta": type("Meta", (), meta_options),
+            "__str__": lambda self: self.digest,
+        }
+        blob_model = type(f"{history_model.__name__}Blob", (models.Model,), attrs)
+        setattr(module, blob_model.__name__, blob_model)
+        history_model._history_blob_model = blob_model
+        return blob_model
+
+    def create_history_latest_model(self, history_model, module):
+        """
+        Creates the model storing the latest historical record of each object of
+        ``history_model``, and its number of historical records.
+        Returns ``None`` if the ``latest_table`` option is not enabled.
+        """
+        if not self.latest_table:
+            return None
+        pk_name = history_model.instance_type._meta.pk.name
+        pk_field = history_model._meta.get_field(pk_name).clone()
+        pk_field.primary_key = True
+        pk_field.null = False
+        meta_options = {
+            "app_label": history_model._meta.app_label,
+            "verbose_name": format_lazy("{} latest", history_model._meta.verbose_name),
+        }
+        if self.table_name is not None:
+            meta_options["db_table"] = f"{self.table_name}_latest"
+        attrs = {
+            "__module__": history_model.__module__,
+            pk_name: pk_field,
+            "history": models.ForeignKey(
+                history_model,
+                db_constraint=False,
+                on_delete=models.DO_NOTHING,
+                related_name="+",
+            ),
+            "history_type": models.CharField(max_length=1),
+            "history_date": models.DateTimeField(),
+            "history_count": models.PositiveIntegerField(default=0),
+            "Meta": type("Meta", (), meta_options),
+            "__str__": lambda self: str(self.pk),
+        }
+        latest_model = type(f"{history_model.__name__}Latest", (models.Model,), attrs)
+        setattr(module, latest_model.__name__, latest_model)
+        history_model._history_latest_model = latest_model
+        return latest_model
+
+    def create_history_checkpoint_model(self, history_model, module):
+        """
+        Creates the model storing which historical record of each object was valid
+        at the dates of the checkpoints created by the
+        ``create_history_checkpoints`` management command.
+        Returns ``None`` if the ``checkpoints`` option is not enabled.
+        """
+        if not self.checkpoints:
+            return None
+        pk_name = history_model.instance_type._meta.pk.name
+        pk_field = history_model._meta.get_field(pk_name).clone()
+        pk_field.db_index = False
+        meta_options = {
+            "app_label": history_model._meta.app_label,
+            "verbose_name": format_lazy(
+                "{} checkpoint", history_model._meta.verbose_name
+            ),
+            "unique_together": (("checkpoint_date", pk_name),),
+        }
+        if self.table_name is not None:
+            meta_options["db_table"] = f"{self.table_name}_checkpoint"
+        attrs = {
+            "__module__": history_model.__module__,
+            # Not named `id`, which is usually the name of the objects' primary key
+            "checkpoint_id": models.BigAutoField(primary_key=True),
+            "checkpoint_date": models.DateTimeField(),
+            pk_name: pk_field,
+            "history": models.ForeignKey(
+                history_model,
+                db_constraint=False,
+                on_delete=models.DO_NOTHING,
+                related_name="+",
+            ),
+            "Meta": type("Meta", (), meta_options),
+            "__str__": lambda self: f"{self.checkpoint_date} {self.history_id}",
+        }
+        checkpoint_model = type(
+            f"{history_model.__name__}Checkpoint", (models.Model,), attrs
+        )
+        setattr(module, checkpoint_model.__name__, checkpoint_model)
+        history_model._history_checkpoint_model = checkpoint_model
+        return checkpoint_model
+
     def fields_included(self, model):
         fields = []
         for field in model._meta.fields:
@@ -404,6 +1081,8 @@ class HistoricalRecords:
             # drop db index
             if field.name in self.no_db_index:
                 field.db_index = False
+            if field.name in self.compressed_fields:
+                field = compress_field(field, self.compression)
 
             fields[field.name] = field
         return fields
@@ -494,6 +1173,13 @@ class HistoricalRecords:
             "instance_type": through_model,
             "m2m_history_id": self._get_history_id_field(),
         }
+        if self.m2m_storage == "delta":
+            extra_fields["m2m_history_op"] = models.CharField(
+                max_length=1,
+                choices=(("=", _("Snapshot")), ("+", _("Added")), ("-", _("Removed"))),
+                default="=",
+                editable=False,
+            )
 
         return extra_fields
 
@@ -510,9 +1196,7 @@ class HistoricalRecords:
             )
 
         def get_instance(self):
-            attrs = {
-                field.attname: getattr(self, field.attname) for field in fields.values()
-            }
+            attrs = self._history_write_plan.get_attrs(self)
             if self._history_excluded_fields:
                 # We don't add ManyToManyFields to this list because they may cause
                 # the subsequent `.get()` call to fail. See #706 for context.
@@ -540,23 +1224,13 @@ class HistoricalRecords:
             """
             Get the next history record for the instance. `None` if last.
             """
-            history = utils.get_history_manager_from_history(self)
-            return (
-                history.filter(history_date__gt=self.history_date)
-                .order_by("history_date")
-                .first()
-            )
+            return get_neighbor_record(self, "next")
 
         def get_prev_record(self):
             """
             Get the previous history record for the instance. `None` if first.
             """
-            history = utils.get_history_manager_from_history(self)
-            return (
-                history.filter(history_date__lt=self.history_date)
-                .order_by("history_date")
-                .last()
-            )
+            return get_neighbor_record(self, "prev")
 
         def get_default_history_user(instance):
             """
@@ -585,13 +1259,41 @@ class HistoricalRecords:
                 self.history_object, self.history_date
             ),
             "get_default_history_user": staticmethod(get_default_history_user),
+            "_history_user_depends_on_instance": self.get_user is not _default_get_user,
         }
 
         extra_fields.update(self._get_history_related_field(model))
         extra_fields.update(self._get_history_user_fields())
+        extra_fields.update(self._get_history_storage_fields())
 
         return extra_fields
 
+    def _get_history_storage_fields(self):
+        """
+        Return the fields needed by the ``storage``, ``m2m_storage`` and
+        ``valid_until`` options
+        """
+        fields = {}
+        if self.m2m_storage == "delta":
+            # Whether the m2m rows of the record are a full copy of the through rows,
+            # instead of the rows added and removed since the previous record
+            fields["history_m2m_keyframe"] = models.BooleanField(
+                default=False, editable=False
+            )
+        if self.storage == "delta":
+            # The attnames of the fields stored by a delta record, or null for
+            # keyframes, which store all fields
+            fields["history_changed_fields"] = models.JSONField(
+                null=True, blank=True, editable=False
+            )
+        if self.valid_until:
+            # The date of the next record of the same object, or null for the
+            # latest one
+            fields["history_valid_until"] = models.DateTimeField(
+                null=True, blank=True, editable=False
+            )
+        return fields
+
     @property
     def _date_indexing(self):
         """False, True, or 'composite'; default is True"""
@@ -609,6 +1311,25 @@ class HistoricalRecords:
             )
         return result
 
+    @property
+    def _m2m_history_manager(self):
+        """The manager class of the m2m fields of the historical records"""
+        if self.m2m_storage == "delta":
+            return DeltaM2MHistoryManager
+        return HistoryManager
+
+    @property
+    def _buffer_writes(self):
+        """Whether historical records are written in bulk when transactions commit"""
+        if self.storage == "delta":
+            # Each record is encoded against the records already in the database
+            return False
+        if self.coalesce_writes:
+            return True
+        if self.buffered_writes is not None:
+            return self.buffered_writes
+        return getattr(settings, "SIMPLE_HISTORY_BUFFERED_WRITES", False)
+
     def get_meta_options_m2m(self, through_model):
         """
         Returns a dictionary of fields that will be added to
@@ -646,10 +1367,15 @@ class HistoricalRecords:
         meta_fields["verbose_name_plural"] = plural_name
         if self.app:
             meta_fields["app_label"] = self.app
+        indexes = []
         if self._date_indexing == "composite":
-            meta_fields["indexes"] = (
-                models.Index(fields=("history_date", model._meta.pk.attname)),
+            indexes.append(
+                models.Index(fields=("history_date", model._meta.pk.attname))
             )
+        if self.valid_until:
+            indexes.append(models.Index(fields=("history_date", "history_valid_until")))
+        if indexes:
+            meta_fields["indexes"] = tuple(indexes)
         return meta_fields
 
     def post_save(self, instance, created, using=None, **kwargs):
@@ -658,15 +1384,69 @@ class HistoricalRecords:
         if hasattr(instance, "skip_history_when_saving"):
             return
 
-        if not kwargs.get("raw", False):
+        if kwargs.get("raw", False):
+            return
+        if self.skip_unchanged_saves:
+            save_counts = self.get_write_plan(
+                instance
+            ).history_model.history_save_counts
+            if not created and self.is_unchanged_since_snapshot(instance):
+                save_counts["skipped"] += 1
+                return
+            save_counts["written"] += 1
             self.create_historical_record(instance, created and "+" or "~", using=using)
+            self.take_snapshot(instance)
+        else:
+            self.create_historical_record(instance, created and "+" or "~", using=using)
+
+    def take_snapshot(self, instance, **kwargs):
+        """
+        Store the current values of the instance's history-tracked fields, which
+        ``post_save()`` compares against to skip saves that didn't change anything.
+        """
+        values = instance.__dict__
+        snapshot = {}
+        for attname in self.get_write_plan(instance).attnames:
+            # Deferred fields are left out, to avoid querying for them
+            if attname in values:
+                value = values[attname]
+                if isinstance(value, (dict, list, set)):
+                    # Would otherwise compare equal after being modified in place
+                    value = copy.deepcopy(value)
+                snapshot[attname] = value
+        instance._history_snapshot = snapshot
+
+    def pre_save(self, instance, **kwargs):
+        if instance._state.adding:
+            # The snapshot was not taken of values loaded from the database
+            instance.__dict__.pop("_history_snapshot", None)
+
+    def is_unchanged_since_snapshot(self, instance):
+        try:
+            snapshot = instance._history_snapshot
+        except AttributeError:
+            return False
+        values = instance.__dict__
+        for attname in self.get_write_plan(instance).attnames:
+            if attname in snapshot:
+                if attname not in values or values[attname] != snapshot[attname]:
+                    return False
+            elif attname in values:
+                # Was deferred when the snapshot was taken
+                return False
+        return True
 
     def post_delete(self, instance, using=None, **kwargs):
         if not getattr(settings, "SIMPLE_HISTORY_ENABLED", True):
             return
+        if self.is_history_deleted_in_bulk(instance):
+            return
         if self.cascade_delete_history:
             manager = getattr(instance, self.manager_name)
             manager.using(using).all().delete()
+            self.get_write_plan(instance).refresh_latest_records(
+                using or router.db_for_write(manager.model), pks=[instance.pk]
+            )
         else:
             self.create_historical_record(instance, "-", using=using)
 
@@ -679,14 +1459,21 @@ class HistoricalRecords:
             return
         if not hasattr(instance._meta, "simple_history_manager_attribute"):
             return
-        fields = self.fields_included(instance)
-        field_attrs = {field.attname for field in fields}
+        if self.is_history_deleted_in_bulk(instance):
+            return
         deferred_attrs = instance.get_deferred_fields()
         # Load all deferred fields that are present in fields_included
-        fields = field_attrs.intersection(deferred_attrs)
+        fields = deferred_attrs.intersection(self.get_write_plan(instance).attnames)
         if fields:
             instance.refresh_from_db(fields=fields)
 
+    def is_history_deleted_in_bulk(self, instance):
+        """
+        Return whether the history of ``instance`` being deleted is written (or
+        deleted) for all the deleted objects at once, by ``delete_with_history()``.
+        """
+        return type(instance) in getattr(self.context, "bulk_history_deletes", ())
+
     def get_change_reason_for_object(self, instance, history_type, using):
         """
         Get change reason for object.
@@ -704,27 +1491,54 @@ class HistoricalRecords:
             # It should be safe to ~ this since the row must exist to modify m2m on it
             self.create_historical_record(instance, "~")
 
-    def create_historical_record_m2ms(self, history_instance, instance):
+    def get_m2m_through_values(self, history_instance, instance):
+        """
+        Return the current through rows of the m2m fields of ``instance``,
+        as a dict mapping each m2m field to a list of dicts of field values.
+        """
+        through_values = {}
         for field in history_instance._history_m2m_fields:
-            m2m_history_model = self.m2m_models[field]
-            original_instance = history_instance.instance
-            through_model = getattr(original_instance, field.name).through
+            through_model = field.remote_field.through
             through_model_field_names = [f.name for f in through_model._meta.fields]
             through_model_fk_field_names = [
                 f.name for f in through_model._meta.fields if isinstance(f, ForeignKey)
             ]
 
-            insert_rows = []
-
             through_field_name = utils.get_m2m_field_name(field)
             rows = through_model.objects.filter(**{through_field_name: instance})
             rows = rows.select_related(*through_model_fk_field_names)
-            for row in rows:
-                insert_row = {"history": history_instance}
+            through_values[field] = [
+                {
+                    field_name: getattr(row, field_name)
+                    for field_name in through_model_field_names
+                }
+                for row in rows
+            ]
+        return through_values
 
-                for field_name in through_model_field_names:
-                    insert_row[field_name] = getattr(row, field_name)
-                insert_rows.append(m2m_history_model(**insert_row))
+    def create_historical_record_m2ms(
+        self, history_instance, instance, through_values=None
+    ):
+        """
+        Create the historical m2m records of ``history_instance``, from
+        ``through_values`` (as returned by ``get_m2m_through_values()``) if given,
+        or else from the current through rows of ``instance``.
+        """
+        if through_values is None:
+            through_values = self.get_m2m_through_values(history_instance, instance)
+        previous_chain = None
+        if self.m2m_storage == "delta" and history_instance._history_m2m_fields:
+            previous_chain = self.get_previous_m2m_chain(history_instance)
+        for field in history_instance._history_m2m_fields:
+            m2m_history_model = self.m2m_models[field]
+            insert_rows = [
+                m2m_history_model(history=history_instance, **values)
+                for values in through_values.get(field, [])
+            ]
+            if previous_chain is not None:
+                insert_rows = self.get_m2m_delta_rows(
+                    m2m_history_model, previous_chain, insert_rows, history_instance
+                )
 
             pre_create_historical_m2m_records.send(
                 sender=m2m_history_model,
@@ -742,6 +1556,98 @@ class HistoricalRecords:
                 field=field,
             )
 
+    def get_previous_m2m_chain(self, history_instance):
+        """
+        Return the primary keys of the historical records whose m2m rows make up the
+        m2m fields of the record before ``history_instance`` - or ``None`` if the
+        m2m rows of ``history_instance`` should instead be stored in full, in which
+        case it's marked as a keyframe.
+        """
+        chain = None
+        if not history_instance.history_m2m_keyframe:
+            chain = get_m2m_chain(history_instance, inclusive=False)
+        if chain is None or len(chain) >= self.m2m_keyframe_interval:
+            if not history_instance.history_m2m_keyframe:
+                history_instance.history_m2m_keyframe = True
+                type(history_instance)._default_manager.filter(
+                    pk=history_instance.pk
+                ).update(history_m2m_keyframe=True)
+            return None
+        return chain
+
+    def get_m2m_delta_rows(self, m2m_history_model, chain, rows, history_instance):
+        """
+        Return the rows to store for the through rows ``rows``, if the state of the
+        m2m field before them is made up of the m2m rows of ``chain``: the rows
+        that were added, and copies of the rows that were removed.
+        """
+        previous_rows = get_m2m_state(m2m_history_model, chain)
+        key_attnames = get_m2m_key_attnames(m2m_history_model)
+        delta_rows = []
+        current_keys = set()
+        for row in rows:
+            key = tuple(getattr(row, attname) for attname in key_attnames)
+            current_keys.add(key)
+            if key not in previous_rows:
+                row.m2m_history_op = "+"
+                delta_rows.append(row)
+        for key, values in previous_rows.items():
+            if key not in current_keys:
+                del values["m2m_history_id"]
+                delta_rows.append(
+                    m2m_history_model(
+                        history=history_instance, m2m_history_op="-", **values
+                    )
+                )
+        return delta_rows
+
+    def encode_delta(self, history_instance):
+        """
+        Turn ``history_instance`` into a delta record, by emptying the fields that
+        didn't change since the previous record of the object - unless it should be
+        stored as a keyframe. Return the values of the emptied fields.
+        """
+        if history_instance.history_type == "+":
+            return {}
+        history_model = type(history_instance)
+        pk_attname = history_model.instance_type._meta.pk.attname
+        attnames = get_delta_attnames(history_model)
+        # If there's no keyframe among the previous `keyframe_interval - 1` records,
+        # this record should be a keyframe
+        previous_records = list(
+            history_model._default_manager.filter(
+                **{pk_attname: getattr(history_instance, pk_attname)}
+            )
+            .order_by("-history_date", "-history_id")
+            .values("history_changed_fields", *attnames)[: self.keyframe_interval - 1]
+        )
+        for index, record in enumerate(previous_records):
+            if record["history_changed_fields"] is None:
+                chain = previous_records[index::-1]
+                break
+        else:
+            return {}
+
+        previous_values = {}
+        for record in chain:
+            changed_fields = record["history_changed_fields"]
+            if changed_fields is None:
+                changed_fields = attnames
+            for attname in changed_fields:
+                previous_values[attname] = record[attname]
+
+        unchanged_values = {}
+        changed_fields = []
+        for attname in attnames:
+            value = getattr(history_instance, attname)
+            if attname in previous_values and value == previous_values[attname]:
+                unchanged_values[attname] = value
+                setattr(history_instance, attname, None)
+            else:
+                changed_fields.append(attname)
+        history_instance.history_changed_fields = changed_fields
+        return unchanged_values
+
     def create_historical_record(self, instance, history_type, using=None):
         using = using if self.use_base_model_db else None
         history_date = getattr(instance, "_history_date", timezone.now())
@@ -749,26 +1655,26 @@ class HistoricalRecords:
         history_change_reason = self.get_change_reason_for_object(
             instance, history_type, using
         )
-        manager = getattr(instance, self.manager_name)
+        write_plan = self.get_write_plan(instance)
+        history_model = write_plan.history_model
 
-        attrs = {}
-        for field in self.fields_included(instance):
-            attrs[field.attname] = getattr(instance, field.attname)
-
-        relation_field = getattr(manager.model, "history_relation", None)
-        if relation_field is not None:
+        attrs = write_plan.get_attrs(instance)
+        if write_plan.has_history_relation:
             attrs["history_relation"] = instance
 
-        history_instance = manager.model(
+        history_instance = history_model(
             history_date=history_date,
             history_type=history_type,
             history_user=history_user,
             history_change_reason=history_change_reason,
             **attrs,
         )
+        if self.m2m_storage == "delta":
+            # Created and deleted objects start over with a (possibly empty) keyframe
+            history_instance.history_m2m_keyframe = history_type != "~"
 
         pre_create_historical_record.send(
-            sender=manager.model,
+            sender=history_model,
             instance=instance,
             history_date=history_date,
             history_user=history_user,
@@ -776,12 +1682,66 @@ class HistoricalRecords:
             history_instance=history_instance,
             using=using,
         )
+        save_deduplicated_values(
+            [history_instance],
+            using=using
+            or router.db_for_write(history_model, instance=history_instance),
+        )
+
+        if self.history_writer is not None:
+            self.history_writer.write(
+                PendingHistoricalRecord(
+                    self,
+                    instance,
+                    history_instance,
+                    dict(
+                        history_date=history_date,
+                        history_user=history_user,
+                        history_change_reason=history_change_reason,
+                        using=using,
+                    ),
+                )
+            )
+            return
 
-        history_instance.save(using=using)
+        if self._buffer_writes:
+            write_buffer = HistoricalRecordsWriteBuffer.for_instance(instance)
+            if write_buffer is not None:
+                write_buffer.add(
+                    self,
+                    instance,
+                    history_instance,
+                    history_date=history_date,
+                    history_user=history_user,
+                    history_change_reason=history_change_reason,
+                    using=using,
+                )
+                return
+
+        unchanged_values = {}
+        if self.storage == "delta":
+            unchanged_values = self.encode_delta(history_instance)
+        write_plan.close_previous_records(
+            [history_instance],
+            using=using
+            or router.db_for_write(history_model, instance=history_instance),
+        )
+        if self.direct_insert and write_plan.can_insert_directly():
+            write_plan.insert(
+                history_instance,
+                using=using
+                or router.db_for_write(history_model, instance=history_instance),
+            )
+        else:
+            history_instance.save(using=using)
+        write_plan.update_latest_records([history_instance], history_instance._state.db)
+        write_plan.refresh_checkpoints([history_instance], history_instance._state.db)
+        for attname, value in unchanged_values.items():
+            setattr(history_instance, attname, value)
         self.create_historical_record_m2ms(history_instance, instance)
 
         post_create_historical_record.send(
-            sender=manager.model,
+            sender=history_model,
             instance=instance,
             history_instance=history_instance,
             history_date=history_date,
@@ -790,6 +1750,14 @@ class HistoricalRecords:
             using=using,
         )
 
+    def get_write_plan(self, instance):
+        """Return the ``HistoryWritePlan`` of the historical model of ``instance``."""
+        try:
+            return self._write_plans[type(instance)]
+        except KeyError:
+            # E.g. a proxy model
+            return getattr(instance, self.manager_name).model._history_write_plan
+
     def get_history_user(self, instance):
         """Get the modifying user from instance or middleware."""
         try:
@@ -816,6 +1784,614 @@ class HistoricalRecords:
         return [getattr(model, field_name).field for field_name in field_names]
 
 
+def get_neighbor_record(history_instance, prefix):
+    """
+    Return the previous (``prefix="prev"``) or next (``prefix="next"``) historical
+    record of the same object as ``history_instance``, or ``None``. It's taken from
+    the records fetched with ``history_instance``, if their queryset was annotated by
+    ``with_neighbors()``.
+    """
+    neighbors = getattr(history_instance, "_history_neighbors", None)
+    if neighbors is not None:
+        attname = history_instance._meta.pk.attname
+        return neighbors.get(getattr(history_instance, f"{prefix}_{attname}"))
+    history = utils.get_history_manager_from_history(history_instance)
+    # Records at the same date are ordered by primary key, like with_neighbors()
+    pk_name = history_instance._meta.pk.attname
+    lookup = "gt" if prefix == "next" else "lt"
+    records = history.filter(
+        models.Q(**{f"history_date__{lookup}": history_instance.history_date})
+        | models.Q(
+            history_date=history_instance.history_date,
+            **{f"{pk_name}__{lookup}": history_instance.pk},
+        )
+    ).order_by("history_date", pk_name)
+    return records.first() if prefix == "next" else records.last()
+
+
+def get_m2m_chain(history_instance, inclusive=True, using=None):
+    """
+    Return the primary keys of the historical records whose m2m rows make up the
+    m2m fields of ``history_instance`` - or of the record before it, if
+    ``inclusive`` is false - from the latest keyframe onwards, or ``None`` if there
+    is no such keyframe. Only used with ``m2m_storage="delta"``.
+    """
+    history_model = type(history_instance)
+    pk_attname = history_model.instance_type._meta.pk.attname
+    records = (
+        history_model._default_manager.db_manager(using)
+        .filter(
+            **{pk_attname: getattr(history_instance, pk_attname)},
+            history_date__lte=history_instance.history_date,
+        )
+        .order_by("-history_date", "-history_id")
+        .values_list("pk", "history_m2m_keyframe")
+    )
+    return walk_m2m_chain(records.iterator(), history_instance.pk, inclusive)
+
+
+def walk_m2m_chain(records, history_id, inclusive):
+    """
+    Return the chain of the record with the primary key ``history_id`` (see
+    ``get_m2m_chain()``) from the ``(pk, history_m2m_keyframe)`` of the records of
+    its object, newest first.
+    """
+    chain = []
+    found = False
+    for pk, keyframe in records:
+        if not found:
+            found = pk == history_id
+            if not (found and inclusive):
+                continue
+        chain.append(pk)
+        if keyframe:
+            chain.reverse()
+            return chain
+    return None
+
+
+def get_m2m_chains(history_instances, inclusive=True, using=None):
+    """
+    Return the result of ``get_m2m_chain()`` for each of ``history_instances``, by
+    their primary key, with one query per batch of objects.
+    """
+    if not history_instances:
+        return {}
+    history_model = type(history_instances[0])
+    pk_attname = history_model.instance_type._meta.pk.attname
+    using = using or router.db_for_read(history_model)
+    instances_by_pk = defaultdict(list)
+    for history_instance in history_instances:
+        instances_by_pk[getattr(history_instance, pk_attname)].append(history_instance)
+    pks = list(instances_by_pk)
+    batch_size = connections[using].ops.bulk_batch_size([pk_attname], pks) or 1
+
+    chains = {}
+    for start in range(0, len(pks), batch_size):
+        end = start + batch_size
+        batch = pks[start:end]
+        batch_instances = [
+            history_instance for pk in batch for history_instance in instances_by_pk[pk]
+        ]
+        min_date = min(instance.history_date for instance in batch_instances)
+        # The chains end at the latest keyframe strictly before the earliest of the
+        # records at the latest
+        keyframe_dates = (
+            history_model._default_manager.filter(
+                **{pk_attname: models.OuterRef(pk_attname)},
+                history_m2m_keyframe=True,
+                history_date__lt=min_date,
+            )
+            .order_by("-history_date")
+            .values("history_date")[:1]
+        )
+        rows = (
+            history_model._default_manager.using(using)
+            .filter(
+                **{f"{pk_attname}__in": batch},
+                history_date__lte=max(
+                    instance.history_date for instance in batch_instances
+                ),
+            )
+            .alias(
+                _history_keyframe_date=Coalesce(
+                    models.Subquery(keyframe_dates), models.F("history_date")
+                )
+            )
+            .filter(history_date__gte=models.F("_history_keyframe_date"))
+            .order_by("-history_date", "-history_id")
+            .values_list(pk_attname, "pk", "history_m2m_keyframe")
+        )
+        records_by_pk = defaultdict(list)
+        for pk, history_id, keyframe in rows:
+            records_by_pk[pk].append((history_id, keyframe))
+        for history_instance in batch_instances:
+            chains[history_instance.pk] = walk_m2m_chain(
+                records_by_pk[getattr(history_instance, pk_attname)],
+                history_instance.pk,
+                inclusive,
+            )
+    return chains
+
+
+def get_m2m_key_attnames(m2m_history_model):
+    """
+    Return the attnames of the through model fields that identify a through row,
+    in ``m2m_history_model``.
+    """
+    return [
+        field.attname
+        for field in m2m_history_model.instance_type._meta.concrete_fields
+        if not field.primary_key
+    ]
+
+
+def get_m2m_state(m2m_history_model, chain, using=None):
+    """
+    Return the values of the through rows recorded by the m2m rows of the
+    historical records ``chain`` (see ``get_m2m_chain()``), keyed by the values
+    of ``get_m2m_key_attnames()``. The values include the ``m2m_history_id`` of the
+    m2m row that added the through row.
+    """
+    return get_m2m_states(m2m_history_model, {None: chain}, using)[None]
+
+
+def get_m2m_states(m2m_history_model, chains, using=None):
+    """
+    Return the result of ``get_m2m_state()`` for each of the ``chains``, by their
+    key, with one query per batch of historical records.
+    """
+    through_attnames = [
+        field.attname for field in m2m_history_model.instance_type._meta.concrete_fields
+    ]
+    key_attnames = get_m2m_key_attnames(m2m_history_model)
+    using = using or router.db_for_read(m2m_history_model)
+    history_ids = list({pk for chain_ids in chains.values() for pk in chain_ids})
+    batch_size = connections[using].ops.bulk_batch_size(["history"], history_ids) or 1
+    rows_by_history_id = defaultdict(list)
+    for start in range(0, len(history_ids), batch_size):
+        end = start + batch_size
+        for row in (
+            m2m_history_model._default_manager.using(using)
+            .filter(history__in=history_ids[start:end])
+            .values("m2m_history_id", "history_id", "m2m_history_op", *through_attnames)
+        ):
+            rows_by_history_id[row.pop("history_id")].append(row)
+    states = {}
+    for key, chain_ids in chains.items():
+        state = {}
+        for history_id in chain_ids:
+            for row in rows_by_history_id[history_id]:
+                row_key = tuple(row[attname] for attname in key_attnames)
+                if row["m2m_history_op"] == "-":
+                    state.pop(row_key, None)
+                else:
+                    state[row_key] = {
+                        attname: value
+                        for attname, value in row.items()
+                        if attname != "m2m_history_op"
+                    }
+        states[key] = state
+    return states
+
+
+class DeltaM2MHistoryManager(HistoryManager):
+    """
+    The manager of the m2m historical records of a historical record, with
+    ``m2m_storage="delta"``: returns the m2m rows that added each through row
+    present at the time of the historical record, which belong to that record or
+    to one of the records before it.
+    """
+
+    def get_queryset(self):
+        if self.instance is None:
+            return self.get_super_queryset()
+        chain = get_m2m_chain(self.instance) or []
+        m2m_history_ids = [
+            row["m2m_history_id"] for row in get_m2m_state(self.model, chain).values()
+        ]
+        return self.get_super_queryset().filter(m2m_history_id__in=m2m_history_ids)
+
+
+@dataclass(eq=False)
+class PendingHistoricalRecord:
+    """A historical record that has been created, but not inserted yet."""
+
+    records: HistoricalRecords
+    instance: models.Model
+    history_instance: models.Model
+    signal_kwargs: dict
+    # The through rows of the m2m fields when the record was created,
+    # as returned by ``HistoricalRecords.get_m2m_through_values()``
+    through_values: dict = None
+    savepoint_ids: frozenset = frozenset()
+    committed: bool = False
+
+
+class HistoricalRecordsWriteBuffer:
+    """
+    Collects the historical records created inside a transaction, and inserts them
+    with one ``bulk_create()`` per historical model once the transaction commits.
+
+    Records created inside a savepoint that is rolled back are discarded together
+    with the savepoint.
+    """
+
+    def __init__(self, using):
+        self.using = using
+        self.entries = []
+
+    @classmethod
+    def for_instance(cls, instance):
+        """
+        Return the buffer of the database that ``instance`` was saved to,
+        or ``None`` if that database is not inside a transaction.
+        """
+        using = instance._state.db or router.db_for_write(
+            type(instance), instance=instance
+        )
+        if not transaction.get_connection(using).in_atomic_block:
+            return None
+        buffers = getattr(HistoricalRecords.context, "write_buffers", None)
+        if buffers is None:
+            buffers = HistoricalRecords.context.write_buffers = {}
+        write_buffer = buffers.get(using)
+        if write_buffer is None:
+            write_buffer = buffers[using] = cls(using)
+        return write_buffer
+
+    def add(self, records, instance, history_instance, **signal_kwargs):
+        through_values = None
+        if instance.pk is not None and not records.coalesce_writes:
+            # Later changes to the m2m fields in the transaction must not leak
+            # into this record. The m2m rows of coalesced records are read when
+            # they're inserted, as only the last record of each object is kept.
+            through_values = records.get_m2m_through_values(history_instance, instance)
+        connection = transaction.get_connection(self.using)
+        entry = PendingHistoricalRecord(
+            records,
+            instance,
+            history_instance,
+            signal_kwargs,
+            through_values=through_values,
+            savepoint_ids=frozenset(
+                sid for sid in connection.savepoint_ids if sid is not None
+            ),
+        )
+        self.entries.append(entry)
+        # Django discards the on-commit hooks registered inside a savepoint when
+        # the savepoint is rolled back, so only the records that survive get
+        # committed
+        transaction.on_commit(partial(self.commit, entry), using=self.using)
+
+    def commit(self, entry):
+        """
+        Mark ``entry`` as committed, and insert the committed records unless the
+        next record is certain to be committed as well.
+        """
+        entry.committed = True
+        index = self.entries.index(entry)
+        if index + 1 < len(self.entries):
+            # The savepoints of this record have all been released, so the next
+            # record will be committed too if it wasn't created in other savepoints
+            next_entry = self.entries[index + 1]
+            if next_entry.savepoint_ids <= entry.savepoint_ids:
+                return
+        self.flush(index + 1)
+
+    def flush(self, stop=None):
+        """
+        Insert the committed records among the first ``stop`` records (or all of
+        them), and forget about those records.
+        """
+        if stop is None:
+            stop = len(self.entries)
+        entries = [entry for entry in self.entries[:stop] if entry.committed]
+        del self.entries[:stop]
+        if not self.entries:
+            buffers = getattr(HistoricalRecords.context, "write_buffers", {})
+            if buffers.get(self.using) is self:
+                del buffers[self.using]
+
+        write_pending_records(self.coalesce(entries))
+
+    @staticmethod
+    def coalesce(entries):
+        """
+        Return ``entries`` without the created or changed records that are followed
+        by another created or changed record of the same object, for the models with
+        ``coalesce_writes`` enabled. If the object was created in the transaction,
+        the remaining record gets the history type of a creation.
+        """
+        coalesced = []
+        index_by_key = {}
+        for entry in entries:
+            if not entry.records.coalesce_writes:
+                coalesced.append(entry)
+                continue
+            history_instance = entry.history_instance
+            key = (
+                type(history_instance),
+                getattr(history_instance, entry.instance._meta.pk.attname),
+            )
+            if history_instance.history_type == "-":
+                index_by_key.pop(key, None)
+            else:
+                previous_index = index_by_key.get(key)
+                if previous_index is not None:
+                    previous = coalesced[previous_index]
+                    coalesced[previous_index] = None
+                    if previous.history_instance.history_type == "+":
+                        history_instance.history_type = "+"
+                index_by_key[key] = len(coalesced)
+            coalesced.append(entry)
+        return [entry for entry in coalesced if entry is not None]
+
+
+def write_pending_records(entries):
+    """
+    Insert the historical records of ``entries`` (``PendingHistoricalRecord``
+    objects) with one ``bulk_create()`` per historical model and database, then
+    create their historical m2m records and send ``post_create_historical_record``
+    for each of them, in order.
+    """
+    history_instances_by_model = defaultdict(list)
+    for entry in entries:
+        history_instance = entry.history_instance
+        using = entry.signal_kwargs["using"] or router.db_for_write(
+            type(history_instance), instance=history_instance
+        )
+        history_instances_by_model[type(history_instance), using].append(
+            history_instance
+        )
+    for (history_model, using), history_instances in history_instances_by_model.items():
+        insert_historical_records(history_model, history_instances, using)
+
+    for entry in entries:
+        if entry.through_values is not None:
+            entry.records.create_historical_record_m2ms(
+                entry.history_instance, entry.instance, entry.through_values
+            )
+        elif entry.instance.pk is not None:
+            entry.records.create_historical_record_m2ms(
+                entry.history_instance, entry.instance
+            )
+        post_create_historical_record.send(
+            sender=type(entry.history_instance),
+            instance=entry.instance,
+            history_instance=entry.history_instance,
+            **entry.signal_kwargs,
+        )
+
+
+def insert_historical_records(history_model, history_instances, using):
+    """
+    Insert ``history_instances`` into the database ``using``, setting their
+    primary keys.
+    """
+    history_model._history_write_plan.close_previous_records(history_instances, using)
+    connection = transaction.get_connection(using)
+    if (
+        connection.features.can_return_rows_from_bulk_insert
+        or history_model._meta.pk.has_default()
+    ):
+        history_model._default_manager.using(using).bulk_create(history_instances)
+    else:
+        # The historical m2m records and the signal receivers need the
+        # primary keys, which `bulk_create()` can't set on this backend
+        for history_instance in history_instances:
+            history_instance.save(using=using)
+    history_model._history_write_plan.update_latest_records(history_instances, using)
+    history_model._history_write_plan.refresh_checkpoints(history_instances, using)
+
+
+def create_history_checkpoint(history_model, date, using, pks=None, batch_size=1000):
+    """
+    Store which historical record of each object - or of the objects with the
+    primary keys ``pks`` - was valid at ``date`` (excluding deleted objects), in
+    the model of the ``checkpoints`` option, replacing the checkpoint at the same
+    date if any. Returns the number of stored rows.
+    """
+    checkpoint_model = history_model._history_checkpoint_model
+    pk_attname = history_model.instance_type._meta.pk.attname
+    records = history_model._default_manager.db_manager(using).filter(
+        history_date__lte=date
+    )
+    checkpoint_rows = checkpoint_model._default_manager.using(using).filter(
+        checkpoint_date=date
+    )
+    if pks is not None:
+        records = records.filter(**{f"{pk_attname}__in": pks})
+        checkpoint_rows = checkpoint_rows.filter(**{f"{pk_attname}__in": pks})
+    history_pk_attname = history_model._meta.pk.attname
+    # Records with the same date are ordered by their primary keys, so that only
+    # one of them is stored
+    later_records = records.filter(
+        models.Q(history_date__gt=models.OuterRef("history_date"))
+        | models.Q(
+            history_date=models.OuterRef("history_date"),
+            **{f"{history_pk_attname}__gt": models.OuterRef(history_pk_attname)},
+        ),
+        **{pk_attname: models.OuterRef(pk_attname)},
+    )
+    valid_records = (
+        records.filter(~models.Exists(later_records))
+        .exclude(history_type="-")
+        .order_by()
+        .values_list(pk_attname, history_pk_attname)
+    )
+    count = 0
+    with transaction.atomic(using=using):
+        checkpoint_rows.delete()
+        rows = valid_records.iterator(chunk_size=batch_size)
+        while batch := list(islice(rows, batch_size)):
+            checkpoint_model._default_manager.using(using).bulk_create(
+                checkpoint_model(
+                    checkpoint_date=date, **{pk_attname: pk}, history_id=history_id
+                )
+                for pk, history_id in batch
+            )
+            count += len(batch)
+    return count
+
+
+def refresh_history_checkpoints(history_model, using, pks):
+    """
+    Recreate the rows of the checkpoints of the objects with the primary keys
+    ``pks``, after some of their historical records were deleted. Does nothing if
+    the model doesn't use the ``checkpoints`` option.
+    """
+    checkpoint_model = getattr(history_model, "_history_checkpoint_model", None)
+    if checkpoint_model is None:
+        return
+    dates = (
+        checkpoint_model._default_manager.using(using)
+        .values_list("checkpoint_date", flat=True)
+        .distinct()
+    )
+    for date in list(dates):
+        create_history_checkpoint(history_model, date, using, pks=pks)
+
+
+def get_first_remaining_records(history_model, deleted_records, using):
+    """
+    Return a queryset of the earliest historical record of each object with records
+    in ``deleted_records`` - a queryset of records about to be deleted - among the
+    records that aren't in it.
+    """
+    pk_attname = history_model.instance_type._meta.pk.attname
+    history_pk_attname = history_model._meta.pk.attname
+    remaining_records = (
+        history_model._default_manager.using(using)
+        .filter(**{f"{pk_attname}__in": deleted_records.values(pk_attname)})
+        .exclude(**{f"{history_pk_attname}__in": deleted_records.values("pk")})
+    )
+    earlier_records = remaining_records.filter(
+        models.Q(history_date__lt=models.OuterRef("history_date"))
+        | models.Q(
+            history_date=models.OuterRef("history_date"),
+            **{f"{history_pk_attname}__lt": models.OuterRef(history_pk_attname)},
+        ),
+        **{pk_attname: models.OuterRef(pk_attname)},
+    )
+    return remaining_records.filter(~models.Exists(earlier_records)).order_by(
+        history_pk_attname
+    )
+
+
+def make_history_keyframes(history_model, deleted_records, using, batch_size=1000):
+    """
+    Turn the earliest remaining historical record of each object with records in
+    ``deleted_records`` - a queryset of records about to be deleted - into a
+    keyframe that doesn't depend on them: with ``storage="delta"``, the fields it
+    left empty are filled in, and with ``m2m_storage="delta"``, its m2m rows are
+    replaced by a full copy of the through rows present at its time.
+    """
+    make_m2m_keyframes(history_model, deleted_records, using, batch_size)
+    if getattr(history_model, "_history_storage", None) != "delta":
+        return
+    from .manager import get_delta_record_values
+
+    attnames = get_delta_attnames(history_model)
+    records = get_first_remaining_records(history_model, deleted_records, using).filter(
+        history_changed_fields__isnull=False
+    )
+    with transaction.atomic(using=using):
+        # The rewritten records don't match `records` anymore
+        while batch := list(records[:batch_size]):
+            values_by_history_id = get_delta_record_values(history_model, batch, using)
+            for record in batch:
+                for attname, value in values_by_history_id[record.pk].items():
+                    setattr(record, attname, value)
+                record.history_changed_fields = None
+            history_model._default_manager.using(using).bulk_update(
+                batch, [*attnames, "history_changed_fields"]
+            )
+
+
+def make_m2m_keyframes(history_model, deleted_records, using, batch_size=1000):
+    """
+    Replace the m2m rows of the earliest remaining historical record of each object
+    with records in ``deleted_records`` by a full copy of the through rows present
+    at its time - stored as ``=`` rows - and mark it as a keyframe, if the model
+    uses ``m2m_storage="delta"``.
+    """
+    if not history_model._history_m2m_fields or not hasattr(
+        history_model, "history_m2m_keyframe"
+    ):
+        return
+    m2m_history_models = [
+        getattr(history_model, field.name).model
+        for field in history_model._history_m2m_fields
+    ]
+    records = get_first_remaining_records(history_model, deleted_records, using).filter(
+        history_m2m_keyframe=False
+    )
+    with transaction.atomic(using=using):
+        # The rewritten records don't match `records` anymore
+        while batch := list(records[:batch_size]):
+            chains = {
+                pk: chain or []
+                for pk, chain in get_m2m_chains(batch, using=using).items()
+            }
+            for m2m_history_model in m2m_history_models:
+                m2m_rows = []
+                states = get_m2m_states(m2m_history_model, chains, using)
+                for record in batch:
+                    for values in states[record.pk].values():
+                        del values["m2m_history_id"]
+                        m2m_rows.append(
+                            m2m_history_model(
+                                history=record, m2m_history_op="=", **values
+                            )
+                        )
+                m2m_manager = m2m_history_model._default_manager.using(using)
+                m2m_manager.filter(history__in=batch).delete()
+                m2m_manager.bulk_create(m2m_rows)
+            history_model._default_manager.using(using).filter(
+                pk__in=[record.pk for record in batch]
+            ).update(history_m2m_keyframe=True)
+
+
+def delete_orphaned_blobs(history_model, using):
+    """
+    Delete the values of the ``deduplicated_fields`` that no historical record
+    refers to anymore, and return their number. Does nothing if the model has no
+    ``deduplicated_fields``.
+    """
+    blob_model = getattr(history_model, "_history_blob_model", None)
+    if blob_model is None:
+        return 0
+    used = models.Q()
+    for name in history_model._history_deduplicated_fields:
+        used |= models.Exists(
+            history_model._default_manager.filter(
+                **{f"{name}_digest": models.OuterRef("digest")}
+            )
+        )
+    count, _ = blob_model._default_manager.using(using).exclude(used).delete()
+    return count
+
+
+def delete_history_checkpoints(history_model, using, before=None):
+    """
+    Delete the checkpoints dated before ``before``, and the rows of the other
+    checkpoints whose historical records were deleted. Does nothing if the model
+    doesn't use the ``checkpoints`` option.
+    """
+    checkpoint_model = getattr(history_model, "_history_checkpoint_model", None)
+    if checkpoint_model is None:
+        return
+    checkpoint_rows = checkpoint_model._default_manager.using(using)
+    if before is not None:
+        checkpoint_rows.filter(checkpoint_date__lt=before).delete()
+    checkpoint_rows.exclude(
+        models.Exists(
+            history_model._default_manager.filter(pk=models.OuterRef("history"))
+        )
+    ).delete()
+
+
 def transform_field(field):
     """Customize field appropriately for use in historical model"""
     field.name = field.attname
@@ -1022,11 +2598,12 @@ class HistoricalObjectDescriptor:
     def __init__(self, model, fields_included):
         self.model = model
         self.fields_included = fields_included
+        self.attnames = tuple(field.attname for field in fields_included)
 
     def __get__(self, instance, owner):
         if instance is None:
             return self
-        values = {f.attname: getattr(instance, f.attname) for f in self.fields_included}
+        values = {attname: getattr(instance, attname) for attname in self.attnames}
         return self.model(**values)
 
 
@@ -1097,6 +2674,19 @@ class HistoricalChanges(ModelTypeHint):
         """Helper method for ``diff_against()``."""
         changes = []
 
+        deduplicated_fields = set(fields).intersection(
+            getattr(self, "_history_deduplicated_fields", ())
+        )
+        fields = set(fields).difference(deduplicated_fields)
+        for field in deduplicated_fields:
+            # Only load the values of the fields whose digests differ
+            digest_attname = f"{field}_digest"
+            if getattr(old_history, digest_attname) != getattr(self, digest_attname):
+                change = ModelChange(
+                    field, getattr(old_history, field), getattr(self, field)
+                )
+                changes.append(change)
+
         old_values = model_to_dict(old_history, fields=fields)
         new_values = model_to_dict(self, fields=fields)
 
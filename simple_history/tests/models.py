@@ -15,6 +15,7 @@ from simple_history.models import (
     HistoricForeignKey,
     HistoricOneToOneField,
 )
+from simple_history.writers import OutboxHistoryWriter, QueueHistoryWriter
 
 from .custom_user.models import CustomUser as User
 from .external.models import AbstractExternal, AbstractExternal2, AbstractExternal3
@@ -120,6 +121,82 @@ class IPAddressHistoricalModel(models.Model):
         abstract = True
 
 
+class PollWithBufferedWrites(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+    places = models.ManyToManyField("Place")
+
+    history = HistoricalRecords(m2m_fields=[places], buffered_writes=True)
+
+
+class PollWithCoalescedWrites(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+    places = models.ManyToManyField("Place")
+
+    history = HistoricalRecords(m2m_fields=[places], coalesce_writes=True)
+
+
+class PollWithSkipUnchangedSaves(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+    settings = models.JSONField(default=dict)
+
+    history = HistoricalRecords(skip_unchanged_saves=True)
+
+
+class PollWithDirectInsert(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+
+    history = HistoricalRecords(direct_insert=True)
+
+
+class TimestampedHistoricalModel(models.Model):
+    history_recorded_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+
+class PollWithDirectInsertAndTimestamp(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+
+    history = HistoricalRecords(direct_insert=True, bases=[TimestampedHistoricalModel])
+
+
+def get_poll_author(instance, **kwargs):
+    return instance.author
+
+
+class PollWithUserFromInstance(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True
+    )
+
+    history = HistoricalRecords(get_user=get_poll_author)
+
+
+poll_history_queue = QueueHistoryWriter(workers=2, start_workers=False)
+
+
+class PollWithQueuedHistory(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+
+    history = HistoricalRecords(history_writer=poll_history_queue)
+
+
+class PollWithHistoryOutbox(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+
+    history = HistoricalRecords(history_writer=OutboxHistoryWriter())
+
+
 class PollWithHistoricalIPAddress(models.Model):
     question = models.CharField(max_length=200)
     pub_date = models.DateTimeField("date published")
@@ -150,6 +227,68 @@ class PollWithManyToMany(models.Model):
     history = HistoricalRecords(m2m_fields=[places])
 
 
+class PollWithDeltaManyToMany(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+    places = models.ManyToManyField("Place")
+
+    history = HistoricalRecords(
+        m2m_fields=[places], m2m_storage="delta", m2m_keyframe_interval=3
+    )
+
+
+class PollWithDeltaStorage(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+    status = models.CharField(max_length=20, default="open")
+
+    history = HistoricalRecords(storage="delta", keyframe_interval=3)
+
+
+class DocumentWithCompressedHistory(models.Model):
+    title = models.CharField(max_length=200)
+    body = models.TextField()
+    data = models.JSONField(default=dict)
+
+    history = HistoricalRecords(compressed_fields=["body", "data"], compression="lzma")
+
+
+class DocumentWithDeduplicatedHistory(models.Model):
+    title = models.CharField(max_length=200)
+    body = models.TextField()
+    data = models.JSONField(null=True, blank=True)
+
+    history = HistoricalRecords(deduplicated_fields=["body", "data"])
+
+
+class PollWithValidUntil(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+
+    history = HistoricalRecords(valid_until=True)
+
+
+class PollWithBufferedWritesAndValidUntil(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+
+    history = HistoricalRecords(buffered_writes=True, valid_until=True)
+
+
+class PollWithLatestTable(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+
+    history = HistoricalRecords(latest_table=True)
+
+
+class PollWithCheckpoints(models.Model):
+    question = models.CharField(max_length=200)
+    pub_date = models.DateTimeField("date published")
+
+    history = HistoricalRecords(checkpoints=True)
+
+
 class PollWithManyToManyCustomHistoryID(models.Model):
     question = models.CharField(max_length=200)
     pub_date = models.DateTimeField("date published")
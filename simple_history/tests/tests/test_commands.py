@@ -1,26 +1,50 @@
+import json
+import os
+import shutil
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from io import StringIO
+from tempfile import mkdtemp
+from unittest.mock import call, patch
 
+from django.contrib.auth import get_user_model
 from django.core import management
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 from simple_history import models as sh_models
 from simple_history.management.commands import (
+    backfill_history_valid_until,
     clean_duplicate_history,
     clean_old_history,
+    compress_history,
+    create_history_checkpoints,
     populate_history,
+    process_history_outbox,
 )
 
 from ..models import (
     Book,
     CustomManagerNameModel,
+    DocumentWithCompressedHistory,
+    DocumentWithDeduplicatedHistory,
     Place,
     Poll,
+    PollWithCheckpoints,
     PollWithCustomManager,
+    PollWithDeltaManyToMany,
+    PollWithDeltaStorage,
     PollWithExcludeFields,
+    PollWithHistoryOutbox,
+    PollWithLatestTable,
+    PollWithUserFromInstance,
+    PollWithValidUntil,
     Restaurant,
 )
+from .test_fields import get_stored_value
+
+User = get_user_model()
 
 
 @contextmanager
@@ -195,6 +219,316 @@ class TestPopulateHistory(TestCase):
         self.assertEqual(initial_history_record.question, poll.question)
 
 
+class TestPopulateHistoryInRanges(TestCase):
+    command_name = "populate_history"
+
+    def setUp(self):
+        Poll.objects.bulk_create(
+            [
+                Poll(id=x, question=f"Question {x}", pub_date=datetime.now())
+                for x in range(1, 6)
+            ]
+        )
+
+    def test_server_side(self):
+        out = StringIO()
+        management.call_command(
+            self.command_name,
+            "tests.poll",
+            server_side=True,
+            range_size=2,
+            stdout=out,
+            stderr=StringIO(),
+        )
+
+        self.assertEqual(
+            sorted(Poll.history.values_list("id", "question", "history_type")),
+            [(x, f"Question {x}", "+") for x in range(1, 6)],
+        )
+        self.assertEqual(Poll.history.values("history_date").distinct().count(), 3)
+        for count, pk in [(2, 2), (2, 4), (1, 5)]:
+            self.assertIn(
+                populate_history.Command.DONE_SAVING_RANGE_FOR_MODEL.format(
+                    count=count, model=Poll, pk=pk
+                ),
+                out.getvalue(),
+            )
+
+    def test_server_side_inserts_each_range_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            management.call_command(
+                self.command_name,
+                "tests.poll",
+                server_side=True,
+                range_size=2,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+
+        inserts = [
+            query["sql"] for query in queries if query["sql"].startswith("INSERT")
+        ]
+        self.assertEqual(len(inserts), 3)
+        self.assertTrue(all("SELECT" in insert for insert in inserts))
+
+    def test_ranges_without_server_side(self):
+        management.call_command(
+            self.command_name,
+            "tests.poll",
+            range_size=2,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+        self.assertEqual(
+            sorted(Poll.history.values_list("id", "question", "history_type")),
+            [(x, f"Question {x}", "+") for x in range(1, 6)],
+        )
+
+    def test_start_pk(self):
+        Poll.history.bulk_history_create(Poll.objects.filter(id__lte=3))
+
+        management.call_command(
+            self.command_name,
+            "tests.poll",
+            server_side=True,
+            start_pk="3",
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+        self.assertEqual(
+            sorted(Poll.history.values_list("id", flat=True)), [1, 2, 3, 4, 5]
+        )
+
+    def test_start_pk_with_several_models(self):
+        with self.assertRaisesMessage(
+            management.CommandError,
+            populate_history.Command.START_PK_WITH_SEVERAL_MODELS,
+        ):
+            management.call_command(
+                self.command_name,
+                "tests.poll",
+                "tests.restaurant",
+                start_pk="3",
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+
+    def test_server_side_multi_table(self):
+        data = {"rating": 5, "name": "Tea 'N More"}
+        Restaurant.objects.create(**data)
+        Restaurant.updates.all().delete()
+
+        management.call_command(
+            self.command_name,
+            "tests.restaurant",
+            server_side=True,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+        update_record = Restaurant.updates.get()
+        for attr, value in data.items():
+            self.assertEqual(getattr(update_record, attr), value)
+
+    def test_server_side_not_supported(self):
+        DocumentWithCompressedHistory.objects.create(title="Title", body="Body")
+        DocumentWithCompressedHistory.history.all().delete()
+        err = StringIO()
+
+        management.call_command(
+            self.command_name,
+            "tests.documentwithcompressedhistory",
+            server_side=True,
+            stdout=StringIO(),
+            stderr=err,
+        )
+
+        self.assertIn(
+            populate_history.Command.SERVER_SIDE_NOT_SUPPORTED.format(
+                model=DocumentWithCompressedHistory
+            ),
+            err.getvalue(),
+        )
+        self.assertEqual(DocumentWithCompressedHistory.history.get().body, "Body")
+
+    def test_server_side_with_user_depending_on_instance(self):
+        user = User.objects.create_user("tester", "tester@example.com")
+        PollWithUserFromInstance.objects.create(
+            question="Question", pub_date=datetime.now(), author=user
+        )
+        PollWithUserFromInstance.history.all().delete()
+        err = StringIO()
+
+        management.call_command(
+            self.command_name,
+            "tests.pollwithuserfrominstance",
+            server_side=True,
+            stdout=StringIO(),
+            stderr=err,
+        )
+
+        self.assertIn(
+            populate_history.Command.SERVER_SIDE_NOT_SUPPORTED.format(
+                model=PollWithUserFromInstance
+            ),
+            err.getvalue(),
+        )
+        self.assertEqual(PollWithUserFromInstance.history.get().history_user, user)
+
+    def test_missing_only(self):
+        Poll.history.bulk_history_create(Poll.objects.filter(id__in=[2, 3]))
+        Poll.objects.get(id=2).save()
+        expected_records = Poll.history.count() + 3
+
+        for server_side in [True, False]:
+            with self.subTest(server_side=server_side):
+                Poll.history.filter(id__in=[1, 4, 5]).delete()
+
+                management.call_command(
+                    self.command_name,
+                    "tests.poll",
+                    missing_only=True,
+                    server_side=server_side,
+                    range_size=2,
+                    stdout=StringIO(),
+                    stderr=StringIO(),
+                )
+
+                self.assertEqual(Poll.history.count(), expected_records)
+                self.assertEqual(
+                    sorted(
+                        Poll.history.filter(history_type="+").values_list(
+                            "id", flat=True
+                        )
+                    ),
+                    [1, 2, 3, 4, 5],
+                )
+
+    def test_missing_only_without_missing_history(self):
+        Poll.history.bulk_history_create(Poll.objects.all())
+        out = StringIO()
+
+        with self.assertNumQueries(2):
+            management.call_command(
+                self.command_name,
+                "tests.poll",
+                missing_only=True,
+                stdout=out,
+                stderr=StringIO(),
+            )
+
+        self.assertEqual(Poll.history.count(), 5)
+        self.assertNotIn(
+            populate_history.Command.EXISTING_HISTORY_FOUND, out.getvalue()
+        )
+
+    @patch("simple_history.management.commands.populate_history.time.sleep")
+    def test_sleep(self, sleep):
+        management.call_command(
+            self.command_name,
+            "tests.poll",
+            server_side=True,
+            range_size=2,
+            sleep=0.5,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+        self.assertEqual(sleep.call_args_list, [call(0.5)] * 3)
+
+
+class TestPopulateHistoryInParallel(TransactionTestCase):
+    command_name = "populate_history"
+
+    def setUp(self):
+        Poll.objects.bulk_create(
+            [
+                Poll(id=x, question=f"Question {x}", pub_date=datetime.now())
+                for x in range(1, 11)
+            ]
+        )
+        Restaurant.objects.create(rating=5, name="Tea 'N More")
+        Restaurant.updates.all().delete()
+        self.checkpoint_path = os.path.join(mkdtemp(), "checkpoint.json")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.checkpoint_path))
+
+    def test_workers(self):
+        out = StringIO()
+        for server_side in [True, False]:
+            with self.subTest(server_side=server_side):
+                Poll.history.all().delete()
+                Restaurant.updates.all().delete()
+
+                management.call_command(
+                    self.command_name,
+                    "tests.poll",
+                    "tests.restaurant",
+                    workers=3,
+                    range_size=2,
+                    server_side=server_side,
+                    stdout=out,
+                    stderr=StringIO(),
+                )
+
+                self.assertEqual(
+                    sorted(Poll.history.values_list("id", "question")),
+                    [(x, f"Question {x}") for x in range(1, 11)],
+                )
+                self.assertEqual(Restaurant.updates.get().name, "Tea 'N More")
+        for model in [Poll, Restaurant]:
+            self.assertIn(
+                populate_history.Command.DONE_SAVING_FOR_MODEL.format(model=model),
+                out.getvalue(),
+            )
+
+    def test_checkpoint(self):
+        management.call_command(
+            self.command_name,
+            "tests.poll",
+            workers=2,
+            range_size=3,
+            checkpoint=self.checkpoint_path,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+        with open(self.checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.assertEqual(
+            checkpoint["tests.Poll"]["ranges"],
+            [[None, 3], [3, 6], [6, 9], [9, 10]],
+        )
+        self.assertEqual(sorted(checkpoint["tests.Poll"]["done"]), [0, 1, 2, 3])
+        self.assertEqual(Poll.history.count(), 10)
+
+    def test_resume_from_checkpoint(self):
+        # A run that stopped after saving the history of the first and third range
+        Poll.history.bulk_history_create(Poll.objects.filter(id__in=[1, 2, 5, 6]))
+        with open(self.checkpoint_path, "w") as checkpoint_file:
+            json.dump(
+                {"tests.Poll": {"ranges": [[None, 2], [2, 4], [4, 6]], "done": [0, 2]}},
+                checkpoint_file,
+            )
+
+        management.call_command(
+            self.command_name,
+            "tests.poll",
+            workers=2,
+            checkpoint=self.checkpoint_path,
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+        self.assertEqual(
+            sorted(Poll.history.values_list("id", flat=True)), [1, 2, 3, 4, 5, 6]
+        )
+        with open(self.checkpoint_path) as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        self.assertEqual(sorted(checkpoint["tests.Poll"]["done"]), [0, 1, 2])
+
+
 class TestCleanDuplicateHistory(TestCase):
     command_name = "clean_duplicate_history"
     command_error = (management.CommandError, SystemExit)
@@ -479,6 +813,54 @@ class TestCleanDuplicateHistory(TestCase):
         )
         self.assertEqual(PollWithExcludeFields.history.all().count(), 1)
 
+    def test_valid_until_is_updated(self):
+        poll = PollWithValidUntil.objects.create(question="A", pub_date=datetime.now())
+        poll.save()
+        poll.question = "B"
+        poll.save()
+
+        management.call_command(
+            self.command_name, "tests.pollwithvaliduntil", stdout=StringIO()
+        )
+
+        first, last = poll.history.order_by("history_date")
+        self.assertEqual(first.history_valid_until, last.history_date)
+        self.assertIsNone(last.history_valid_until)
+
+    def test_orphaned_blobs_are_deleted(self):
+        document = DocumentWithDeduplicatedHistory.objects.create(
+            title="Title", body="Old body"
+        )
+        document.body = "New body"
+        document.save()
+        blob_model = DocumentWithDeduplicatedHistory.history.model._history_blob_model
+
+        management.call_command(
+            self.command_name,
+            "tests.documentwithdeduplicatedhistory",
+            excluded_fields=["body"],
+            stdout=StringIO(),
+        )
+
+        # The newer of the duplicates is deleted
+        self.assertEqual(document.history.get().body, "Old body")
+        self.assertEqual(
+            list(blob_model.objects.values_list("value", flat=True)), ["Old body"]
+        )
+
+    def test_checkpoints_are_updated(self):
+        poll = PollWithCheckpoints.objects.create(question="A", pub_date=datetime.now())
+        poll.save()
+        history_model = PollWithCheckpoints.history.model
+        sh_models.create_history_checkpoint(history_model, datetime.now(), "default")
+
+        management.call_command(
+            self.command_name, "tests.pollwithcheckpoints", stdout=StringIO()
+        )
+
+        checkpoint = history_model._history_checkpoint_model.objects.get()
+        self.assertEqual(checkpoint.history, poll.history.get())
+
 
 class TestCleanOldHistory(TestCase):
     command_name = "clean_old_history"
@@ -679,3 +1061,374 @@ class TestCleanOldHistory(TestCase):
             "<class 'simple_history.tests.models.CustomManagerNameModel'>\n",
         )
         self.assertEqual(CustomManagerNameModel.log.all().count(), 2)
+
+    def test_latest_records_are_updated(self):
+        poll = PollWithLatestTable.objects.create(question="A", pub_date=datetime.now())
+        poll.question = "B"
+        poll.save()
+        history_model = PollWithLatestTable.history.model
+        history_model.objects.filter(question="B").update(
+            history_date=datetime.now() - timedelta(days=40)
+        )
+
+        management.call_command(
+            self.command_name, "tests.pollwithlatesttable", stdout=StringIO()
+        )
+
+        latest = history_model._history_latest_model.objects.get(pk=poll.pk)
+        self.assertEqual(latest.history, poll.history.get())
+        self.assertEqual(latest.history_count, 1)
+
+    def test_remaining_delta_records_become_keyframes(self):
+        poll = PollWithDeltaStorage.objects.create(
+            question="A", pub_date=datetime(2021, 1, 1)
+        )
+        poll.question = "B"
+        poll.save()
+        poll.status = "closed"
+        poll.save()
+        history_model = PollWithDeltaStorage.history.model
+        history_model.objects.exclude(status="closed").update(
+            history_date=datetime.now() - timedelta(days=40)
+        )
+
+        management.call_command(
+            self.command_name, "tests.pollwithdeltastorage", stdout=StringIO()
+        )
+
+        record = history_model.objects.get()
+        self.assertIsNone(record.history_changed_fields)
+        self.assertEqual(
+            (record.question, record.pub_date, record.status),
+            ("B", datetime(2021, 1, 1), "closed"),
+        )
+        self.assertEqual(poll.history.most_recent().question, "B")
+        self.assertEqual(poll.history.as_of(datetime.now()).question, "B")
+
+    def test_orphaned_blobs_are_deleted(self):
+        document = DocumentWithDeduplicatedHistory.objects.create(
+            title="Title", body="Old body"
+        )
+        document.body = "New body"
+        document.save()
+        history_model = DocumentWithDeduplicatedHistory.history.model
+        history_model.objects.filter(history_type="+").update(
+            history_date=datetime.now() - timedelta(days=40)
+        )
+
+        management.call_command(
+            self.command_name,
+            "tests.documentwithdeduplicatedhistory",
+            stdout=StringIO(),
+        )
+
+        self.assertEqual(document.history.get().body, "New body")
+        self.assertEqual(
+            list(
+                history_model._history_blob_model.objects.values_list(
+                    "value", flat=True
+                )
+            ),
+            ["New body"],
+        )
+
+    def test_remaining_delta_m2m_records_become_keyframes(self):
+        here = Place.objects.create(name="Here")
+        there = Place.objects.create(name="There")
+        poll = PollWithDeltaManyToMany.objects.create(
+            question="A", pub_date=datetime.now()
+        )
+        poll.places.add(here)
+        poll.places.add(there)
+        history_model = PollWithDeltaManyToMany.history.model
+        old_records = poll.history.order_by("history_id")[:2]
+        history_model.objects.filter(pk__in=[r.pk for r in old_records]).update(
+            history_date=datetime.now() - timedelta(days=40)
+        )
+
+        management.call_command(
+            self.command_name, "tests.pollwithdeltamanytomany", stdout=StringIO()
+        )
+
+        record = poll.history.get()
+        self.assertTrue(record.history_m2m_keyframe)
+        self.assertEqual(
+            sorted(record.places.values_list("m2m_history_op", "place_id")),
+            [("=", here.pk), ("=", there.pk)],
+        )
+
+    def test_old_checkpoints_are_deleted(self):
+        poll = PollWithCheckpoints.objects.create(question="A", pub_date=datetime.now())
+        history_model = PollWithCheckpoints.history.model
+        history_model.objects.update(history_date=datetime.now() - timedelta(days=40))
+        checkpoint_model = history_model._history_checkpoint_model
+        for days in (35, 10):
+            sh_models.create_history_checkpoint(
+                history_model, datetime.now() - timedelta(days=days), "default"
+            )
+
+        management.call_command(
+            self.command_name, "tests.pollwithcheckpoints", stdout=StringIO()
+        )
+
+        # The history of the object was deleted, so are all the checkpoints
+        self.assertFalse(poll.history.exists())
+        self.assertFalse(checkpoint_model.objects.exists())
+
+
+class TestProcessHistoryOutbox(TestCase):
+    command_name = "process_history_outbox"
+
+    def test_moves_records(self):
+        poll = PollWithHistoryOutbox.objects.create(
+            question="what's up?", pub_date=datetime.now()
+        )
+        out = StringIO()
+        management.call_command(self.command_name, stdout=out)
+        self.assertIn(
+            process_history_outbox.Command.DONE_PROCESSING_FOR_MODEL.format(
+                model="PollWithHistoryOutbox", count=1
+            ),
+            out.getvalue(),
+        )
+        self.assertEqual(poll.history.count(), 1)
+
+    def test_model_args(self):
+        PollWithHistoryOutbox.objects.create(
+            question="what's up?", pub_date=datetime.now()
+        )
+        out = StringIO()
+        management.call_command(
+            self.command_name, "tests.pollwithhistoryoutbox", stdout=out
+        )
+        self.assertIn("Moved 1 historical records", out.getvalue())
+
+        for model, msg in [
+            ("tests.poll", "No history outbox found for tests.poll"),
+            ("invalid.model", "Unable to find model invalid.model"),
+        ]:
+            with self.assertRaisesMessage(management.CommandError, msg):
+                management.call_command(self.command_name, model, stdout=StringIO())
+
+
+class TestCompressHistory(TestCase):
+    command_name = "compress_history"
+
+    def test_compresses_uncompressed_values(self):
+        document = DocumentWithCompressedHistory.objects.create(
+            title="Report", body="Lorem ipsum " * 100, data={"pages": 3}
+        )
+        history_model = DocumentWithCompressedHistory.history.model
+        record = document.history.get()
+        # Store the values uncompressed, like in rows written before the fields
+        # were compressed
+        history_model.objects.filter(pk=record.pk).update(
+            body=("Lorem ipsum " * 100).encode(), data=b'{"pages": 3}'
+        )
+        self.assertEqual(
+            bytes(get_stored_value(history_model, "body", record.pk))[:5], b"Lorem"
+        )
+        self.assertEqual(document.history.get().data, {"pages": 3})
+
+        out = StringIO()
+        management.call_command(
+            self.command_name, "tests.documentwithcompressedhistory", stdout=out
+        )
+
+        self.assertIn(
+            compress_history.Command.DONE_COMPRESSING_FOR_MODEL.format(
+                model=DocumentWithCompressedHistory, count=1
+            ),
+            out.getvalue(),
+        )
+        self.assertEqual(
+            bytes(get_stored_value(history_model, "body", record.pk))[:2], b"\x00x"
+        )
+        self.assertEqual(document.history.get().body, "Lorem ipsum " * 100)
+
+    def test_skips_values_compressed_with_the_algorithm(self):
+        document = DocumentWithCompressedHistory.objects.create(
+            title="Report", body="Lorem ipsum " * 100, data={"pages": 3}
+        )
+        DocumentWithCompressedHistory.objects.create(title="Notes", body="")
+        history_model = DocumentWithCompressedHistory.history.model
+        record = document.history.get()
+        history_model.objects.filter(pk=record.pk).update(data=b'{"pages": 3}')
+
+        out = StringIO()
+        management.call_command(
+            self.command_name, "tests.documentwithcompressedhistory", stdout=out
+        )
+        self.assertIn(
+            compress_history.Command.DONE_COMPRESSING_FOR_MODEL.format(
+                model=DocumentWithCompressedHistory, count=1
+            ),
+            out.getvalue(),
+        )
+
+        out = StringIO()
+        with self.assertNumQueries(1):
+            management.call_command(
+                self.command_name, "tests.documentwithcompressedhistory", stdout=out
+            )
+        self.assertIn(
+            compress_history.Command.DONE_COMPRESSING_FOR_MODEL.format(
+                model=DocumentWithCompressedHistory, count=0
+            ),
+            out.getvalue(),
+        )
+        self.assertEqual(document.history.get().data, {"pages": 3})
+
+    def test_model_without_compressed_fields(self):
+        Poll.objects.create(question="what's up?", pub_date=datetime.now())
+        out = StringIO()
+        management.call_command(
+            self.command_name, "tests.poll", verbosity=2, stdout=out
+        )
+        self.assertIn(
+            compress_history.Command.NO_COMPRESSED_FIELDS.format(model=Poll),
+            out.getvalue(),
+        )
+
+
+class TestBackfillHistoryValidUntil(TestCase):
+    command_name = "backfill_history_valid_until"
+
+    def test_no_args(self):
+        out = StringIO()
+        management.call_command(self.command_name, stdout=out, stderr=StringIO())
+        self.assertIn(backfill_history_valid_until.Command.COMMAND_HINT, out.getvalue())
+
+    def test_sets_valid_until_of_records(self):
+        polls = [
+            PollWithValidUntil.objects.create(
+                question=question, pub_date=datetime.now()
+            )
+            for question in ("A", "B")
+        ]
+        for poll in polls:
+            poll.save()
+        history_model = PollWithValidUntil.history.model
+        # Like records written before the option was enabled
+        history_model.objects.update(history_valid_until=None)
+
+        out = StringIO()
+        management.call_command(
+            self.command_name, "tests.pollwithvaliduntil", batchsize=1, stdout=out
+        )
+
+        self.assertEqual(
+            out.getvalue(),
+            backfill_history_valid_until.Command.DONE_BACKFILLING_FOR_MODEL.format(
+                model=PollWithValidUntil, count=2
+            ),
+        )
+        for poll in polls:
+            first, last = poll.history.order_by("history_date")
+            self.assertEqual(first.history_valid_until, last.history_date)
+            self.assertIsNone(last.history_valid_until)
+
+    def test_updates_each_batch_of_objects_in_its_own_transaction(self):
+        for question in ("A", "B", "C"):
+            PollWithValidUntil.objects.create(
+                question=question, pub_date=datetime.now()
+            ).save()
+        PollWithValidUntil.history.model.objects.update(history_valid_until=None)
+        atomic = backfill_history_valid_until.transaction.atomic
+
+        with patch.object(
+            backfill_history_valid_until.transaction, "atomic", wraps=atomic
+        ) as mock_atomic:
+            management.call_command(
+                self.command_name,
+                "tests.pollwithvaliduntil",
+                batchsize=2,
+                stdout=StringIO(),
+            )
+
+        # bulk_update() also uses atomic(), without a savepoint
+        self.assertEqual(
+            [c for c in mock_atomic.call_args_list if "savepoint" not in c.kwargs],
+            [call(using="default")] * 2,
+        )
+        for poll in PollWithValidUntil.objects.all():
+            first, last = poll.history.order_by("history_date")
+            self.assertEqual(first.history_valid_until, last.history_date)
+
+    def test_skips_models_without_valid_until(self):
+        out = StringIO()
+        management.call_command(
+            self.command_name, "tests.poll", verbosity=2, stdout=out
+        )
+        self.assertEqual(
+            out.getvalue(),
+            backfill_history_valid_until.Command.NOT_VALID_UNTIL_MODEL.format(
+                model=Poll
+            ),
+        )
+
+
+class TestCreateHistoryCheckpoints(TestCase):
+    command_name = "create_history_checkpoints"
+
+    def test_no_args(self):
+        out = StringIO()
+        management.call_command(self.command_name, stdout=out, stderr=StringIO())
+        self.assertIn(create_history_checkpoints.Command.COMMAND_HINT, out.getvalue())
+
+    def test_creates_checkpoints(self):
+        poll = PollWithCheckpoints.objects.create(question="A", pub_date=datetime.now())
+        poll.question = "B"
+        poll.save()
+        first_record, last_record = poll.history.order_by("history_date")
+
+        out = StringIO()
+        management.call_command(
+            self.command_name,
+            "tests.pollwithcheckpoints",
+            date=[
+                first_record.history_date.isoformat(),
+                last_record.history_date.isoformat(),
+            ],
+            stdout=out,
+        )
+
+        checkpoint_model = PollWithCheckpoints.history.model._history_checkpoint_model
+        self.assertEqual(
+            list(
+                checkpoint_model.objects.order_by("checkpoint_date").values_list(
+                    "checkpoint_date", "history"
+                )
+            ),
+            [
+                (first_record.history_date, first_record.pk),
+                (last_record.history_date, last_record.pk),
+            ],
+        )
+        self.assertIn(
+            create_history_checkpoints.Command.DONE_CREATING_FOR_MODEL.format(
+                count=1,
+                date=last_record.history_date.isoformat(),
+                model=PollWithCheckpoints,
+            ),
+            out.getvalue(),
+        )
+
+    def test_invalid_date(self):
+        with self.assertRaises(management.CommandError):
+            management.call_command(
+                self.command_name,
+                "tests.pollwithcheckpoints",
+                date=["yesterday"],
+                stdout=StringIO(),
+            )
+
+    def test_skips_models_without_checkpoints(self):
+        out = StringIO()
+        management.call_command(
+            self.command_name, "tests.poll", verbosity=2, stdout=out
+        )
+        self.assertEqual(
+            out.getvalue(),
+            create_history_checkpoints.Command.NO_CHECKPOINTS.format(model=Poll),
+        )
@@ -0,0 +1,86 @@
+from django.db import connection
+from django.test import TestCase
+
+from simple_history.fields import CompressedField
+
+from ..models import DocumentWithCompressedHistory
+
+
+def get_stored_value(history_model, field_name, history_id):
+    field = history_model._meta.get_field(field_name)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT {} FROM {} WHERE history_id = %s".format(
+                connection.ops.quote_name(field.column),
+                connection.ops.quote_name(history_model._meta.db_table),
+            ),
+            [history_model._meta.pk.get_db_prep_value(history_id, connection)],
+        )
+        (value,) = cursor.fetchone()
+    return value
+
+
+class CompressedFieldTest(TestCase):
+    def test_round_trip(self):
+        for algorithm in ["zlib", "lzma"]:
+            for value_type, value in [("text", "abc" * 100), ("json", {"a": [1]})]:
+                with self.subTest(algorithm=algorithm, value_type=value_type):
+                    field = CompressedField(algorithm=algorithm, value_type=value_type)
+                    stored = field.get_prep_value(value)
+                    self.assertEqual(stored[:1], b"\x00")
+                    self.assertEqual(
+                        field.from_db_value(stored, None, connection), value
+                    )
+                    self.assertIsNone(field.get_prep_value(None))
+
+    def test_uncompressed_values(self):
+        field = CompressedField(value_type="json")
+        self.assertEqual(field.from_db_value(b'{"a": 1}', None, connection), {"a": 1})
+        self.assertEqual(field.from_db_value('{"a": 1}', None, connection), {"a": 1})
+        self.assertEqual(
+            CompressedField().from_db_value(b"abc", None, connection), "abc"
+        )
+
+    def test_deconstruct(self):
+        field = CompressedField(algorithm="lzma", value_type="json", null=True)
+        name, path, args, kwargs = field.deconstruct()
+        self.assertEqual(path, "simple_history.fields.CompressedField")
+        self.assertEqual(
+            kwargs,
+            {"algorithm": "lzma", "value_type": "json", "null": True, "editable": True},
+        )
+
+    def test_invalid_options(self):
+        with self.assertRaises(ValueError):
+            CompressedField(algorithm="rot13")
+        with self.assertRaises(ValueError):
+            CompressedField(value_type="xml")
+
+
+class CompressedHistoryTest(TestCase):
+    def setUp(self):
+        self.history_model = DocumentWithCompressedHistory.history.model
+        self.document = DocumentWithCompressedHistory.objects.create(
+            title="Report", body="Lorem ipsum " * 1000, data={"pages": 3}
+        )
+
+    def test_values_are_stored_compressed(self):
+        record = self.document.history.get()
+        body = bytes(get_stored_value(self.history_model, "body", record.pk))
+        self.assertEqual(body[:2], b"\x00x")
+        self.assertLess(len(body), len(self.document.body) / 10)
+        self.assertEqual(
+            bytes(get_stored_value(self.history_model, "data", record.pk))[:2],
+            b"\x00x",
+        )
+
+    def test_values_are_decompressed(self):
+        self.document.body = "Lorem ipsum"
+        self.document.save()
+
+        new_record, old_record = self.document.history.all()
+        self.assertEqual(new_record.body, "Lorem ipsum")
+        self.assertEqual(old_record.instance.body, "Lorem ipsum " * 1000)
+        self.assertEqual(old_record.data, {"pages": 3})
+        delta = new_record.diff_against(old_record)
+        self.assertEqual(delta.changed_fields, ["body"])
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from operator import attrgetter
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
 from django.db import IntegrityError
@@ -7,7 +8,14 @@ from django.test import TestCase, override_settings, skipUnlessDBFeature
 
 from simple_history.manager import SIMPLE_HISTORY_REVERSE_ATTR_NAME
 
-from ..models import Choice, Document, Poll, RankedDocument
+from ..models import (
+    BucketDataRegisterChangedBy,
+    BucketMember,
+    Choice,
+    Document,
+    Poll,
+    RankedDocument,
+)
 from .utils import HistoricalTestCase
 
 User = get_user_model()
@@ -15,6 +23,52 @@ User = get_user_model()
 
 class LatestOfEachTestCase(HistoricalTestCase):
     def test_filtered_instances_are_as_expected(self):
+        self._test_filtered_instances_are_as_expected()
+
+    @skipUnlessDBFeature("can_distinct_on_fields")
+    def test_filtered_instances_are_as_expected_with_distinct_on_strategy(self):
+        self._test_filtered_instances_are_as_expected(strategy="distinct_on")
+
+    @skipUnlessDBFeature("supports_over_clause")
+    def test_filtered_instances_are_as_expected_with_window_strategy(self):
+        self._test_filtered_instances_are_as_expected(strategy="window")
+
+    def test_filtered_instances_are_as_expected_with_max_strategy(self):
+        self._test_filtered_instances_are_as_expected(strategy="max")
+
+    @skipUnlessDBFeature("supports_over_clause")
+    def test_strategy_setting(self):
+        with override_settings(SIMPLE_HISTORY_LATEST_OF_EACH_STRATEGY="window"):
+            self._test_filtered_instances_are_as_expected()
+            query = str(RankedDocument.history.latest_of_each().query)
+        self.assertIn("ROW_NUMBER", query)
+
+    def test_unknown_strategy_raises_error(self):
+        with self.assertRaises(ValueError):
+            RankedDocument.history.latest_of_each(strategy="unknown")
+
+    @skipUnlessDBFeature("supports_over_clause")
+    def test_as_of_with_strategy_setting(self):
+        document1 = RankedDocument.objects.create(rank=10)
+        document1.rank = 11
+        document1.save()
+        document2 = RankedDocument.objects.create(rank=20)
+        document2.delete()
+        date = RankedDocument.history.latest().history_date
+        RankedDocument.objects.create(rank=30)
+
+        for strategy in ("exists", "window", "max"):
+            with (
+                self.subTest(strategy=strategy),
+                override_settings(SIMPLE_HISTORY_LATEST_OF_EACH_STRATEGY=strategy),
+            ):
+                self.assertQuerySetEqual(
+                    RankedDocument.history.as_of(date).order_by("rank"),
+                    [11],
+                    attrgetter("rank"),
+                )
+
+    def _test_filtered_instances_are_as_expected(self, **kwargs):
         document1 = RankedDocument.objects.create(rank=10)
         document2 = RankedDocument.objects.create(rank=20)
         document2.rank = 21
@@ -28,7 +82,9 @@ class LatestOfEachTestCase(HistoricalTestCase):
         document4.delete()
         reincarnated_document4 = RankedDocument.objects.create(pk=document4_pk, rank=42)
 
-        record4, record3, record2, record1 = RankedDocument.history.latest_of_each()
+        record4, record3, record2, record1 = RankedDocument.history.latest_of_each(
+            **kwargs
+        ).order_by("-history_date")
         self.assertRecordValues(
             record1,
             RankedDocument,
@@ -386,6 +442,85 @@ class BulkHistoryCreateTestCase(TestCase):
         with self.assertNumQueries(1):
             Poll.history.bulk_history_create(self.data)
 
+    @skipUnlessDBFeature("has_bulk_insert")
+    def test_bulk_history_create_from_generator(self):
+        polls = (poll for poll in self.data)
+
+        with self.assertNumQueries(2):
+            created = Poll.history.bulk_history_create(polls, batch_size=3)
+
+        self.assertEqual(len(created), 4)
+        self.assertQuerySetEqual(
+            Poll.history.order_by("question"),
+            ["Question 1", "Question 2", "Question 3", "Question 4"],
+            attrgetter("question"),
+        )
+
+    def test_bulk_history_create_returns_records_of_queryset(self):
+        Poll.objects.bulk_create(self.data)
+
+        created = Poll.history.bulk_history_create(Poll.objects.all())
+
+        self.assertEqual(len(created), 4)
+        self.assertEqual(
+            sorted(record.question for record in created),
+            ["Question 1", "Question 2", "Question 3", "Question 4"],
+        )
+
+    def test_bulk_history_create_return_count(self):
+        polls = (poll for poll in self.data)
+
+        created_count = Poll.history.bulk_history_create(
+            polls, batch_size=3, return_count=True
+        )
+
+        self.assertEqual(created_count, 4)
+        self.assertEqual(Poll.history.count(), 4)
+
+    def test_bulk_history_create_in_chunks(self):
+        chunk_sizes = []
+        bulk_create = Poll.history.model.objects.bulk_create
+
+        def mock_bulk_create(objs, **kwargs):
+            chunk_sizes.append(len(objs))
+            return bulk_create(objs, **kwargs)
+
+        with patch.object(
+            Poll.history.model.objects, "bulk_create", side_effect=mock_bulk_create
+        ):
+            Poll.history.bulk_history_create(iter(self.data), batch_size=3)
+
+        self.assertEqual(chunk_sizes, [3, 1])
+
+    def test_bulk_history_create_resolves_defaults_once(self):
+        with patch.object(
+            Poll.history.model, "get_default_history_user", return_value=None
+        ) as get_default_history_user:
+            Poll.history.bulk_history_create(self.data)
+
+        get_default_history_user.assert_called_once_with(None)
+        self.assertEqual(Poll.history.values("history_date").distinct().count(), 1)
+
+    def test_bulk_history_create_with_get_user_depending_on_instance(self):
+        members = [
+            BucketMember.objects.create(
+                name=f"Member {x}", user=User.objects.create_user(f"tester{x}")
+            )
+            for x in range(2)
+        ]
+        data = BucketDataRegisterChangedBy.objects.bulk_create(
+            [BucketDataRegisterChangedBy(changed_by=member) for member in members]
+        )
+
+        BucketDataRegisterChangedBy.history.bulk_history_create(data)
+
+        self.assertEqual(
+            [record.history_user for record in data[0].history.all()], [members[0]]
+        )
+        self.assertEqual(
+            [record.history_user for record in data[1].history.all()], [members[1]]
+        )
+
 
 class BulkHistoryUpdateTestCase(TestCase):
     def setUp(self):
@@ -460,3 +595,22 @@ class PrefetchingMethodsTestCase(TestCase):
             self.assertEqual(len(historical_records), num_choices)
         with self.assertNumQueries(0):
             access_related_objs(historical_records)
+
+
+class HistoryWritePlanTestCase(TestCase):
+    def test_write_plan_matches_tracked_fields(self):
+        write_plan = Choice.history.model._history_write_plan
+        self.assertEqual(write_plan.attnames, ("id", "poll_id", "choice", "votes"))
+        self.assertEqual(write_plan.foreign_key_names, ("poll",))
+        self.assertFalse(write_plan.has_history_relation)
+
+        choice = Choice(id=1, poll_id=2, choice="yes", votes=3)
+        self.assertEqual(
+            write_plan.get_attrs(choice),
+            {"id": 1, "poll_id": 2, "choice": "yes", "votes": 3},
+        )
+
+    def test_manager_class_is_created_once(self):
+        poll = Poll.objects.create(question="why?", pub_date=datetime.now())
+        self.assertIs(type(Poll.history), type(Poll.history))
+        self.assertIs(type(poll.history), type(Poll.history))
@@ -3,13 +3,14 @@ import unittest
 import uuid
 import warnings
 from datetime import datetime, timedelta
+from unittest import mock
 
 from django.apps import apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ImproperlyConfigured, ObjectDoesNotExist
 from django.core.files.base import ContentFile
-from django.db import IntegrityError, models
+from django.db import IntegrityError, NotSupportedError, models, transaction
 from django.db.models.fields.proxy import OrderWrt
 from django.test import TestCase, override_settings
 from django.urls import reverse
@@ -23,14 +24,22 @@ from simple_history.models import (
     HistoricalRecords,
     ModelChange,
     ModelDelta,
+    create_history_checkpoint,
     is_historic,
     to_historic,
 )
 from simple_history.signals import (
+    post_create_historical_record,
     pre_create_historical_m2m_records,
     pre_create_historical_record,
 )
-from simple_history.utils import get_history_model_for_model, update_change_reason
+from simple_history.utils import (
+    delete_with_history,
+    get_history_model_for_model,
+    refresh_latest_records,
+    update_change_reason,
+    update_with_history,
+)
 
 from ..external.models import (
     ExternalModel,
@@ -59,6 +68,7 @@ from ..models import (
     CustomManagerNameModel,
     DefaultTextFieldChangeReasonModel,
     Document,
+    DocumentWithDeduplicatedHistory,
     Employee,
     ExternalModelSpecifiedWithAppParam,
     ExternalModelWithAppLabel,
@@ -90,10 +100,19 @@ from ..models import (
     PollChildRestaurantWithManyToMany,
     PollInfo,
     PollWithAlternativeManager,
+    PollWithBufferedWrites,
+    PollWithBufferedWritesAndValidUntil,
+    PollWithCheckpoints,
+    PollWithCoalescedWrites,
+    PollWithDeltaManyToMany,
+    PollWithDeltaStorage,
+    PollWithDirectInsert,
+    PollWithDirectInsertAndTimestamp,
     PollWithExcludedFieldsWithDefaults,
     PollWithExcludedFKField,
     PollWithExcludeFields,
     PollWithHistoricalIPAddress,
+    PollWithLatestTable,
     PollWithManyToMany,
     PollWithManyToManyCustomHistoryID,
     PollWithManyToManyWithIPAddress,
@@ -101,6 +120,8 @@ from ..models import (
     PollWithQuerySetCustomizations,
     PollWithSelfManyToMany,
     PollWithSeveralManyToMany,
+    PollWithSkipUnchangedSaves,
+    PollWithValidUntil,
     Province,
     Restaurant,
     SelfFK,
@@ -1106,6 +1127,102 @@ class GetPrevRecordAndNextRecordTestCase(TestCase):
         with self.assertNumQueries(1):
             self.assertRecordsMatch(first_record.next_record, second_record)
 
+    def test_with_neighbors(self):
+        other_poll = Poll.objects.create(question="other?", pub_date=today)
+        for question in ("ask questions?", "eh?"):
+            self.poll.question = question
+            self.poll.save()
+
+        with self.assertNumQueries(1):
+            records = list(Poll.history.with_neighbors().order_by("history_date"))
+            first_record, other_record, second_record, third_record = records
+            self.assertIsNone(first_record.prev_record)
+            self.assertIs(first_record.next_record, second_record)
+            self.assertIs(second_record.prev_record, first_record)
+            self.assertIs(second_record.next_record, third_record)
+            self.assertIs(third_record.prev_record, second_record)
+            self.assertIsNone(third_record.next_record)
+            self.assertIsNone(other_record.prev_record)
+            self.assertIsNone(other_record.next_record)
+        self.assertEqual(other_record.history_object, other_poll)
+        self.assertEqual(second_record.prev_history_id, first_record.history_id)
+        self.assertEqual(second_record.next_history_date, third_record.history_date)
+
+    def test_with_neighbors_on_filtered_queryset(self):
+        user = User.objects.create_user("user", "user@example.com")
+        for question, history_user in (("ask questions?", user), ("eh?", None)):
+            self.poll.question = question
+            self.poll._history_user = history_user
+            self.poll.save()
+        self.poll._history_user = user
+        self.poll.delete()
+
+        records = list(
+            Poll.history.filter(history_user=user)
+            .with_neighbors()
+            .order_by("history_date")
+        )
+        self.assertEqual(len(records), 2)
+        for record in records:
+            unannotated = Poll.history.get(pk=record.pk)
+            self.assertEqual(record.prev_record, unannotated.prev_record)
+            self.assertEqual(record.next_record, unannotated.next_record)
+        self.assertEqual(records[0].next_record.question, "eh?")
+
+    def test_with_neighbors_filtered_afterwards(self):
+        for question in ("ask questions?", "eh?", "one more?"):
+            self.poll.question = question
+            self.poll.save()
+
+        records = list(
+            self.poll.history.with_neighbors()
+            .exclude(question="eh?")
+            .filter(question__endswith="?")
+            .order_by("history_date")
+        )
+        self.assertEqual(
+            [record.question for record in records],
+            ["what's up?", "ask questions?", "one more?"],
+        )
+        self.assertEqual(records[1].next_record.question, "eh?")
+        self.assertEqual(records[2].prev_record.question, "eh?")
+
+    def test_neighbors_of_records_at_the_same_date(self):
+        for question in ("ask questions?", "eh?"):
+            self.poll.question = question
+            self.poll._history_date = self.poll.history.get(
+                question="what's up?"
+            ).history_date
+            self.poll.save()
+        first, second, third = self.poll.history.order_by("history_id")
+
+        # Records at the same date are ordered by primary key
+        self.assertIsNone(first.prev_record)
+        self.assertEqual(first.next_record, second)
+        self.assertEqual(second.prev_record, first)
+        self.assertEqual(second.next_record, third)
+        self.assertEqual(third.prev_record, second)
+        self.assertIsNone(third.next_record)
+        for record in self.poll.history.with_neighbors():
+            unannotated = self.poll.history.get(pk=record.pk)
+            self.assertEqual(record.prev_record, unannotated.prev_record)
+            self.assertEqual(record.next_record, unannotated.next_record)
+
+    def test_with_neighbors_fetches_missing_neighbors_at_once(self):
+        for question in ("ask questions?", "eh?", "one more?"):
+            self.poll.question = question
+            self.poll.save()
+        records = self.poll.history.with_neighbors().order_by("history_date")
+
+        with self.assertNumQueries(1):
+            second_record, third_record = records[1:3]
+        first_record = self.poll.history.get(question="what's up?")
+        with self.assertNumQueries(1):
+            self.assertRecordsMatch(second_record.prev_record, first_record)
+        with self.assertNumQueries(0):
+            self.assertIs(third_record.prev_record, second_record)
+            self.assertEqual(third_record.next_record.question, "one more?")
+
 
 class CreateHistoryModelTests(unittest.TestCase):
     @staticmethod
@@ -2530,6 +2647,106 @@ class ManyToManyTest(TestCase):
         self.assertEqual(delta, expected_delta)
 
 
+class DeltaManyToManyTest(TestCase):
+    def setUp(self):
+        self.m2m_history_model = PollWithDeltaManyToMany.history.model.places.model
+        self.here = Place.objects.create(name="Here")
+        self.there = Place.objects.create(name="There")
+        self.poll = PollWithDeltaManyToMany.objects.create(
+            question="what's up?", pub_date=today
+        )
+
+    def get_records(self):
+        return list(self.poll.history.order_by("history_date", "history_id"))
+
+    def get_places(self, record):
+        return {row.place_id for row in record.places.all()}
+
+    def test_only_changes_are_stored(self):
+        self.poll.places.add(self.here, self.there)
+        self.poll.places.remove(self.here)
+
+        records = self.get_records()
+        self.assertEqual(
+            [self.get_places(record) for record in records],
+            [set(), {self.here.pk, self.there.pk}, {self.there.pk}],
+        )
+        self.assertEqual(
+            [
+                sorted(
+                    record.places.model.objects.filter(history=record).values_list(
+                        "m2m_history_op", "place_id"
+                    )
+                )
+                for record in records
+            ],
+            [[], [("+", self.here.pk), ("+", self.there.pk)], [("-", self.here.pk)]],
+        )
+
+    def test_keyframes(self):
+        for place in [self.here, self.there]:
+            self.poll.places.add(place)
+        self.poll.places.remove(self.here)
+        self.poll.save()
+
+        records = self.get_records()
+        self.assertEqual(
+            [record.history_m2m_keyframe for record in records],
+            [True, False, False, True, False],
+        )
+        self.assertEqual(
+            list(
+                self.m2m_history_model.objects.filter(history=records[3]).values_list(
+                    "m2m_history_op", "place_id"
+                )
+            ),
+            [("=", self.there.pk)],
+        )
+        self.assertEqual(
+            [self.get_places(record) for record in records],
+            [
+                set(),
+                {self.here.pk},
+                {self.here.pk, self.there.pk},
+                {self.there.pk},
+                {self.there.pk},
+            ],
+        )
+
+    def test_diff_against(self):
+        self.poll.places.add(self.here)
+        self.poll.save()
+        self.poll.places.add(self.there)
+
+        first, _, second, third = self.get_records()
+        delta = third.diff_against(second)
+        self.assertEqual(delta.changed_fields, ["places"])
+        self.assertEqual(
+            delta.changes[0].new,
+            [
+                {"pollwithdeltamanytomany": self.poll.pk, "place": self.here.pk},
+                {"pollwithdeltamanytomany": self.poll.pk, "place": self.there.pk},
+            ],
+        )
+        self.assertEqual(
+            delta.changes[0].old,
+            [{"pollwithdeltamanytomany": self.poll.pk, "place": self.here.pk}],
+        )
+        self.assertEqual(
+            second.diff_against(third).changes[0].new, delta.changes[0].old
+        )
+        self.assertEqual(third.diff_against(first).changes[0].old, [])
+
+    def test_deletion_starts_over(self):
+        self.poll.places.add(self.here)
+        poll_id = self.poll.pk
+        self.poll.delete()
+
+        deleted = PollWithDeltaManyToMany.history.filter(id=poll_id).latest()
+        self.assertTrue(deleted.history_m2m_keyframe)
+        self.assertEqual(list(deleted.places.all()), [])
+
+
 @override_settings(**database_router_override_settings)
 class MultiDBExplicitHistoryUserIDTest(TestCase):
     databases = {"default", "other"}
@@ -2985,3 +3202,1133 @@ class HistoricOneToOneFieldTest(TestCase):
         )
         pt1i = pt1h.instance
         self.assertEqual(pt1i.organization.name, "original")
+
+
+class BufferedWritesTest(TestCase):
+    def setUp(self):
+        self.history_model = PollWithBufferedWrites.history.model
+
+    def test_records_are_written_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            poll = PollWithBufferedWrites.objects.create(
+                question="what's up?", pub_date=today
+            )
+            poll.question = "what's new?"
+            poll.save()
+            self.assertEqual(self.history_model.objects.count(), 0)
+
+        self.assertEqual(
+            list(
+                poll.history.order_by("history_date").values_list(
+                    "history_type", "question"
+                )
+            ),
+            [("+", "what's up?"), ("~", "what's new?")],
+        )
+
+    def test_records_are_inserted_with_one_query(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            for i in range(5):
+                PollWithBufferedWrites.objects.create(question=str(i), pub_date=today)
+
+        with self.assertNumQueries(1):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self.history_model.objects.count(), 5)
+
+    def test_records_in_released_savepoints_are_inserted_together(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            PollWithBufferedWrites.objects.create(question="outer", pub_date=today)
+            with transaction.atomic():
+                PollWithBufferedWrites.objects.create(question="inner", pub_date=today)
+            PollWithBufferedWrites.objects.create(question="outer", pub_date=today)
+
+        with self.assertNumQueries(2):
+            # The first record is inserted before it's known whether the savepoint
+            # of the second one was rolled back
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self.history_model.objects.count(), 3)
+
+    def test_rolled_back_savepoint_discards_records(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PollWithBufferedWrites.objects.create(question="kept", pub_date=today)
+            try:
+                with transaction.atomic():
+                    PollWithBufferedWrites.objects.create(
+                        question="discarded", pub_date=today
+                    )
+                    with transaction.atomic():
+                        PollWithBufferedWrites.objects.create(
+                            question="discarded too", pub_date=today
+                        )
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            with transaction.atomic():
+                PollWithBufferedWrites.objects.create(
+                    question="kept too", pub_date=today
+                )
+
+        self.assertEqual(
+            sorted(self.history_model.objects.values_list("question", flat=True)),
+            ["kept", "kept too"],
+        )
+
+    def test_m2m_records_reflect_state_when_created(self):
+        place_a = Place.objects.create(name="A")
+        place_b = Place.objects.create(name="B")
+        with self.captureOnCommitCallbacks(execute=True):
+            poll = PollWithBufferedWrites.objects.create(
+                question="what's up?", pub_date=today
+            )
+            poll.places.add(place_a)
+            poll.places.remove(place_a)
+            poll.places.add(place_b)
+
+        self.assertEqual(
+            [
+                list(record.places.values_list("place_id", flat=True))
+                for record in poll.history.order_by("history_id")
+            ],
+            [[], [place_a.pk], [], [place_b.pk]],
+        )
+
+    def test_signals_are_sent_in_order(self):
+        sent = []
+
+        def pre_receiver(sender, history_instance, **kwargs):
+            sent.append(("pre", history_instance.question, history_instance.pk))
+
+        def post_receiver(sender, history_instance, **kwargs):
+            sent.append(("post", history_instance.question, history_instance.pk))
+
+        pre_create_historical_record.connect(pre_receiver, sender=self.history_model)
+        post_create_historical_record.connect(post_receiver, sender=self.history_model)
+        try:
+            with self.captureOnCommitCallbacks(execute=True):
+                PollWithBufferedWrites.objects.create(question="1", pub_date=today)
+                PollWithBufferedWrites.objects.create(question="2", pub_date=today)
+        finally:
+            pre_create_historical_record.disconnect(
+                pre_receiver, sender=self.history_model
+            )
+            post_create_historical_record.disconnect(
+                post_receiver, sender=self.history_model
+            )
+
+        first, second = self.history_model.objects.order_by("history_id")
+        self.assertEqual(
+            sent,
+            [
+                ("pre", "1", None),
+                ("pre", "2", None),
+                ("post", "1", first.pk),
+                ("post", "2", second.pk),
+            ],
+        )
+
+    def test_buffer_outlives_rolled_back_savepoint(self):
+        try:
+            with transaction.atomic():
+                PollWithBufferedWrites.objects.create(
+                    question="discarded", pub_date=today
+                )
+                raise IntegrityError
+        except IntegrityError:
+            pass
+        with self.captureOnCommitCallbacks(execute=True):
+            PollWithBufferedWrites.objects.create(question="kept", pub_date=today)
+
+        self.assertEqual(
+            list(self.history_model.objects.values_list("question", flat=True)),
+            ["kept"],
+        )
+
+    @override_settings(SIMPLE_HISTORY_BUFFERED_WRITES=True)
+    def test_setting_enables_buffered_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            poll = Poll.objects.create(question="what's up?", pub_date=today)
+            self.assertEqual(poll.history.count(), 0)
+        self.assertEqual(poll.history.count(), 1)
+
+
+class CoalescedWritesTest(TestCase):
+    def setUp(self):
+        self.here = Place.objects.create(name="Here")
+        self.there = Place.objects.create(name="There")
+
+    def get_history(self, poll):
+        return [
+            (
+                record.history_type,
+                record.question,
+                {place.place_id for place in record.places.all()},
+            )
+            for record in poll.history.order_by("history_date")
+        ]
+
+    def test_changes_in_transaction_are_coalesced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                poll = PollWithCoalescedWrites.objects.create(
+                    question="what's up?", pub_date=today
+                )
+                poll.places.set([self.here])
+                poll.question = "what's new?"
+                poll.save()
+
+        self.assertEqual(self.get_history(poll), [("+", "what's new?", {self.here.pk})])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                poll.places.clear()
+                poll.places.add(self.there)
+                poll.save()
+
+        self.assertEqual(
+            self.get_history(poll),
+            [
+                ("+", "what's new?", {self.here.pk}),
+                ("~", "what's new?", {self.there.pk}),
+            ],
+        )
+
+    def test_m2m_rows_are_read_once_when_inserted(self):
+        poll = PollWithCoalescedWrites.objects.create(
+            question="what's up?", pub_date=today
+        )
+        with self.captureOnCommitCallbacks() as callbacks:
+            with self.assertNumQueries(6):
+                with transaction.atomic():
+                    poll.places.set([self.here])
+                    poll.question = "what's new?"
+                    poll.save()
+        # One query for the record, and one each for reading and copying the rows
+        with self.assertNumQueries(3):
+            for callback in callbacks:
+                callback()
+
+        self.assertEqual(
+            self.get_history(poll)[-1], ("~", "what's new?", {self.here.pk})
+        )
+
+    def test_rolled_back_savepoint_keeps_previous_change(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            poll = PollWithCoalescedWrites.objects.create(
+                question="what's up?", pub_date=today
+            )
+            poll.question = "what's new?"
+            poll.save()
+            try:
+                with transaction.atomic():
+                    poll.question = "discarded"
+                    poll.save()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+
+        self.assertEqual(self.get_history(poll), [("+", "what's new?", set())])
+
+    def test_deletion_is_not_coalesced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            poll = PollWithCoalescedWrites.objects.create(
+                question="what's up?", pub_date=today
+            )
+            poll.question = "what's new?"
+            poll.save()
+            poll_id = poll.id
+            poll.delete()
+
+        self.assertEqual(
+            list(
+                PollWithCoalescedWrites.history.filter(id=poll_id)
+                .order_by("history_date")
+                .values_list("history_type", "question")
+            ),
+            [("+", "what's new?"), ("-", "what's new?")],
+        )
+
+
+class DeltaStorageTest(TestCase):
+    def setUp(self):
+        self.history_model = PollWithDeltaStorage.history.model
+        self.poll = PollWithDeltaStorage.objects.create(
+            question="what's up?", pub_date=today
+        )
+        for status in ["closed", "open", "closed"]:
+            self.poll.status = status
+            self.poll.save()
+
+    def test_only_changed_fields_are_stored(self):
+        self.poll.question = "what's new?"
+        self.poll.save()
+
+        self.assertEqual(
+            list(
+                self.history_model.objects.order_by("history_date").values_list(
+                    "history_changed_fields", "question", "pub_date", "status"
+                )
+            ),
+            [
+                (None, "what's up?", today, "open"),
+                (["status"], None, None, "closed"),
+                (["status"], None, None, "open"),
+                (None, "what's up?", today, "closed"),
+                (["question"], "what's new?", None, None),
+            ],
+        )
+
+    def test_records_are_reconstructed(self):
+        self.poll.question = "what's new?"
+        self.poll.save()
+
+        self.assertEqual(
+            [
+                (record.question, record.pub_date, record.status)
+                for record in self.poll.history.order_by("history_date")
+            ],
+            [
+                ("what's up?", today, "open"),
+                ("what's up?", today, "closed"),
+                ("what's up?", today, "open"),
+                ("what's up?", today, "closed"),
+                ("what's new?", today, "closed"),
+            ],
+        )
+        latest = self.poll.history.latest()
+        self.assertEqual(latest.instance.question, "what's new?")
+        self.assertEqual(latest.instance.status, "closed")
+        self.assertEqual(latest.prev_record.status, "closed")
+        self.assertEqual(latest.prev_record.prev_record.status, "open")
+
+    def test_diff_against(self):
+        self.poll.question = "what's new?"
+        self.poll.save()
+
+        latest = self.poll.history.latest()
+        delta = latest.diff_against(latest.prev_record.prev_record)
+        self.assertEqual(sorted(delta.changed_fields), ["question", "status"])
+
+    def test_most_recent_and_as_of(self):
+        self.assertEqual(self.poll.history.most_recent().status, "closed")
+        second = self.poll.history.order_by("history_date")[1]
+        self.assertEqual(self.poll.history.as_of(second.history_date).status, "closed")
+        (poll,) = PollWithDeltaStorage.history.as_of(second.history_date)
+        self.assertEqual((poll.question, poll.status), ("what's up?", "closed"))
+
+    def test_signal_receives_full_record(self):
+        records = []
+
+        def receiver(sender, history_instance, **kwargs):
+            records.append(history_instance)
+
+        post_create_historical_record.connect(receiver, sender=self.history_model)
+        try:
+            self.poll.status = "open"
+            self.poll.save()
+        finally:
+            post_create_historical_record.disconnect(
+                receiver, sender=self.history_model
+            )
+
+        (record,) = records
+        self.assertEqual(record.question, "what's up?")
+        self.assertEqual(record.history_changed_fields, ["status"])
+
+    def test_records_of_several_objects_are_reconstructed_together(self):
+        other_poll = PollWithDeltaStorage.objects.create(
+            question="how are you?", pub_date=today
+        )
+        other_poll.status = "closed"
+        other_poll.save()
+
+        with self.assertNumQueries(2):
+            records = list(PollWithDeltaStorage.history.order_by("history_id"))
+        self.assertEqual(
+            [(record.question, record.status) for record in records],
+            [
+                ("what's up?", "open"),
+                ("what's up?", "closed"),
+                ("what's up?", "open"),
+                ("what's up?", "closed"),
+                ("how are you?", "open"),
+                ("how are you?", "closed"),
+            ],
+        )
+
+    def test_iterator_fills_in_records(self):
+        with self.assertNumQueries(3):
+            records = list(
+                self.poll.history.order_by("history_id").iterator(chunk_size=2)
+            )
+        self.assertEqual(
+            [(record.question, record.status) for record in records],
+            [
+                ("what's up?", "open"),
+                ("what's up?", "closed"),
+                ("what's up?", "open"),
+                ("what's up?", "closed"),
+            ],
+        )
+
+    def test_lookups_on_delta_fields_raise(self):
+        with self.assertRaises(NotSupportedError):
+            self.poll.history.filter(status="open")
+        with self.assertRaises(NotSupportedError):
+            self.poll.history.filter(
+                models.Q(history_type="~") | models.Q(question__contains="?")
+            )
+        with self.assertRaises(NotSupportedError):
+            self.poll.history.exclude(status="open")
+        with self.assertRaises(NotSupportedError):
+            self.poll.history.values("question")
+        with self.assertRaises(NotSupportedError):
+            self.poll.history.values_list("status", flat=True)
+        self.assertEqual(self.poll.history.filter(history_type="~").count(), 3)
+
+
+class DeduplicatedFieldsTest(TestCase):
+    def setUp(self):
+        self.history_model = DocumentWithDeduplicatedHistory.history.model
+        self.blob_model = self.history_model._history_blob_model
+        self.document = DocumentWithDeduplicatedHistory.objects.create(
+            title="Draft", body="A long body " * 1000, data={"pages": 12}
+        )
+
+    def test_unchanged_values_are_stored_once(self):
+        for title in ["First", "Second"]:
+            self.document.title = title
+            self.document.save()
+
+        records = self.history_model.objects.all()
+        self.assertEqual(len({record.body_digest for record in records}), 1)
+        self.assertEqual(len({record.data_digest for record in records}), 1)
+        self.assertEqual(self.blob_model.objects.count(), 2)
+
+        self.document.body = "A short body"
+        self.document.save()
+        self.assertEqual(self.blob_model.objects.count(), 3)
+
+    def test_null_values_are_not_stored(self):
+        self.document.data = None
+        self.document.save()
+
+        record = self.document.history.first()
+        self.assertIsNone(record.data_digest)
+        self.assertIsNone(record.data)
+        self.assertEqual(self.blob_model.objects.count(), 2)
+
+    def test_values_are_loaded_when_accessed(self):
+        record = self.history_model.objects.get()
+        with self.assertNumQueries(1):
+            self.assertEqual(record.body, "A long body " * 1000)
+        with self.assertNumQueries(1):
+            self.assertEqual(record.data, {"pages": 12})
+        with self.assertNumQueries(0):
+            self.assertEqual(record.instance.body, self.document.body)
+
+    def test_values_of_fetched_records_are_loaded_at_once(self):
+        for title in ["First", "Second"]:
+            self.document.title = title
+            self.document.data = {"pages": len(title)}
+            self.document.save()
+
+        # The records, and the values of all their fields
+        with self.assertNumQueries(2):
+            records = list(self.document.history.all())
+            self.assertEqual(
+                [record.data for record in records],
+                [{"pages": 6}, {"pages": 5}, {"pages": 12}],
+            )
+            self.assertEqual({record.body for record in records}, {self.document.body})
+        with self.assertNumQueries(2):
+            instances = list(self.document.history.as_instances())
+            self.assertEqual(instances[0].data, {"pages": 6})
+        # The records, and the values of each chunk
+        with self.assertNumQueries(3):
+            for record in self.document.history.iterator(chunk_size=2):
+                self.assertEqual(record.body, self.document.body)
+
+    def test_diff_against_only_loads_changed_values(self):
+        self.document.title = "Final"
+        self.document.save()
+        # Unlike the records of the history manager, these aren't loaded
+        new_record, old_record = self.history_model.objects.order_by("-history_id")
+
+        with self.assertNumQueries(0):
+            delta = new_record.diff_against(old_record)
+        self.assertEqual(delta.changed_fields, ["title"])
+
+        self.document.data = {"pages": 13}
+        self.document.save()
+        new_record = self.history_model.objects.order_by("-history_id").first()
+
+        with self.assertNumQueries(2):
+            delta = new_record.diff_against(old_record)
+        self.assertEqual(delta.changed_fields, ["data", "title"])
+        data_change = delta.changes[0]
+        self.assertEqual(data_change.old, {"pages": 12})
+        self.assertEqual(data_change.new, {"pages": 13})
+
+    def test_most_recent(self):
+        self.document.body = "A short body"
+        self.document.save()
+
+        most_recent = self.document.history.most_recent()
+        self.assertEqual(most_recent.body, "A short body")
+        self.assertEqual(most_recent.data, {"pages": 12})
+
+    def test_bulk_history_create(self):
+        documents = [
+            DocumentWithDeduplicatedHistory(title=str(i), body="Same body", data=None)
+            for i in range(3)
+        ]
+        DocumentWithDeduplicatedHistory.objects.bulk_create(documents)
+
+        DocumentWithDeduplicatedHistory.history.bulk_history_create(documents)
+        self.assertEqual(self.blob_model.objects.count(), 3)
+        self.assertEqual(
+            self.blob_model.objects.get(
+                digest=documents[0].history.get().body_digest
+            ).value,
+            "Same body",
+        )
+
+
+class SkipUnchangedSavesTest(TestCase):
+    def setUp(self):
+        self.history_model = PollWithSkipUnchangedSaves.history.model
+        self.history_model.history_save_counts.clear()
+        self.poll = PollWithSkipUnchangedSaves.objects.create(
+            question="what's up?", pub_date=today
+        )
+
+    def test_unchanged_save_is_skipped(self):
+        self.poll.save()
+        poll = PollWithSkipUnchangedSaves.objects.get()
+        with self.assertNumQueries(1):
+            poll.save()
+
+        self.assertEqual(self.poll.history.count(), 1)
+        self.assertEqual(
+            self.history_model.history_save_counts, {"written": 1, "skipped": 2}
+        )
+
+    def test_changed_save_is_written(self):
+        poll = PollWithSkipUnchangedSaves.objects.get()
+        poll.question = "what's new?"
+        poll.save()
+        poll.save()
+        poll.question = "what's up?"
+        poll.save()
+
+        self.assertEqual(
+            list(
+                poll.history.order_by("history_date").values_list(
+                    "history_type", "question"
+                )
+            ),
+            [("+", "what's up?"), ("~", "what's new?"), ("~", "what's up?")],
+        )
+        self.assertEqual(
+            self.history_model.history_save_counts, {"written": 3, "skipped": 1}
+        )
+
+    def test_in_place_modification_is_written(self):
+        poll = PollWithSkipUnchangedSaves.objects.get()
+        poll.settings["public"] = True
+        poll.save()
+
+        self.assertEqual(poll.history.count(), 2)
+        self.assertEqual(poll.history.latest().settings, {"public": True})
+
+    def test_deferred_fields(self):
+        poll = PollWithSkipUnchangedSaves.objects.defer("question").get()
+        poll.save()
+        self.assertEqual(poll.history.count(), 1)
+
+        poll = PollWithSkipUnchangedSaves.objects.defer("question").get()
+        poll.question = "what's new?"
+        poll.save()
+        self.assertEqual(poll.history.count(), 2)
+
+    def test_unloaded_instance_is_written(self):
+        poll = PollWithSkipUnchangedSaves(
+            pk=self.poll.pk, question="what's up?", pub_date=today
+        )
+        poll.save()
+
+        self.assertEqual(self.poll.history.count(), 2)
+
+
+class DirectInsertTest(HistoricalTestCase):
+    def setUp(self):
+        self.history_model = PollWithDirectInsert.history.model
+        self.user = get_user_model().objects.create_user("user", "user@example.com")
+
+    def test_record_is_inserted_without_saving(self):
+        with mock.patch.object(self.history_model, "save") as save:
+            poll = PollWithDirectInsert(question="what's up?", pub_date=today)
+            poll._history_user = self.user
+            poll.save()
+            del poll._history_user
+            poll.question = "what's new?"
+            poll.save()
+        save.assert_not_called()
+
+        first, second = poll.history.order_by("history_id")
+        self.assertIsNotNone(first.history_id)
+        self.assertRecordValues(
+            first,
+            PollWithDirectInsert,
+            {
+                "question": "what's up?",
+                "pub_date": today,
+                "id": poll.id,
+                "history_type": "+",
+            },
+        )
+        self.assertEqual(first.history_user, self.user)
+        self.assertRecordValues(
+            second,
+            PollWithDirectInsert,
+            {
+                "question": "what's new?",
+                "pub_date": today,
+                "id": poll.id,
+                "history_type": "~",
+            },
+        )
+
+    def test_inserted_record_is_passed_to_signal(self):
+        records = []
+
+        def receiver(sender, history_instance, **kwargs):
+            records.append(history_instance)
+
+        post_create_historical_record.connect(receiver, sender=self.history_model)
+        try:
+            poll = PollWithDirectInsert.objects.create(
+                question="what's up?", pub_date=today
+            )
+        finally:
+            post_create_historical_record.disconnect(
+                receiver, sender=self.history_model
+            )
+
+        (record,) = records
+        self.assertFalse(record._state.adding)
+        self.assertEqual(record, poll.history.get())
+
+    def test_save_signal_receivers_disable_direct_insert(self):
+        saved = []
+
+        def receiver(sender, instance, **kwargs):
+            saved.append(instance)
+
+        models.signals.post_save.connect(receiver, sender=self.history_model)
+        try:
+            poll = PollWithDirectInsert.objects.create(
+                question="what's up?", pub_date=today
+            )
+        finally:
+            models.signals.post_save.disconnect(receiver, sender=self.history_model)
+
+        self.assertEqual(saved, [poll.history.get()])
+
+    def test_auto_now_add_field_of_base_is_set(self):
+        poll = PollWithDirectInsertAndTimestamp.objects.create(
+            question="what's up?", pub_date=today
+        )
+
+        record = poll.history.get()
+        self.assertIsNotNone(record.history_recorded_at)
+
+
+class ValidUntilTest(TestCase):
+    def setUp(self):
+        self.dates = [datetime(2021, 1, day) for day in (1, 2, 3)]
+        self.poll = self.save_poll(PollWithValidUntil(pub_date=today), "1", 0)
+
+    def save_poll(self, poll, question, date_index):
+        poll.question = question
+        poll._history_date = self.dates[date_index]
+        poll.save()
+        return poll
+
+    def assertValidUntil(self, poll, expected):
+        self.assertEqual(
+            list(
+                type(poll)
+                .history.filter(id=poll.id)
+                .order_by("history_date", "history_id")
+                .values_list("history_type", "history_valid_until")
+            ),
+            expected,
+        )
+
+    def test_previous_record_is_closed_on_save_and_delete(self):
+        self.save_poll(self.poll, "2", 1)
+        poll_id = self.poll.id
+        self.poll._history_date = self.dates[2]
+        self.poll.delete()
+        self.poll.id = poll_id
+
+        self.assertValidUntil(
+            self.poll,
+            [("+", self.dates[1]), ("~", self.dates[2]), ("-", None)],
+        )
+
+    def test_as_of_uses_valid_until(self):
+        other_poll = self.save_poll(PollWithValidUntil(pub_date=today), "A", 1)
+        self.save_poll(self.poll, "2", 2)
+
+        def questions_as_of(date):
+            return sorted(
+                PollWithValidUntil.history.as_of(date).values_list(
+                    "question", flat=True
+                )
+            )
+
+        self.assertEqual(questions_as_of(self.dates[0]), ["1"])
+        self.assertEqual(questions_as_of(self.dates[1]), ["1", "A"])
+        self.assertEqual(questions_as_of(self.dates[2]), ["2", "A"])
+        self.assertNotIn(
+            "EXISTS", str(PollWithValidUntil.history.as_of(self.dates[2]).query)
+        )
+        other_poll._history_date = self.dates[2]
+        other_poll.delete()
+        self.assertEqual(questions_as_of(self.dates[2]), ["2"])
+
+    def test_alive_during(self):
+        other_poll = self.save_poll(PollWithValidUntil(pub_date=today), "A", 1)
+        other_poll._history_date = self.dates[2]
+        other_poll.delete()
+
+        def alive_during(start, end):
+            return sorted(
+                PollWithValidUntil.history.alive_during(start, end).values_list(
+                    "question", flat=True
+                )
+            )
+
+        self.assertEqual(alive_during(self.dates[0], self.dates[1]), ["1"])
+        self.assertEqual(alive_during(self.dates[0], self.dates[2]), ["1", "A"])
+        self.assertEqual(
+            alive_during(self.dates[2], self.dates[2] + timedelta(days=1)), ["1"]
+        )
+
+    def test_alive_during_requires_valid_until(self):
+        with self.assertRaises(ImproperlyConfigured):
+            Poll.history.alive_during(self.dates[0], self.dates[1])
+
+    def test_backdated_record_is_valid_until_next_record(self):
+        self.save_poll(self.poll, "2", 2)
+        self.save_poll(self.poll, "3", 1)
+
+        self.assertEqual(
+            list(
+                self.poll.history.order_by("history_date").values_list(
+                    "question", "history_valid_until"
+                )
+            ),
+            [("1", self.dates[1]), ("3", self.dates[2]), ("2", None)],
+        )
+
+    def test_record_backdated_before_all_records_is_valid_until_first_one(self):
+        PollWithValidUntil.history.bulk_history_create(
+            [self.poll], default_date=datetime(2020, 12, 31)
+        )
+
+        self.assertValidUntil(self.poll, [("+", self.dates[0]), ("+", None)])
+
+    def test_bulk_history_create_closes_previous_records(self):
+        del self.poll._history_date
+        PollWithValidUntil.history.bulk_history_create(
+            [self.poll, self.poll], default_date=self.dates[1]
+        )
+        # The records created at the same time are valid one after the other
+        self.assertValidUntil(
+            self.poll,
+            [("+", self.dates[1]), ("+", self.dates[1]), ("+", None)],
+        )
+
+    def test_update_with_history_closes_previous_records(self):
+        update_with_history(
+            PollWithValidUntil.objects.all(),
+            default_date=self.dates[1],
+            question="2",
+        )
+
+        self.assertValidUntil(self.poll, [("+", self.dates[1]), ("~", None)])
+
+    def test_buffered_writes_close_previous_records(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            poll = self.save_poll(
+                PollWithBufferedWritesAndValidUntil(pub_date=today), "1", 0
+            )
+            self.save_poll(poll, "2", 1)
+
+        self.assertValidUntil(poll, [("+", self.dates[1]), ("~", None)])
+
+    def test_valid_until_index(self):
+        self.assertIn(
+            ["history_date", "history_valid_until"],
+            [index.fields for index in PollWithValidUntil.history.model._meta.indexes],
+        )
+
+
+class LatestTableTest(TestCase):
+    def setUp(self):
+        self.history_model = PollWithLatestTable.history.model
+        self.latest_model = self.history_model._history_latest_model
+        self.poll = PollWithLatestTable.objects.create(question="1", pub_date=today)
+
+    def assertLatest(self, poll_id, history_type, history_count):
+        latest = self.latest_model.objects.get(pk=poll_id)
+        self.assertEqual(
+            latest.history,
+            self.history_model.objects.filter(id=poll_id).latest(),
+        )
+        self.assertEqual(latest.history_type, history_type)
+        self.assertEqual(latest.history_count, history_count)
+
+    def test_latest_record_is_updated_on_save_and_delete(self):
+        self.assertLatest(self.poll.id, "+", 1)
+        self.poll.question = "2"
+        self.poll.save()
+        self.assertLatest(self.poll.id, "~", 2)
+
+        poll_id = self.poll.id
+        self.poll.delete()
+        self.assertLatest(poll_id, "-", 3)
+
+    def test_most_recent_uses_latest_table(self):
+        self.poll.question = "2"
+        self.poll.save()
+
+        with self.assertNumQueries(1) as queries:
+            most_recent = self.poll.history.most_recent()
+
+        self.assertEqual(most_recent.question, "2")
+        self.assertIn(self.latest_model._meta.db_table, queries[0]["sql"])
+
+    def test_as_of_uses_latest_table(self):
+        self.poll.question = "2"
+        self.poll._history_date = tomorrow
+        self.poll.save()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.poll.history.as_of(tomorrow).question, "2")
+        # Records before the latest one are found without the latest table
+        self.assertEqual(self.poll.history.as_of(today).question, "1")
+
+    def test_latest_of_each_uses_latest_table_when_requested(self):
+        other_poll = PollWithLatestTable.objects.create(question="A", pub_date=today)
+        self.poll.question = "2"
+        self.poll.save()
+
+        queryset = PollWithLatestTable.history.latest_of_each()
+        self.assertNotIn(self.latest_model._meta.db_table, str(queryset.query))
+        queryset = PollWithLatestTable.history.latest_of_each(strategy="latest_table")
+        self.assertIn(self.latest_model._meta.db_table, str(queryset.query))
+        self.assertEqual(sorted(record.question for record in queryset), ["2", "A"])
+        queryset = PollWithLatestTable.history.filter(question="1").latest_of_each()
+        self.assertEqual([record.question for record in queryset], ["1"])
+        queryset = PollWithLatestTable.history.filter(question="1").latest_of_each(
+            strategy="latest_table"
+        )
+        self.assertEqual(list(queryset), [])
+        self.assertLatest(other_poll.id, "+", 1)
+
+    def test_latest_table_strategy_keeps_last_inserted_of_tied_records(self):
+        self.poll.question = "2"
+        self.poll._history_date = self.poll.history.get().history_date
+        self.poll.save()
+
+        self.assertEqual(
+            [
+                record.question
+                for record in PollWithLatestTable.history.latest_of_each(
+                    strategy="latest_table"
+                )
+            ],
+            ["2"],
+        )
+
+    def test_latest_table_strategy_requires_latest_table(self):
+        with self.assertRaises(ImproperlyConfigured):
+            Poll.history.latest_of_each(strategy="latest_table")
+
+    def test_bulk_history_create_updates_latest_records(self):
+        PollWithLatestTable.history.bulk_history_create(
+            [self.poll, self.poll], update=True
+        )
+
+        self.assertLatest(self.poll.id, "~", 3)
+
+    def test_update_and_delete_with_history_update_latest_records(self):
+        update_with_history(PollWithLatestTable.objects.all(), question="2")
+        self.assertLatest(self.poll.id, "~", 2)
+
+        poll_id = self.poll.id
+        delete_with_history(PollWithLatestTable.objects.all())
+        self.assertLatest(poll_id, "-", 3)
+
+    def test_refresh_latest_records(self):
+        self.poll.save()
+        self.latest_model.objects.all().delete()
+        self.latest_model.objects.create(
+            pk=0,
+            history_id=0,
+            history_type="+",
+            history_date=today,
+            history_count=1,
+        )
+
+        refresh_latest_records(PollWithLatestTable)
+
+        self.assertLatest(self.poll.id, "~", 2)
+        self.assertFalse(self.latest_model.objects.filter(pk=0).exists())
+
+
+class CheckpointsTest(TestCase):
+    def setUp(self):
+        self.history_model = PollWithCheckpoints.history.model
+        self.checkpoint_model = self.history_model._history_checkpoint_model
+        self.dates = [datetime(2021, 1, day) for day in range(1, 6)]
+        self.poll = self.save_poll(PollWithCheckpoints(pub_date=today), "1", 0)
+        self.deleted_poll = self.save_poll(PollWithCheckpoints(pub_date=today), "A", 0)
+        self.save_poll(self.poll, "2", 1)
+        self.deleted_poll._history_date = self.dates[1]
+        self.deleted_poll.delete()
+
+    def save_poll(self, poll, question, date_index):
+        poll.question = question
+        poll._history_date = self.dates[date_index]
+        poll.save()
+        return poll
+
+    def questions_as_of(self, date):
+        return sorted(
+            PollWithCheckpoints.history.as_of(date).values_list("question", flat=True)
+        )
+
+    def test_checkpoint_stores_valid_records(self):
+        count = create_history_checkpoint(self.history_model, self.dates[2], "default")
+
+        self.assertEqual(count, 1)
+        (row,) = self.checkpoint_model.objects.all()
+        self.assertEqual(row.id, self.poll.id)
+        self.assertEqual(row.history, self.poll.history.latest())
+
+    def test_as_of_starts_from_checkpoint(self):
+        create_history_checkpoint(self.history_model, self.dates[2], "default")
+        new_poll = self.save_poll(PollWithCheckpoints(pub_date=today), "B", 3)
+        self.save_poll(self.poll, "3", 4)
+
+        queryset = PollWithCheckpoints.history.as_of(self.dates[3])
+        self.assertIn(self.checkpoint_model._meta.db_table, str(queryset.query))
+        self.assertEqual(self.questions_as_of(self.dates[2]), ["2"])
+        self.assertEqual(self.questions_as_of(self.dates[3]), ["2", "B"])
+        self.assertEqual(self.questions_as_of(self.dates[4]), ["3", "B"])
+        # Dates before the first checkpoint search all the history
+        self.assertEqual(self.questions_as_of(self.dates[0]), ["1", "A"])
+
+        new_poll._history_date = self.dates[4]
+        new_poll.delete()
+        self.assertEqual(self.questions_as_of(self.dates[4]), ["3"])
+
+    def test_checkpoint_is_replaced(self):
+        create_history_checkpoint(self.history_model, self.dates[0], "default")
+        create_history_checkpoint(self.history_model, self.dates[0], "default")
+
+        self.assertEqual(self.checkpoint_model.objects.count(), 2)
+
+    def test_backdated_records_refresh_later_checkpoints(self):
+        create_history_checkpoint(self.history_model, self.dates[2], "default")
+        create_history_checkpoint(self.history_model, self.dates[3], "default")
+        backdated_poll = self.save_poll(PollWithCheckpoints(pub_date=today), "B", 1)
+
+        self.assertEqual(self.questions_as_of(self.dates[2]), ["2", "B"])
+        self.assertEqual(self.questions_as_of(self.dates[4]), ["2", "B"])
+
+        self.poll.question = "3"
+        del self.poll._history_date, backdated_poll._history_date
+        PollWithCheckpoints.history.bulk_history_create(
+            [self.poll, backdated_poll], update=True, default_date=self.dates[3]
+        )
+        self.assertEqual(self.questions_as_of(self.dates[2]), ["2", "B"])
+        self.assertEqual(self.questions_as_of(self.dates[3]), ["3", "B"])
+        self.assertEqual(
+            self.checkpoint_model.objects.filter(
+                checkpoint_date=self.dates[3], id=self.poll.id
+            )
+            .get()
+            .history.question,
+            "3",
+        )
+
+
+class IterDeltasTest(TestCase):
+    def assertDeltasMatchDiffs(self, queryset, **kwargs):
+        records = list(queryset.order_by("id", "history_date", "history_id"))
+        expected = [
+            new_record.diff_against(old_record)
+            for old_record, new_record in zip(records, records[1:])
+            if old_record.id == new_record.id
+        ]
+        deltas = list(queryset.iter_deltas(**kwargs))
+
+        self.assertEqual(
+            [(d.old_record, d.new_record, d.changes) for d in deltas],
+            [(d.old_record, d.new_record, d.changes) for d in expected],
+        )
+        self.assertEqual(
+            [d.changed_fields for d in deltas], [d.changed_fields for d in expected]
+        )
+        return deltas
+
+    def create_polls_with_places(self, model):
+        places = [Place.objects.create(name=f"Place {i}") for i in range(3)]
+        polls = [
+            model.objects.create(question=f"Question {i}", pub_date=today)
+            for i in range(2)
+        ]
+        for poll in polls:
+            for place in places:
+                poll.places.add(place)
+                poll.question += "?"
+                poll.save()
+            poll.places.remove(places[0])
+            poll.places.remove(places[1])
+        return polls
+
+    def test_iter_deltas(self):
+        poll = Poll.objects.create(question="what's up?", pub_date=today)
+        other_poll = Poll.objects.create(question="other?", pub_date=today)
+        poll.question = "ask questions?"
+        poll.save()
+        poll.pub_date = tomorrow
+        poll.save()
+        other_poll.delete()
+
+        with self.assertNumQueries(1):
+            deltas = list(Poll.history.iter_deltas())
+
+        self.assertEqual(
+            [delta.changed_fields for delta in deltas],
+            [["question"], ["pub_date"], []],
+        )
+        self.assertEqual(deltas[0].changes[0].old, "what's up?")
+        self.assertEqual(deltas[0].changes[0].new, "ask questions?")
+        self.assertEqual(deltas[2].new_record.history_type, "-")
+        self.assertDeltasMatchDiffs(Poll.history.all())
+
+    def test_iter_deltas_of_fields(self):
+        poll = Poll.objects.create(question="what's up?", pub_date=today)
+        poll.question = "ask questions?"
+        poll.pub_date = tomorrow
+        poll.save()
+
+        (delta,) = poll.history.iter_deltas(fields=["pub_date"])
+
+        self.assertEqual(delta.changed_fields, ["pub_date"])
+        self.assertEqual(delta.changes[0].new, tomorrow)
+
+    def test_iter_deltas_in_chunks(self):
+        poll = Poll.objects.create(question="what's up?", pub_date=today)
+        for i in range(4):
+            poll.question = f"Question {i}"
+            poll.save()
+
+        deltas = self.assertDeltasMatchDiffs(poll.history.all(), chunk_size=2)
+        self.assertEqual(len(deltas), 4)
+
+    def test_iter_deltas_with_m2m_fields(self):
+        self.create_polls_with_places(PollWithManyToMany)
+
+        # One query for the records, and one for the m2m rows of each chunk
+        with self.assertNumQueries(4):
+            deltas = list(PollWithManyToMany.history.iter_deltas(chunk_size=6))
+        self.assertEqual(len(deltas), 16)
+        self.assertDeltasMatchDiffs(PollWithManyToMany.history.all(), chunk_size=6)
+
+    def test_iter_deltas_without_m2m_fields(self):
+        self.create_polls_with_places(PollWithManyToMany)
+
+        with self.assertNumQueries(1):
+            deltas = list(PollWithManyToMany.history.iter_deltas(m2m=[]))
+        self.assertTrue(all("places" not in delta.changed_fields for delta in deltas))
+
+    def test_iter_deltas_of_unknown_m2m_field(self):
+        with self.assertRaises(ValueError):
+            PollWithManyToMany.history.iter_deltas(m2m=["question"])
+
+    def test_iter_deltas_with_delta_m2m_storage(self):
+        self.create_polls_with_places(PollWithDeltaManyToMany)
+
+        self.assertDeltasMatchDiffs(PollWithDeltaManyToMany.history.all())
+        self.assertDeltasMatchDiffs(PollWithDeltaManyToMany.history.all(), chunk_size=4)
+        # The first records of each object are not keyframes
+        self.assertDeltasMatchDiffs(
+            PollWithDeltaManyToMany.history.filter(question__endswith="??")
+        )
+
+    def test_iter_deltas_with_delta_m2m_storage_reads_first_states_once(self):
+        self.create_polls_with_places(PollWithDeltaManyToMany)
+        queryset = PollWithDeltaManyToMany.history.filter(question__endswith="??")
+
+        # The records, the m2m rows of the chunk, and the records and m2m rows
+        # before the first record of each object
+        with self.assertNumQueries(4):
+            deltas = list(queryset.iter_deltas())
+        self.assertEqual(len(deltas), 8)
+
+    def test_iter_deltas_with_delta_storage(self):
+        poll = PollWithDeltaStorage.objects.create(
+            question="what's up?", pub_date=today
+        )
+        for i in range(4):
+            poll.question = f"Question {i}"
+            poll.status = "closed" if i % 2 else "open"
+            poll.save()
+
+        self.assertDeltasMatchDiffs(PollWithDeltaStorage.history.all())
+        self.assertDeltasMatchDiffs(
+            PollWithDeltaStorage.history.exclude(history_type="+")
+        )
+
+    def test_iter_deltas_with_delta_storage_fills_first_records_at_once(self):
+        for question in ("A", "B", "C"):
+            poll = PollWithDeltaStorage.objects.create(
+                question=question, pub_date=today
+            )
+            for i in range(2):
+                poll.question += "?"
+                poll.save()
+        queryset = PollWithDeltaStorage.history.exclude(history_type="+")
+
+        # The records, and the values of the first record of each object
+        with self.assertNumQueries(2):
+            deltas = list(queryset.iter_deltas())
+        self.assertEqual([delta.changed_fields for delta in deltas], [["question"]] * 3)
+        self.assertDeltasMatchDiffs(queryset)
+
+    def test_iter_deltas_with_deduplicated_fields(self):
+        document = DocumentWithDeduplicatedHistory.objects.create(
+            title="Title", body="Body", data={"a": 1}
+        )
+        document.title = "New title"
+        document.save()
+        document.body = "New body"
+        document.data = None
+        document.save()
+
+        # One query for the records, and one for the changed values
+        with self.assertNumQueries(2):
+            deltas = list(DocumentWithDeduplicatedHistory.history.iter_deltas())
+            self.assertEqual(deltas[1].changes[0].old, "Body")
+            self.assertEqual(deltas[1].changes[1].old, {"a": 1})
+        self.assertDeltasMatchDiffs(DocumentWithDeduplicatedHistory.history.all())
@@ -1,23 +1,35 @@
 import unittest
-from datetime import datetime
+from datetime import datetime, timedelta
+from operator import attrgetter
 from unittest import skipUnless
 from unittest.mock import Mock, patch
 
 import django
 from django.contrib.auth import get_user_model
-from django.db import IntegrityError, transaction
-from django.test import TestCase, TransactionTestCase, override_settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat
+from django.test import (
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from simple_history.exceptions import AlternativeManagerError, NotHistoricalModelError
+from simple_history.signals import post_create_historical_record
 from simple_history.tests.models import (
     BulkCreateManyToManyModel,
+    Choice,
     Document,
     Place,
     Poll,
     PollChildBookWithManyToMany,
     PollChildRestaurantWithManyToMany,
     PollWithAlternativeManager,
+    PollWithDirectInsertAndTimestamp,
     PollWithExcludeFields,
     PollWithHistoricalSessionAttr,
     PollWithManyToMany,
@@ -26,16 +38,21 @@ from simple_history.tests.models import (
     PollWithSelfManyToMany,
     PollWithSeveralManyToMany,
     PollWithUniqueQuestion,
+    PollWithUserFromInstance,
     Street,
+    WaterLevel,
 )
 from simple_history.utils import (
     bulk_create_with_history,
     bulk_update_with_history,
+    delete_with_history,
+    get_changed_objs,
     get_history_manager_for_model,
     get_history_model_for_model,
     get_m2m_field_name,
     get_m2m_reverse_field_name,
     update_change_reason,
+    update_with_history,
 )
 
 User = get_user_model()
@@ -257,6 +274,18 @@ class BulkCreateWithHistoryTestCase(TestCase):
         self.assertEqual(PollWithUniqueQuestion.objects.count(), 2)
         self.assertEqual(PollWithUniqueQuestion.history.count(), 2)
 
+    def test_bulk_create_history_with_duplicates_and_natural_key_fields(self):
+        result = bulk_create_with_history(
+            self.data_with_duplicates,
+            PollWithUniqueQuestion,
+            ignore_conflicts=True,
+            natural_key_fields=["question"],
+        )
+
+        self.assertEqual([poll.pk for poll in result], [1, 2])
+        self.assertEqual(PollWithUniqueQuestion.objects.count(), 2)
+        self.assertEqual(PollWithUniqueQuestion.history.count(), 2)
+
     def test_bulk_create_history_with_no_ids_return(self):
         pub_date = timezone.now()
         objects = [
@@ -290,6 +319,154 @@ class BulkCreateWithHistoryTestCase(TestCase):
             self.assertNotEqual(result[0].id, None)
 
 
+class BulkCreateWithHistoryWithoutIdsTestCase(TestCase):
+    def setUp(self):
+        pub_date = timezone.now()
+        self.objects = [
+            Poll(question=f"Question {x}", pub_date=pub_date) for x in range(5, 0, -1)
+        ]
+        _bulk_create = Poll._default_manager.bulk_create
+
+        def mock_bulk_create(objs, *args, **kwargs):
+            _bulk_create(objs, *args, **kwargs)
+            # Like on databases that don't return the IDs
+            return [Poll(question=obj.question, pub_date=pub_date) for obj in objs]
+
+        patcher = patch.object(
+            Poll._default_manager, "bulk_create", side_effect=mock_bulk_create
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assertMatchesObjects(self, result):
+        self.assertEqual(
+            [poll.question for poll in result],
+            [poll.question for poll in self.objects],
+        )
+        self.assertEqual(
+            [poll.pk for poll in result],
+            [Poll.objects.get(question=poll.question).pk for poll in self.objects],
+        )
+        self.assertEqual(
+            sorted(Poll.history.values_list("id", flat=True)),
+            sorted(poll.pk for poll in result),
+        )
+
+    def test_natural_key_fields(self):
+        with self.assertNumQueries(3):
+            result = bulk_create_with_history(
+                self.objects, Poll, natural_key_fields=["question"]
+            )
+
+        self.assertMatchesObjects(result)
+
+    def test_several_natural_key_fields(self):
+        result = bulk_create_with_history(
+            self.objects, Poll, natural_key_fields=["question", "pub_date"]
+        )
+
+        self.assertMatchesObjects(result)
+
+    def test_natural_key_fields_with_batch_size(self):
+        # Creating the objects, fetching them and creating their history in 3 batches
+        with self.assertNumQueries(9):
+            result = bulk_create_with_history(
+                self.objects, Poll, batch_size=2, natural_key_fields=["question"]
+            )
+
+        self.assertMatchesObjects(result)
+
+    def test_field_values_with_batch_size(self):
+        with self.assertNumQueries(9):
+            result = bulk_create_with_history(self.objects, Poll, batch_size=2)
+
+        self.assertMatchesObjects(result)
+
+    def test_identical_objects_in_several_batches(self):
+        pub_date = self.objects[0].pub_date
+        objects = [Poll(question="Question", pub_date=pub_date) for _ in range(3)]
+
+        result = bulk_create_with_history(objects, Poll, batch_size=2)
+
+        # Each batch matches all the rows
+        self.assertEqual(len(result), 3)
+        self.assertEqual(len({poll.pk for poll in result}), 3)
+        self.assertEqual(Poll.history.count(), 3)
+
+
+@skipUnlessDBFeature("supports_update_conflicts")
+class BulkCreateWithHistoryUpdateConflictsTestCase(TestCase):
+    def setUp(self):
+        self.pub_date = timezone.now()
+        self.existing_poll = PollWithUniqueQuestion.objects.create(
+            question="Question 1", pub_date=self.pub_date
+        )
+        self.new_pub_date = self.pub_date + timedelta(days=1)
+        self.data = [
+            PollWithUniqueQuestion(question="Question 1", pub_date=self.new_pub_date),
+            PollWithUniqueQuestion(question="Question 2", pub_date=self.new_pub_date),
+        ]
+
+    def test_bulk_create_history_with_update_conflicts(self):
+        result = bulk_create_with_history(
+            self.data,
+            PollWithUniqueQuestion,
+            update_conflicts=True,
+            update_fields=["pub_date"],
+            unique_fields=["question"],
+            default_change_reason="sync",
+        )
+
+        self.assertEqual(
+            [poll.question for poll in result], ["Question 1", "Question 2"]
+        )
+        self.assertEqual(result[0].pk, self.existing_poll.pk)
+        self.assertEqual(PollWithUniqueQuestion.objects.count(), 2)
+        self.assertQuerySetEqual(
+            PollWithUniqueQuestion.history.order_by("question", "history_id"),
+            [
+                ("Question 1", "+", self.pub_date, None),
+                ("Question 1", "~", self.new_pub_date, "sync"),
+                ("Question 2", "+", self.new_pub_date, "sync"),
+            ],
+            attrgetter("question", "history_type", "pub_date", "history_change_reason"),
+        )
+
+    def test_bulk_create_history_with_update_conflicts_records_updated_rows(self):
+        bulk_create_with_history(
+            self.data,
+            PollWithUniqueQuestion,
+            update_conflicts=True,
+            update_fields=["question"],
+            unique_fields=["question"],
+        )
+
+        # Only the update fields of the existing row were updated
+        updated_record = PollWithUniqueQuestion.history.get(history_type="~")
+        self.assertEqual(updated_record.pub_date, self.pub_date)
+
+    def test_bulk_create_history_with_update_conflicts_num_queries(self):
+        # Fetching the existing rows, upserting, fetching the rows, and creating
+        # the history of the inserted and updated rows
+        with self.assertNumQueries(5):
+            bulk_create_with_history(
+                self.data,
+                PollWithUniqueQuestion,
+                update_conflicts=True,
+                update_fields=["pub_date"],
+                unique_fields=["question"],
+            )
+
+    def test_bulk_create_history_with_update_conflicts_without_unique_fields(self):
+        with self.assertRaises(ValueError):
+            bulk_create_with_history(
+                self.data,
+                PollWithUniqueQuestion,
+                update_conflicts=True,
+                update_fields=["pub_date"],
+            )
+
+
 class BulkCreateWithHistoryTransactionTestCase(TransactionTestCase):
     def setUp(self):
         self.data = [
@@ -504,6 +681,83 @@ class BulkUpdateWithHistoryTestCase(TestCase):
         )
         self.assertEqual(rows_updated, 5)
 
+    def test_bulk_update_history_only_changed(self):
+        with self.assertNumQueries(3):
+            rows_updated = bulk_update_with_history(
+                self.data, Poll, fields=["question", "pub_date"], only_changed=True
+            )
+
+        self.assertEqual(rows_updated, 1)
+        self.assertEqual(Poll.objects.get(id=4).question, "Updated question")
+        self.assertQuerySetEqual(
+            Poll.history.filter(history_type="~"),
+            ["Updated question"],
+            attrgetter("question"),
+        )
+
+    def test_bulk_update_history_only_changed_without_changes(self):
+        self.data[3].question = "Question 4"
+
+        with self.assertNumQueries(1):
+            rows_updated = bulk_update_with_history(
+                self.data, Poll, fields=["question"], only_changed=True
+            )
+
+        self.assertEqual(rows_updated, 0)
+        self.assertFalse(Poll.history.filter(history_type="~").exists())
+
+    def test_bulk_update_history_only_changed_with_batch_size(self):
+        self.data[0].question = "Updated question 1"
+
+        rows_updated = bulk_update_with_history(
+            self.data, Poll, fields=["question"], batch_size=2, only_changed=True
+        )
+
+        self.assertEqual(rows_updated, 2)
+        self.assertEqual(
+            sorted(Poll.history.filter(history_type="~").values_list("id", flat=True)),
+            [1, 4],
+        )
+
+    def test_bulk_update_history_only_changed_skips_missing_objects(self):
+        missing_poll = Poll(id=6, question="Question 6", pub_date=timezone.now())
+
+        rows_updated = bulk_update_with_history(
+            [*self.data, missing_poll], Poll, fields=["question"], only_changed=True
+        )
+
+        self.assertEqual(rows_updated, 1)
+        self.assertFalse(Poll.history.filter(id=6).exists())
+
+    def test_get_changed_objs(self):
+        self.data[0].question = "Updated question 1"
+        missing_poll = Poll(id=6, question="Question 6", pub_date=timezone.now())
+
+        with self.assertNumQueries(1):
+            changed_objs = get_changed_objs(
+                [*self.data, missing_poll], Poll, ["question"]
+            )
+
+        self.assertEqual(changed_objs, [self.data[0], self.data[3]])
+        rows_updated = bulk_update_with_history(changed_objs, Poll, ["question"])
+        self.assertEqual(rows_updated, 2)
+        self.assertEqual(
+            sorted(Poll.history.filter(history_type="~").values_list("id", flat=True)),
+            [1, 4],
+        )
+
+    def test_get_changed_objs_requires_fields(self):
+        with self.assertRaises(ValueError):
+            get_changed_objs(self.data, Poll, [])
+
+    def test_bulk_update_history_only_changed_requires_fields(self):
+        for fields in (None, []):
+            with self.assertRaises(ValueError):
+                bulk_update_with_history(
+                    self.data, Poll, fields=fields, only_changed=True
+                )
+        self.assertFalse(Poll.history.filter(history_type="~").exists())
+
 
 class BulkUpdateWithHistoryAlternativeManagersTestCase(TestCase):
     def setUp(self):
@@ -579,6 +833,299 @@ class BulkUpdateWithHistoryAlternativeManagersTestCase(TestCase):
             )
 
 
+class UpdateWithHistoryTestCase(TestCase):
+    def setUp(self):
+        self.data = [
+            Poll(id=x, question=f"Question {x}", pub_date=timezone.now())
+            for x in range(1, 6)
+        ]
+        bulk_create_with_history(self.data, Poll)
+
+    def test_update_with_history(self):
+        rows_updated = update_with_history(
+            Poll.objects.filter(id__lte=3), question="Updated question"
+        )
+
+        self.assertEqual(rows_updated, 3)
+        self.assertEqual(Poll.objects.filter(question="Updated question").count(), 3)
+        self.assertEqual(
+            sorted(
+                Poll.history.filter(history_type="~").values_list(
+                    "id", "question", "pub_date"
+                )
+            ),
+            sorted(
+                Poll.objects.filter(id__lte=3).values_list("id", "question", "pub_date")
+            ),
+        )
+
+    def test_update_with_history_num_queries(self):
+        with self.assertNumQueries(3):
+            update_with_history(Poll.objects.all(), question="Updated question")
+
+    def test_update_with_history_with_batch_size(self):
+        with self.assertNumQueries(7):
+            update_with_history(
+                Poll.objects.all(), question="Updated question", batch_size=2
+            )
+
+        self.assertEqual(Poll.history.filter(history_type="~").count(), 5)
+
+    def test_update_with_history_of_objects_no_longer_matching_the_filter(self):
+        update_with_history(
+            Poll.objects.filter(question="Question 1"), question="Updated question"
+        )
+
+        record = Poll.history.get(history_type="~")
+        self.assertEqual(record.id, 1)
+        self.assertEqual(record.question, "Updated question")
+
+    def test_update_with_history_with_expressions(self):
+        update_with_history(
+            Poll.objects.filter(id=1), question=Concat(F("question"), Value("?"))
+        )
+
+        self.assertEqual(Poll.history.get(history_type="~").question, "Question 1?")
+
+    def test_update_with_history_with_defaults(self):
+        user = User.objects.create_user("tester", "tester@example.com")
+        date = datetime(2020, 7, 1)
+
+        update_with_history(
+            Poll.objects.all(),
+            default_user=user,
+            default_change_reason="my change reason",
+            default_date=date,
+            question="Updated question",
+        )
+
+        self.assertEqual(
+            set(
+                Poll.history.filter(history_type="~").values_list(
+                    "history_user", "history_change_reason", "history_date"
+                )
+            ),
+            {(user.pk, "my change reason", date)},
+        )
+
+    def test_update_with_history_with_custom_model_attributes(self):
+        PollWithHistoricalSessionAttr.objects.create(id=1, question="Question 1")
+
+        update_with_history(
+            PollWithHistoricalSessionAttr.objects.all(),
+            custom_historical_attrs={"session": "training"},
+            question="Updated question",
+        )
+
+        record = PollWithHistoricalSessionAttr.history.first()
+        self.assertEqual(record.question, "Updated question")
+        self.assertEqual(record.session, "training")
+
+    def test_update_with_history_with_history_relation(self):
+        street = Street.objects.create(name="Street 1")
+
+        update_with_history(Street.objects.all(), name="Street 2")
+
+        self.assertEqual(
+            list(street.history.values_list("name", flat=True)),
+            ["Street 2", "Street 1"],
+        )
+
+    def test_update_with_history_with_uuid_history_ids(self):
+        poll = PollWithManyToManyCustomHistoryID.objects.create(
+            question="Question 1", pub_date=timezone.now()
+        )
+
+        update_with_history(
+            PollWithManyToManyCustomHistoryID.objects.all(),
+            question="Updated question",
+        )
+
+        self.assertEqual(
+            list(poll.history.values_list("history_type", "question")),
+            [("~", "Updated question"), ("+", "Question 1")],
+        )
+
+    @override_settings(SIMPLE_HISTORY_ENABLED=False)
+    def test_update_with_history_without_history_enabled(self):
+        update_with_history(Poll.objects.all(), question="Updated question")
+
+        self.assertEqual(Poll.objects.filter(question="Updated question").count(), 5)
+        self.assertEqual(Poll.history.count(), 5)
+
+    def test_update_with_history_on_model_without_history_raises_error(self):
+        with self.assertRaises(NotHistoricalModelError):
+            update_with_history(Place.objects.all(), name="test")
+
+    def test_update_with_history_with_user_depending_on_instance(self):
+        users = [
+            User.objects.create_user(f"tester{x}", f"tester{x}@example.com")
+            for x in range(2)
+        ]
+        for user in users:
+            PollWithUserFromInstance.objects.create(
+                question="Question", pub_date=timezone.now(), author=user
+            )
+
+        update_with_history(
+            PollWithUserFromInstance.objects.all(), question="Updated question"
+        )
+
+        self.assertEqual(
+            sorted(
+                PollWithUserFromInstance.history.filter(history_type="~").values_list(
+                    "question", "history_user"
+                )
+            ),
+            [("Updated question", user.pk) for user in users],
+        )
+
+    def test_update_with_history_sets_auto_now_add_field_of_base(self):
+        PollWithDirectInsertAndTimestamp.objects.create(
+            question="Question", pub_date=timezone.now()
+        )
+        update_with_history(
+            PollWithDirectInsertAndTimestamp.objects.all(), question="Updated question"
+        )
+
+        record = PollWithDirectInsertAndTimestamp.history.get(history_type="~")
+        self.assertIsNotNone(record.history_recorded_at)
+
+
+class DeleteWithHistoryTestCase(TestCase):
+    def setUp(self):
+        self.data = [
+            Poll(id=x, question=f"Question {x}", pub_date=timezone.now())
+            for x in range(1, 6)
+        ]
+        bulk_create_with_history(self.data, Poll)
+
+    def test_delete_with_history(self):
+        deleted = Poll.objects.filter(id__lte=3)
+        expected_records = sorted(deleted.values_list("id", "question", "pub_date"))
+
+        result = delete_with_history(deleted.only("id"))
+
+        self.assertEqual(result, (3, {"tests.Poll": 3}))
+        self.assertEqual(Poll.objects.count(), 2)
+        self.assertEqual(
+            sorted(
+                Poll.history.filter(history_type="-").values_list(
+                    "id", "question", "pub_date"
+                )
+            ),
+            expected_records,
+        )
+
+    def test_delete_with_history_inserts_history_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            delete_with_history(Poll.objects.all())
+
+        inserts = [
+            query["sql"] for query in queries if query["sql"].startswith("INSERT")
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Poll.history.filter(history_type="-").count(), 5)
+
+    def test_delete_with_history_with_user_depending_on_instance(self):
+        users = [
+            User.objects.create_user(f"tester{x}", f"tester{x}@example.com")
+            for x in range(2)
+        ]
+        for user in users:
+            PollWithUserFromInstance.objects.create(
+                question="Question", pub_date=timezone.now(), author=user
+            )
+
+        delete_with_history(PollWithUserFromInstance.objects.all())
+
+        self.assertEqual(
+            sorted(
+                PollWithUserFromInstance.history.filter(history_type="-").values_list(
+                    "history_user", flat=True
+                )
+            ),
+            [user.pk for user in users],
+        )
+
+    def test_delete_with_history_with_defaults(self):
+        user = User.objects.create_user("tester", "tester@example.com")
+        date = datetime(2020, 7, 1)
+
+        delete_with_history(
+            Poll.objects.all(),
+            default_user=user,
+            default_change_reason="my change reason",
+            default_date=date,
+        )
+
+        self.assertEqual(
+            set(
+                Poll.history.filter(history_type="-").values_list(
+                    "history_user", "history_change_reason", "history_date"
+                )
+            ),
+            {(user.pk, "my change reason", date)},
+        )
+
+    def test_delete_with_history_of_objects_deleted_by_cascade(self):
+        choice = Choice.objects.create(poll=self.data[0], choice="Yes", votes=0)
+
+        delete_with_history(Poll.objects.filter(id=1))
+
+        self.assertEqual(
+            list(choice.history.values_list("history_type", "choice")),
+            [("-", "Yes"), ("+", "Yes")],
+        )
+
+    def test_delete_with_history_with_cascade_delete_history(self):
+        WaterLevel.objects.create(waters="Sea", level=2, date=timezone.now())
+        water_level = WaterLevel.objects.create(
+            waters="Lake", level=1, date=timezone.now()
+        )
+
+        delete_with_history(WaterLevel.objects.filter(waters="Sea"))
+
+        self.assertEqual(
+            list(WaterLevel.history.values_list("waters", flat=True)), ["Lake"]
+        )
+        self.assertEqual(water_level.history.count(), 1)
+
+    def test_delete_with_history_with_receivers_of_history_signals(self):
+        records = []
+
+        def receiver(sender, history_instance, **kwargs):
+            records.append(history_instance)
+
+        post_create_historical_record.connect(receiver, sender=Poll.history.model)
+        try:
+            delete_with_history(Poll.objects.filter(id__lte=2))
+        finally:
+            post_create_historical_record.disconnect(
+                receiver, sender=Poll.history.model
+            )
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(Poll.history.filter(history_type="-").count(), 2)
+
+    @override_settings(SIMPLE_HISTORY_ENABLED=False)
+    def test_delete_with_history_without_history_enabled(self):
+        delete_with_history(Poll.objects.all())
+
+        self.assertEqual(Poll.objects.count(), 0)
+        self.assertEqual(Poll.history.count(), 5)
+
+    def test_per_object_history_is_written_after_delete_with_history(self):
+        delete_with_history(Poll.objects.filter(id=1))
+        Poll.objects.get(id=2).delete()
+
+        self.assertEqual(Poll.history.filter(history_type="-").count(), 2)
+
+    def test_delete_with_history_on_model_without_history_raises_error(self):
+        with self.assertRaises(NotHistoricalModelError):
+            delete_with_history(Place.objects.all())
+
+
 class CustomHistoricalAttrsTest(TestCase):
     def setUp(self):
         self.data = [
@@ -0,0 +1,185 @@
+from datetime import datetime
+
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from simple_history.signals import post_create_historical_record
+from simple_history.writers import (
+    QueueHistoryWriter,
+    get_outbox_models,
+    process_outbox,
+)
+
+from ..models import PollWithHistoryOutbox, PollWithQueuedHistory, poll_history_queue
+
+today = datetime(2021, 1, 1, 10, 0)
+
+
+class QueueHistoryWriterTest(TestCase):
+    def tearDown(self):
+        poll_history_queue.drain()
+
+    def test_records_are_inserted_when_drained(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            poll = PollWithQueuedHistory.objects.create(
+                question="what's up?", pub_date=today
+            )
+            poll.question = "what's new?"
+            poll.save()
+        self.assertEqual(poll.history.count(), 0)
+
+        poll_history_queue.drain()
+
+        self.assertEqual(
+            list(
+                poll.history.order_by("history_id").values_list(
+                    "history_type", "question"
+                )
+            ),
+            [("+", "what's up?"), ("~", "what's new?")],
+        )
+
+    def test_rolled_back_records_are_not_queued(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            PollWithQueuedHistory.objects.create(question="what's up?", pub_date=today)
+            try:
+                with transaction.atomic():
+                    PollWithQueuedHistory.objects.create(
+                        question="what's new?", pub_date=today
+                    )
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+
+        self.assertEqual(
+            sum(entry_queue.qsize() for entry_queue in poll_history_queue.queues), 1
+        )
+
+    def test_records_of_an_object_share_a_queue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for question in ["what's up?", "what's new?", "how are you?"]:
+                poll = PollWithQueuedHistory.objects.create(
+                    question=question, pub_date=today
+                )
+                poll.save()
+                poll.save()
+
+        for entry_queue in poll_history_queue.queues:
+            pks = [entry.instance.pk for entry in entry_queue.queue]
+            for pk in pks:
+                self.assertEqual(pks.count(pk), 3)
+
+
+class QueueHistoryWriterWorkerTest(TransactionTestCase):
+    def setUp(self):
+        self.writer = QueueHistoryWriter(batch_size=1)
+
+    def tearDown(self):
+        self.writer.stop()
+
+    def test_worker_inserts_records(self):
+        poll = PollWithQueuedHistory.objects.create(
+            question="what's up?", pub_date=today
+        )
+        poll.save()
+        entries = []
+        for entry_queue in poll_history_queue.queues:
+            while not entry_queue.empty():
+                entries.append(entry_queue.get_nowait())
+                entry_queue.task_done()
+
+        for entry in entries:
+            self.writer.put(entry)
+        self.writer.drain()
+
+        self.assertEqual(poll.history.count(), 2)
+        self.assertEqual(len(self.writer._threads), 1)
+
+    def test_stop_inserts_records_and_joins_workers(self):
+        poll = PollWithQueuedHistory.objects.create(
+            question="what's up?", pub_date=today
+        )
+        (entry,) = [
+            entry_queue.get_nowait()
+            for entry_queue in poll_history_queue.queues
+            if not entry_queue.empty()
+        ]
+        self.writer.put(entry)
+        threads = list(self.writer._threads)
+
+        self.writer.stop()
+
+        self.assertEqual(poll.history.count(), 1)
+        self.assertEqual(self.writer._threads, [])
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+
+
+class OutboxHistoryWriterTest(TestCase):
+    def setUp(self):
+        self.outbox_model = next(
+            outbox_model
+            for outbox_model in get_outbox_models()
+            if outbox_model.history_model is PollWithHistoryOutbox.history.model
+        )
+
+    def test_records_are_written_to_outbox(self):
+        poll = PollWithHistoryOutbox.objects.create(
+            question="what's up?", pub_date=today
+        )
+        poll.question = "what's new?"
+        poll.save()
+
+        self.assertEqual(poll.history.count(), 0)
+        self.assertEqual(self.outbox_model.objects.count(), 2)
+
+        self.assertEqual(process_outbox(self.outbox_model, batch_size=1), 2)
+
+        self.assertEqual(self.outbox_model.objects.count(), 0)
+        self.assertEqual(
+            list(
+                poll.history.order_by("history_id").values_list(
+                    "history_type", "question"
+                )
+            ),
+            [("+", "what's up?"), ("~", "what's new?")],
+        )
+
+    def test_outbox_has_no_indexes(self):
+        for field in self.outbox_model._meta.fields:
+            self.assertFalse(field.db_index, field.name)
+            if field.is_relation:
+                self.assertFalse(field.db_constraint, field.name)
+
+    def test_rolled_back_records_are_discarded(self):
+        try:
+            with transaction.atomic():
+                PollWithHistoryOutbox.objects.create(
+                    question="what's up?", pub_date=today
+                )
+                raise RuntimeError
+        except RuntimeError:
+            pass
+
+        self.assertEqual(self.outbox_model.objects.count(), 0)
+
+    def test_signal_is_sent_when_processed(self):
+        history_instances = []
+
+        def receiver(sender, history_instance, instance, **kwargs):
+            history_instances.append(history_instance)
+            self.assertEqual(instance.question, "what's up?")
+
+        poll = PollWithHistoryOutbox.objects.create(
+            question="what's up?", pub_date=today
+        )
+        post_create_historical_record.connect(
+            receiver, sender=PollWithHistoryOutbox.history.model
+        )
+        try:
+            process_outbox(self.outbox_model)
+        finally:
+            post_create_historical_record.disconnect(
+                receiver, sender=PollWithHistoryOutbox.history.model
+            )
+
+        self.assertEqual(history_instances, [poll.history.get()])
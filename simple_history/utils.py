@@ -1,8 +1,16 @@
-from django.db import transaction
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connections, router, transaction
 from django.db.models import Case, ForeignKey, ManyToManyField, Q, When
+from django.db.models.deletion import Collector
 from django.forms.models import model_to_dict
+from django.utils import timezone
 
 from simple_history.exceptions import AlternativeManagerError, NotHistoricalModelError
+from simple_history.signals import (
+    post_create_historical_record,
+    pre_create_historical_record,
+)
 
 
 def update_change_reason(instance, reason):
@@ -50,6 +58,18 @@ def get_history_model_for_model(model):
     return get_history_manager_for_model(model).model
 
 
+def refresh_latest_records(model, pks=None):
+    """
+    Recompute the rows of the table of the ``latest_table`` option of ``model`` -
+    of all its objects, or of the ones with the primary keys ``pks`` - from their
+    historical records.
+    """
+    history_model = get_history_model_for_model(model)
+    history_model._history_write_plan.refresh_latest_records(
+        router.db_for_write(history_model), pks=pks
+    )
+
+
 def get_app_model_primary_key_name(model):
     """Return the primary key name for a given app model."""
     if isinstance(model._meta.pk, ForeignKey):
@@ -90,14 +110,20 @@ def bulk_create_with_history(
     default_change_reason=None,
     default_date=None,
     custom_historical_attrs=None,
+    natural_key_fields=None,
+    update_conflicts=False,
+    update_fields=None,
+    unique_fields=None,
 ):
     """
     Bulk create the objects specified by objs while also bulk creating
     their history (all in one transaction).
-    Because of not providing primary key attribute after bulk_create on any DB except
-    Postgres
+    Because of not providing primary key attribute after bulk_create on DBs that
+    don't support RETURNING, or when ignoring conflicts
     (https://docs.djangoproject.com/en/stable/ref/models/querysets/#bulk-create)
-    Divide this process on two transactions for other DB's
+    Divide this process on two transactions for other DB's, where the created
+    objects are fetched in batches, matching them on their field values - or on
+    ``natural_key_fields``, if provided
     :param objs: List of objs (not yet saved to the db) of type model
     :param model: Model class that should be created
     :param batch_size: Number of objects that should be created in each batch
@@ -109,8 +135,30 @@ def bulk_create_with_history(
         record
     :param custom_historical_attrs: Optional dict of field `name`:`value` to specify
         values for custom fields
+    :param natural_key_fields: Optional names of fields whose values identify each of
+        the objs, for fetching the created objects if their IDs are not returned
+    :param update_conflicts: If True, update the `update_fields` of the existing rows
+        that conflict on `unique_fields`, like ``bulk_create()`` does; their historical
+        records are then of the "~" type instead of "+"
+    :param update_fields: The fields to update on conflict
+    :param unique_fields: The fields identifying the existing rows, which are required
+        with `update_conflicts` (even on databases that don't accept them in
+        ``bulk_create()``)
     :return: List of objs with IDs
     """
+    if update_conflicts:
+        return _bulk_upsert_with_history(
+            objs,
+            model,
+            batch_size=batch_size,
+            update_fields=update_fields,
+            unique_fields=unique_fields,
+            default_user=default_user,
+            default_change_reason=default_change_reason,
+            default_date=default_date,
+            custom_historical_attrs=custom_historical_attrs,
+        )
+
     # Exclude ManyToManyFields because they end up as invalid kwargs to
     # model.objects.filter(...) below.
     exclude_fields = [
@@ -138,34 +186,14 @@ def bulk_create_with_history(
             )
     if second_transaction_required:
         with transaction.atomic(savepoint=False):
-            # Generate a common query to avoid n+1 selections
-            #   https://github.com/jazzband/django-simple-history/issues/974
-            cumulative_filter = None
-            obj_when_list = []
-            for i, obj in enumerate(objs_with_id):
-                attributes = dict(
-                    filter(
-                        lambda x: x[1] is not None,
-                        model_to_dict(obj, exclude=exclude_fields).items(),
-                    )
+            if natural_key_fields:
+                obj_list = _get_objs_by_natural_key(
+                    model, model_manager, objs_with_id, natural_key_fields, batch_size
                 )
-                q = Q(**attributes)
-                cumulative_filter = (cumulative_filter | q) if cumulative_filter else q
-                # https://stackoverflow.com/a/49625179/1960509
-                # DEV: If an attribute has `then` as a key
-                #   then they'll also run into issues with `bulk_update`
-                #   due to shared implementation
-                #   https://github.com/django/django/blob/4.0.4/django/db/models/query.py#L624-L638
-                obj_when_list.append(When(**attributes, then=i))
-            obj_list = (
-                list(
-                    model_manager.filter(cumulative_filter).order_by(
-                        Case(*obj_when_list)
-                    )
+            else:
+                obj_list = _get_objs_by_field_values(
+                    model, model_manager, objs_with_id, exclude_fields, batch_size
                 )
-                if objs_with_id
-                else []
-            )
             history_manager.bulk_history_create(
                 obj_list,
                 batch_size=batch_size,
@@ -178,6 +206,171 @@ def bulk_create_with_history(
     return objs_with_id
 
 
+def _bulk_upsert_with_history(
+    objs, model, *, batch_size, update_fields, unique_fields, **history_kwargs
+):
+    """
+    Helper function for ``bulk_create_with_history()``: bulk create the objects,
+    updating the existing rows that conflict on ``unique_fields``, and bulk create
+    their history - with the "+" type for the inserted rows, and "~" for the updated
+    ones (which are told apart by fetching the existing rows beforehand).
+    """
+    if not unique_fields:
+        raise ValueError(
+            "Updating conflicts with history requires the unique fields to be set."
+        )
+    history_manager = get_history_manager_for_model(model)
+    model_manager = model._default_manager
+    connection = connections[router.db_for_write(model)]
+    unique_fields = [
+        model._meta.pk.name if name == "pk" else name for name in unique_fields
+    ]
+    attnames = [model._meta.get_field(name).attname for name in unique_fields]
+    history_kwargs["default_date"] = history_kwargs["default_date"] or timezone.now()
+
+    with transaction.atomic(savepoint=False):
+        existing_natural_keys = {
+            natural_key
+            for batch_filter in _get_natural_key_filters(
+                model, objs, attnames, batch_size
+            )
+            for natural_key in model_manager.filter(batch_filter).values_list(*attnames)
+        }
+        model_manager.bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            update_fields=update_fields,
+            # Some databases (e.g. MySQL) update the rows conflicting on any
+            # unique constraint, and don't accept the unique fields
+            unique_fields=(
+                unique_fields
+                if connection.features.supports_update_conflicts_with_target
+                else None
+            ),
+        )
+        # The updated rows are fetched again, as only `update_fields` were updated
+        obj_list = _get_objs_by_natural_key(
+            model, model_manager, objs, unique_fields, batch_size
+        )
+        created_objs, updated_objs = [], []
+        for obj in obj_list:
+            natural_key = tuple(getattr(obj, attname) for attname in attnames)
+            if natural_key in existing_natural_keys:
+                updated_objs.append(obj)
+            else:
+                created_objs.append(obj)
+        history_manager.bulk_history_create(
+            created_objs, batch_size=batch_size, **history_kwargs
+        )
+        history_manager.bulk_history_create(
+            updated_objs, batch_size=batch_size, update=True, **history_kwargs
+        )
+    return obj_list
+
+
+def _get_batches(model, objs, fields, batch_size):
+    """
+    Helper function for the ``bulk_*_with_history()`` functions: split ``objs`` into
+    batches of at most ``batch_size`` objects, small enough for the database to
+    accept one query parameter per each of their ``fields``.
+    """
+    connection = connections[router.db_for_write(model)]
+    max_batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+    for start in range(0, len(objs), batch_size):
+        end = start + batch_size
+        yield objs[start:end]
+
+
+def _get_objs_by_field_values(model, model_manager, objs, exclude_fields, batch_size):
+    """
+    Helper function for ``bulk_create_with_history()``: return the created
+    ``objs`` fetched from the database, matching them on all their field values.
+    Rows matched by several batches - i.e. by identical objects - are only
+    returned once.
+    """
+    # Generate a common query per batch to avoid n+1 selections
+    #   https://github.com/jazzband/django-simple-history/issues/974
+    obj_list = []
+    matched_pks = set()
+    # Each field value is a parameter of both the filter and the ordering
+    fields = [
+        field.name
+        for field in model._meta.get_fields()
+        if getattr(field, "concrete", False) and field.name not in exclude_fields
+    ] * 2
+    for batch in _get_batches(model, objs, fields, batch_size):
+        cumulative_filter = None
+        obj_when_list = []
+        for i, obj in enumerate(batch):
+            attributes = dict(
+                filter(
+                    lambda x: x[1] is not None,
+                    model_to_dict(obj, exclude=exclude_fields).items(),
+                )
+            )
+            q = Q(**attributes)
+            cumulative_filter = (cumulative_filter | q) if cumulative_filter else q
+            # https://stackoverflow.com/a/49625179/1960509
+            # DEV: If an attribute has `then` as a key
+            #   then they'll also run into issues with `bulk_update`
+            #   due to shared implementation
+            #   https://github.com/django/django/blob/4.0.4/django/db/models/query.py#L624-L638
+            obj_when_list.append(When(**attributes, then=i))
+        for obj in model_manager.filter(cumulative_filter).order_by(
+            Case(*obj_when_list)
+        ):
+            if obj.pk not in matched_pks:
+                matched_pks.add(obj.pk)
+                obj_list.append(obj)
+    return obj_list
+
+
+def _get_objs_by_natural_key(
+    model, model_manager, objs, natural_key_fields, batch_size
+):
+    """
+    Helper function for ``bulk_create_with_history()``: return the created
+    ``objs`` fetched from the database, in the same order, matching them on the
+    values of their ``natural_key_fields``. Objects that are not found, or whose
+    natural key was already matched, are left out.
+    """
+    attnames = [model._meta.get_field(name).attname for name in natural_key_fields]
+
+    def get_natural_key(obj):
+        return tuple(getattr(obj, attname) for attname in attnames)
+
+    objs_by_natural_key = {}
+    for batch_filter in _get_natural_key_filters(model, objs, attnames, batch_size):
+        for obj in model_manager.filter(batch_filter):
+            objs_by_natural_key[get_natural_key(obj)] = obj
+    obj_list = []
+    for natural_key in map(get_natural_key, objs):
+        # Objects with the same natural key (e.g. ignored conflicts) match only once
+        if natural_key in objs_by_natural_key:
+            obj_list.append(objs_by_natural_key.pop(natural_key))
+    return obj_list
+
+
+def _get_natural_key_filters(model, objs, attnames, batch_size):
+    """
+    Helper function for ``bulk_create_with_history()``: yield a filter per batch of
+    ``objs``, matching the rows with the same values of ``attnames``.
+    """
+    for batch in _get_batches(model, objs, attnames, batch_size):
+        if len(attnames) == 1:
+            attname = attnames[0]
+            yield Q(**{f"{attname}__in": [getattr(obj, attname) for obj in batch]})
+        else:
+            batch_filter = Q()
+            for obj in batch:
+                batch_filter |= Q(
+                    **{attname: getattr(obj, attname) for attname in attnames}
+                )
+            yield batch_filter
+
+
 def bulk_update_with_history(
     objs,
     model,
@@ -188,6 +381,7 @@ def bulk_update_with_history(
     default_date=None,
     manager=None,
     custom_historical_attrs=None,
+    only_changed=False,
 ):
     """
     Bulk update the objects specified by objs while also bulk creating
@@ -207,14 +401,28 @@ def bulk_update_with_history(
         manager
     :param custom_historical_attrs: Optional dict of field `name`:`value` to specify
         values for custom fields
+    :param only_changed: If True, the current values of `fields` (which must not be
+        empty) are fetched from the database, and only the objects whose values
+        differ are updated and get a historical record - see ``get_changed_objs()``
+        for getting these objects
     :return: The number of model rows updated, not including any history objects
     """
     history_manager = get_history_manager_for_model(model)
     model_manager = manager or model._default_manager
     if model_manager.model is not model:
         raise AlternativeManagerError("The given manager does not belong to the model.")
+    if only_changed and not fields:
+        raise ValueError(
+            "bulk_update_with_history() with only_changed requires fields."
+        )
 
     with transaction.atomic(savepoint=False):
+        if only_changed:
+            objs = get_changed_objs(
+                objs, model, fields, batch_size=batch_size, manager=model_manager
+            )
+            if not objs:
+                return 0
         if not fields:
             # Allow not passing any fields if the user wants to bulk-create history
             # records - e.g. with `custom_historical_attrs` provided
@@ -236,6 +444,248 @@ def bulk_update_with_history(
     return rows_updated
 
 
+def get_changed_objs(objs, model, fields, batch_size=None, manager=None):
+    """
+    Return the objects among objs whose values of fields differ from the ones in the
+    database, in the same order - i.e. the objects that
+    ``bulk_update_with_history()`` updates and creates historical records for, when
+    passed ``only_changed=True``. Objects that don't exist in the database are left
+    out.
+    :param objs: List of objs of type model
+    :param model: Model class of the objects
+    :param fields: The names of the fields to compare, which must not be empty
+    :param batch_size: Number of objects whose values are fetched in each query
+    :param manager: Optional model manager to use for the model instead of the default
+        manager
+    :return: List of the changed objects
+    """
+    model_manager = manager or model._default_manager
+    if model_manager.model is not model:
+        raise AlternativeManagerError("The given manager does not belong to the model.")
+    if not fields:
+        raise ValueError("get_changed_objs() requires fields.")
+    objs = list(objs)
+    fields = [model._meta.get_field(name) for name in fields]
+    pk_attname = model._meta.pk.attname
+    current_values = {}
+    for batch in _get_batches(model, objs, [model._meta.pk], batch_size):
+        pks = [getattr(obj, pk_attname) for obj in batch]
+        for pk, *values in model_manager.filter(pk__in=pks).values_list(
+            "pk", *(field.attname for field in fields)
+        ):
+            current_values[pk] = values
+
+    def has_changed(obj):
+        values = current_values[getattr(obj, pk_attname)]
+        for field, value in zip(fields, values):
+            try:
+                new_value = field.to_python(getattr(obj, field.attname))
+            except ValidationError:
+                return True
+            if new_value != value:
+                return True
+        return False
+
+    return [
+        obj
+        for obj in objs
+        if getattr(obj, pk_attname) in current_values and has_changed(obj)
+    ]
+
+
+def update_with_history(
+    queryset,
+    *,
+    batch_size=None,
+    default_user=None,
+    default_change_reason=None,
+    default_date=None,
+    custom_historical_attrs=None,
+    **values,
+):
+    """
+    Update the objects in queryset with the given values, like ``QuerySet.update()``,
+    while also creating their history (all in one transaction). Instead of loading
+    the objects, their history is copied from the updated rows by the database, with
+    one ``INSERT ... SELECT`` query per batch - unless the historical model's
+    ``get_user`` depends on the instance and no default user is given, in which
+    case the updated objects are loaded to create their history.
+    :param queryset: QuerySet of the objects that should be updated
+    :param batch_size: Number of objects that should be updated in each batch
+    :param default_user: Optional user to specify as the history_user in each historical
+        record
+    :param default_change_reason: Optional change reason to specify as the change_reason
+        in each historical record
+    :param default_date: Optional date to specify as the history_date in each historical
+        record
+    :param custom_historical_attrs: Optional dict of field `name`:`value` to specify
+        values for custom fields
+    :param values: The new values of the fields, as passed to ``QuerySet.update()``
+    :return: The number of model rows updated, not including any history objects
+    """
+    model = queryset.model
+    history_manager = get_history_manager_for_model(model)
+    if not getattr(settings, "SIMPLE_HISTORY_ENABLED", True):
+        return queryset.update(**values)
+
+    history_model = history_manager.model
+    write_plan = history_model._history_write_plan
+    using = queryset.db
+    user_depends_on_instance = default_user is None and getattr(
+        history_model, "_history_user_depends_on_instance", True
+    )
+    # The historical records can only be copied within the same database, and if
+    # they all have the same user
+    insert_from_select = (
+        write_plan.can_insert_from_select
+        and router.db_for_write(history_model) == using
+        and not user_depends_on_instance
+    )
+    history_user = default_user
+    if history_user is None and not user_depends_on_instance:
+        history_user = history_model.get_default_history_user(None)
+    template = history_model(
+        history_date=default_date or timezone.now(),
+        history_type="~",
+        history_user=history_user,
+        history_change_reason=default_change_reason,
+        **(custom_historical_attrs or {}),
+    )
+
+    rows_updated = 0
+    with transaction.atomic(using=using, savepoint=False):
+        pks = list(queryset.order_by().values_list("pk", flat=True))
+        max_batch_size = connections[using].ops.bulk_batch_size(["pk"], pks) or 1
+        batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+        for start in range(0, len(pks), batch_size):
+            end = start + batch_size
+            batch = model._base_manager.using(using).filter(pk__in=pks[start:end])
+            rows_updated += batch.update(**values)
+            if insert_from_select:
+                write_plan.insert_from_select(batch, template, using)
+            else:
+                history_manager.bulk_history_create(
+                    batch,
+                    update=True,
+                    default_user=history_user,
+                    default_change_reason=default_change_reason,
+                    default_date=template.history_date,
+                    custom_historical_attrs=custom_historical_attrs,
+                    return_count=True,
+                )
+    return rows_updated
+
+
+def delete_with_history(
+    queryset,
+    *,
+    default_user=None,
+    default_change_reason=None,
+    default_date=None,
+    custom_historical_attrs=None,
+):
+    """
+    Delete the objects in queryset, like ``QuerySet.delete()``, while also creating
+    their history (all in one transaction). Instead of creating a historical record
+    per deleted object, the "-" records are copied from the rows about to be deleted
+    by the database, with one ``INSERT ... SELECT`` query per batch - or, with
+    ``cascade_delete_history``, the history is deleted with one query per batch.
+    This also applies to the objects of history-tracked models deleted by cascade.
+    Models with many-to-many history, and historical models with receivers of the
+    ``pre_create_historical_record`` or ``post_create_historical_record`` signals
+    get their history written for each object, as with ``QuerySet.delete()``.
+    :param queryset: QuerySet of the objects that should be deleted
+    :param default_user: Optional user to specify as the history_user in each historical
+        record
+    :param default_change_reason: Optional change reason to specify as the change_reason
+        in each historical record
+    :param default_date: Optional date to specify as the history_date in each historical
+        record
+    :param custom_historical_attrs: Optional dict of field `name`:`value` to specify
+        values for custom fields of the historical records of the queryset's model
+    :return: The same as ``QuerySet.delete()``
+    """
+    from simple_history.models import HistoricalRecords
+
+    get_history_manager_for_model(queryset.model)
+    if queryset.query.is_sliced:
+        raise TypeError("Cannot use 'limit' or 'offset' with delete_with_history().")
+    using = queryset.db
+    history_defaults = {
+        "history_date": default_date or timezone.now(),
+        "history_user": default_user,
+        "history_change_reason": default_change_reason,
+    }
+    context = HistoricalRecords.context
+    previous_bulk_history_deletes = getattr(context, "bulk_history_deletes", set())
+    with transaction.atomic(using=using, savepoint=False):
+        collector = Collector(using=using, origin=queryset)
+        collector.collect(queryset.order_by())
+        bulk_history_deletes = set()
+        if getattr(settings, "SIMPLE_HISTORY_ENABLED", True):
+            for model, instances in collector.data.items():
+                extra_attrs = history_defaults
+                if model is queryset.model:
+                    extra_attrs = {**extra_attrs, **(custom_historical_attrs or {})}
+                if _delete_history_in_bulk(model, instances, using, extra_attrs):
+                    bulk_history_deletes.add(model)
+        context.bulk_history_deletes = previous_bulk_history_deletes.union(
+            bulk_history_deletes
+        )
+        try:
+            return collector.delete()
+        finally:
+            context.bulk_history_deletes = previous_bulk_history_deletes
+
+
+def _delete_history_in_bulk(model, instances, using, extra_attrs):
+    """
+    Helper function for ``delete_with_history()``: create the "-" records of the
+    ``instances`` of ``model`` about to be deleted, or delete their history if the
+    model uses ``cascade_delete_history``. Returns ``False`` if this has to be done
+    by the receivers of the delete signals instead.
+    """
+    try:
+        history_manager = get_history_manager_for_model(model)
+    except NotHistoricalModelError:
+        return False
+    history_model = history_manager.model
+    pk_attname = model._meta.pk.attname
+    pks = [instance.pk for instance in instances]
+    batch_size = connections[using].ops.bulk_batch_size([pk_attname], pks) or 1
+    if history_model._history_cascade_delete:
+        history_queryset = history_model._default_manager.using(using)
+        for start in range(0, len(pks), batch_size):
+            end = start + batch_size
+            history_queryset.filter(**{f"{pk_attname}__in": pks[start:end]}).delete()
+            history_model._history_write_plan.refresh_latest_records(
+                using, pks=pks[start:end]
+            )
+        return True
+
+    write_plan = history_model._history_write_plan
+    user_depends_on_instance = extra_attrs.get("history_user") is None and getattr(
+        history_model, "_history_user_depends_on_instance", True
+    )
+    if (
+        not write_plan.can_insert_from_select
+        or write_plan.m2m_fields
+        or user_depends_on_instance
+        or router.db_for_write(history_model) != using
+        or pre_create_historical_record.has_listeners(history_model)
+        or post_create_historical_record.has_listeners(history_model)
+    ):
+        return False
+    template = history_model(history_type="-", **extra_attrs)
+    if extra_attrs.get("history_user") is None:
+        template.history_user = history_model.get_default_history_user(None)
+    for start in range(0, len(pks), batch_size):
+        end = start + batch_size
+        batch = model._base_manager.using(using).filter(pk__in=pks[start:end])
+        write_plan.insert_from_select(batch, template, using)
+    return True
+
+
 def get_change_reason_from_object(obj):
     if hasattr(obj, "_change_reason"):
         return getattr(obj, "_change_reason")
@@ -0,0 +1,296 @@
+import atexit
+import importlib
+import logging
+import queue
+import threading
+from abc import ABC, abstractmethod
+from functools import partial
+
+from django.apps import apps
+from django.db import close_old_connections, models, router, transaction
+
+from .models import insert_historical_records, write_pending_records
+from .signals import post_create_historical_record
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryWriter(ABC):
+    """
+    Base class for the writers passed as the ``history_writer`` option of
+    ``HistoricalRecords``, which take over inserting the historical records
+    created for the tracked model.
+    """
+
+    def contribute_to_history_model(self, history_model):
+        """Called once the historical model of a tracked model has been created."""
+
+    @abstractmethod
+    def write(self, entry):
+        """
+        Insert - or arrange for the insertion of - the historical record of
+        ``entry`` (a ``PendingHistoricalRecord``).
+        """
+
+    @abstractmethod
+    def drain(self):
+        """Insert all the historical records that have not been inserted yet."""
+
+
+class QueueHistoryWriter(HistoryWriter):
+    """
+    Inserts historical records from background threads.
+
+    Records are put in one of ``workers`` bounded queues once the transaction
+    that created them commits; all the records of an object go to the same queue,
+    so they're inserted in the order they were created. Each queue is drained in
+    batches of up to ``batch_size`` records by its own worker thread, which is
+    started when the first record is put in the queue - unless ``start_workers``
+    is false, in which case the records are only inserted by ``drain()``.
+
+    Saving an object blocks while its queue holds ``maxsize`` records. Records
+    still in the queues are lost if the process is killed. ``stop()`` inserts them
+    and stops the worker threads.
+    """
+
+    def __init__(self, maxsize=1000, workers=1, batch_size=100, start_workers=True):
+        self.batch_size = batch_size
+        self.start_workers = start_workers
+        self.queues = [queue.Queue(maxsize) for _ in range(workers)]
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def write(self, entry):
+        instance = entry.instance
+        using = instance._state.db or router.db_for_write(
+            type(instance), instance=instance
+        )
+        transaction.on_commit(partial(self.put, entry), using=using)
+
+    def put(self, entry):
+        """Put ``entry`` in its queue, without waiting for a transaction commit."""
+        key = (type(entry.history_instance), entry.instance.pk)
+        entry_queue = self.queues[hash(key) % len(self.queues)]
+        if self.start_workers and not self._threads:
+            self._start()
+        entry_queue.put(entry)
+
+    def drain(self):
+        if self._threads:
+            for entry_queue in self.queues:
+                entry_queue.join()
+            return
+        for entry_queue in self.queues:
+            while entries := self._get_batch(entry_queue, block=False):
+                self._write(entry_queue, entries)
+
+    def stop(self):
+        """
+        Insert the queued records, then stop the worker threads and wait for them
+        to exit. They're started again when another record is put in a queue.
+        """
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            self.drain()
+            return
+        for entry_queue in self.queues:
+            # Tells the worker to exit once it has inserted the records before it
+            entry_queue.put(None)
+        for thread in threads:
+            thread.join()
+        atexit.unregister(self.drain)
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for entry_queue in self.queues:
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(entry_queue,),
+                    name="simple-history-writer",
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            atexit.register(self.drain)
+
+    def _work(self, entry_queue):
+        while True:
+            entries = self._get_batch(entry_queue, block=True)
+            stopped = bool(entries) and entries[-1] is None
+            if stopped:
+                entries.pop()
+                entry_queue.task_done()
+            if entries:
+                self._write(entry_queue, entries)
+            close_old_connections()
+            if stopped:
+                return
+
+    def _get_batch(self, entry_queue, block):
+        """
+        Return up to ``batch_size`` entries from ``entry_queue``, ending with the
+        ``None`` put by ``stop()`` if it was reached.
+        """
+        entries = []
+        try:
+            if block:
+                entries.append(entry_queue.get())
+            while len(entries) < self.batch_size and (
+                not entries or entries[-1] is not None
+            ):
+                entries.append(entry_queue.get_nowait())
+        except queue.Empty:
+            pass
+        return entries
+
+    def _write(self, entry_queue, entries):
+        try:
+            write_pending_records(entries)
+        except Exception:
+            logger.exception("Failed to insert %d historical records", len(entries))
+        finally:
+            for _ in entries:
+                entry_queue.task_done()
+
+
+class OutboxHistoryWriter(HistoryWriter):
+    """
+    Inserts historical records into an outbox table - a copy of the historical
+    model's table without indexes or constraints - as part of the transaction
+    that created them. The records are moved to the historical model's table by
+    ``process_outbox()``, e.g. by running the ``process_history_outbox``
+    management command.
+    """
+
+    def __init__(self):
+        self.outbox_models = {}
+
+    def contribute_to_history_model(self, history_model):
+        outbox_model = create_outbox_model(history_model)
+        module = importlib.import_module(history_model.__module__)
+        setattr(module, outbox_model.__name__, outbox_model)
+        self.outbox_models[history_model] = outbox_model
+
+    def write(self, entry):
+        history_instance = entry.history_instance
+        outbox_model = self.outbox_models[type(history_instance)]
+        outbox_instance = outbox_model(
+            **{
+                attname: getattr(history_instance, attname)
+                for attname in outbox_model.history_attnames
+            }
+        )
+        outbox_instance.save(using=entry.signal_kwargs["using"])
+
+    def drain(self):
+        for outbox_model in self.outbox_models.values():
+            process_outbox(outbox_model)
+
+
+class HistoryOutbox(models.Model):
+    """Base class of the outbox models created by ``OutboxHistoryWriter``."""
+
+    outbox_id = models.BigAutoField(primary_key=True)
+
+    history_model = None
+    history_attnames = ()
+
+    class Meta:
+        abstract = True
+
+
+def create_outbox_model(history_model):
+    """
+    Create the outbox model of ``history_model``, with the same fields except for
+    the primary key.
+    """
+    attrs = {
+        "__module__": history_model.__module__,
+        "history_model": history_model,
+        "history_attnames": [],
+        "Meta": type(
+            "Meta",
+            (),
+            {
+                "app_label": history_model._meta.app_label,
+                "ordering": ("outbox_id",),
+                "verbose_name": f"{history_model._meta.verbose_name} outbox",
+            },
+        ),
+    }
+    for field in history_model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        if field.is_relation:
+            # Swappable models can't be looked up before the app registry is ready
+            old_swappable, field.swappable = field.swappable, False
+            try:
+                name, path, args, kwargs = field.deconstruct()
+            finally:
+                field.swappable = old_swappable
+        else:
+            name, path, args, kwargs = field.deconstruct()
+        kwargs.update(unique=False, db_index=False)
+        if field.is_relation:
+            kwargs.update(
+                db_constraint=False, on_delete=models.DO_NOTHING, related_name="+"
+            )
+        attrs[name] = type(field)(*args, **kwargs)
+        attrs["history_attnames"].append(field.attname)
+    return type(f"{history_model.__name__}Outbox", (HistoryOutbox,), attrs)
+
+
+def get_outbox_models():
+    """Return the outbox models of all the installed apps."""
+    return [model for model in apps.get_models() if issubclass(model, HistoryOutbox)]
+
+
+def process_outbox(outbox_model, batch_size=100, using=None):
+    """
+    Move the records of ``outbox_model`` to its historical model, in the order they
+    were written, with one ``bulk_create()`` per batch of ``batch_size`` records.
+    Return the number of records moved.
+
+    The ``instance`` sent with ``post_create_historical_record`` is rebuilt from the
+    historical record (``history_instance.instance``), as the saved object isn't
+    available anymore; it only has the values of the history-tracked fields.
+    """
+    using = using or router.db_for_write(outbox_model)
+    history_model = outbox_model.history_model
+    outbox_manager = outbox_model._default_manager.using(using)
+    count = 0
+    while True:
+        with transaction.atomic(using=using):
+            outbox_instances = list(
+                outbox_manager.select_for_update().order_by("outbox_id")[:batch_size]
+            )
+            history_instances = [
+                history_model(
+                    **{
+                        attname: getattr(outbox_instance, attname)
+                        for attname in outbox_model.history_attnames
+                    }
+                )
+                for outbox_instance in outbox_instances
+            ]
+            insert_historical_records(history_model, history_instances, using)
+            outbox_manager.filter(
+                outbox_id__in=[instance.outbox_id for instance in outbox_instances]
+            ).delete()
+        if post_create_historical_record.has_listeners(history_model):
+            for history_instance in history_instances:
+                post_create_historical_record.send(
+                    sender=history_model,
+                    instance=history_instance.instance,
+                    history_instance=history_instance,
+                    history_date=history_instance.history_date,
+                    history_user=history_instance.history_user,
+                    history_change_reason=history_instance.history_change_reason,
+                    using=using,
+                )
+        count += len(history_instances)
+        if len(history_instances) < batch_size:
+            return count